@@ -0,0 +1,63 @@
+# async_db_manager.py
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import functools
+
+from config import DB_POOL_MAX_SIZE
+from db_manager import get_shared_db
+
+
+class AsyncDBManager:
+    """
+    DBManager の公開メソッドをコルーチンとして呼べるようにする asyncio 用のフロントエンド。
+    例: rows = await adb.get_ranking()
+
+    - 同期ドライバ(psycopg2/sqlite3)の呼び出しは専用のスレッドプールで実行する
+    - 1回の呼び出しごとにプールからコネクションを借りて返すので、複数セッションのDB I/Oが並行に進む
+    - 複数の書き込みを1トランザクションにしたい場合は run_in_transaction() を使う
+    """
+
+    def __init__(self, db=None, max_workers=DB_POOL_MAX_SIZE):
+        self.db = db if db is not None else get_shared_db()
+        # プールの上限を超えるスレッドを作っても、コネクション待ちになるだけなので揃えておく
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db")
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        method = getattr(self.db, name)
+        if not callable(method):
+            raise AttributeError(name)
+
+        @functools.wraps(method)
+        async def call(*args, **kwargs):
+            return await self.run(method, *args, **kwargs)
+
+        return call
+
+    async def run(self, fn, *args, **kwargs):
+        """任意の同期関数をDB用スレッドで実行する（終わったらコネクションを返却）。"""
+        def work():
+            with self.db.connection_scope():
+                return fn(*args, **kwargs)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, work)
+
+    async def run_in_transaction(self, fn, *args, **kwargs):
+        """fn(db, *args) を1つのスレッド上で db.transaction() の中で実行する。"""
+        def work():
+            with self.db.transaction():
+                return fn(self.db, *args, **kwargs)
+
+        return await self.run(work)
+
+    async def close(self):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, functools.partial(self._executor.shutdown, wait=True))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
@@ -0,0 +1,205 @@
+# battle_state.py
+import random
+
+from config import PVP_FLUSH_INTERVAL
+
+_STEALTH = "隠密"
+
+
+class BattleState:
+    """
+    PvP 1試合分の参加者の状態（HP/MP/状態異常）をメモリ上で保持する。
+    - 試合開始時に1回だけ読み込み、ターン中はメモリ上で更新する
+    - 変更のあった参加者だけを flush() でまとめて players へ書き戻す
+    - flush_interval > 0 なら、その行動数ごとにも書き戻す（強制終了対策）
+    """
+
+    def __init__(self, db, participants, flush_interval=PVP_FLUSH_INTERVAL):
+        self.db = db
+        self.flush_interval = flush_interval
+        self._rows = {}
+        # row: id, name, hp, agility, status_effect, status_turn, exp, mp, score, bounty
+        for p in participants:
+            self._rows[p[0]] = {'name': p[1], 'hp': p[2], 'mp': p[7], 'effect': p[4], 'turn': p[5]}
+        self._dirty = set()
+        self._actions_since_flush = 0
+
+    def status(self, pid):
+        row = self._rows.get(pid)
+        if row is None:
+            return (0, None, 0)
+        return (row['hp'], row['effect'], row['turn'])
+
+    def mp(self, pid):
+        row = self._rows.get(pid)
+        return row['mp'] if row else 0
+
+    def name(self, pid):
+        row = self._rows.get(pid)
+        return row['name'] if row else "?"
+
+    def set_status(self, pid, hp, eff, turn):
+        row = self._rows[pid]
+        row['hp'], row['effect'], row['turn'] = hp, eff, turn
+        self._dirty.add(pid)
+
+    def damage(self, pid, dmg):
+        self._rows[pid]['hp'] -= dmg
+        self._dirty.add(pid)
+
+    def set_effect(self, pid, eff, turn):
+        row = self._rows[pid]
+        row['effect'], row['turn'] = eff, turn
+        self._dirty.add(pid)
+
+    def set_mp(self, pid, mp):
+        self._rows[pid]['mp'] = mp
+        self._dirty.add(pid)
+
+    def snapshot(self):
+        """player_id -> (hp, mp, 状態異常, 残りターン)。CPUの探索用。"""
+        return {pid: (row['hp'], row['mp'], row['effect'], row['turn']) for pid, row in self._rows.items()}
+
+    def living_count(self):
+        return sum(1 for row in self._rows.values() if row['hp'] > 0)
+
+    def enemies(self, my_id, allow_stealth=False):
+        """DBManager.get_enemies_list と同じ形式で、攻撃できる相手を返す。"""
+        result = []
+        for pid, row in self._rows.items():
+            if pid == my_id or row['hp'] <= 0:
+                continue
+            if not allow_stealth and row['effect'] == _STEALTH:
+                continue
+            result.append({'id': pid, 'name': row['name'], 'hp': row['hp'], 'effect': row['effect']})
+        return result
+
+    def apply_area_damage(self, attacker_id, damage, defense_map=None, effect=None):
+        """
+        DBManager.apply_area_damage と同じ全体攻撃を、メモリ上でまとめて反映する。
+        [(player_id, 名前, 受けたダメージ, 残りHP)] を enemies() の順で返す。
+        """
+        if damage <= 0:
+            return []
+        defense_map = defense_map or {}
+        hits = []
+        for enemy in self.enemies(attacker_id):
+            pid = enemy['id']
+            dealt = max(1, damage - defense_map.get(pid, 0))
+            self.damage(pid, dealt)
+            if effect:
+                self.set_effect(pid, effect[0], effect[1])
+            hits.append((pid, enemy['name'], dealt, self._rows[pid]['hp']))
+        return hits
+
+    def end_action(self):
+        self._actions_since_flush += 1
+        if self.flush_interval and self._actions_since_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self._actions_since_flush = 0
+        if not self._dirty:
+            return
+        rows = []
+        for pid in self._dirty:
+            row = self._rows[pid]
+            rows.append((row['hp'], row['mp'], row['effect'], row['turn'], pid))
+        self.db.update_players_battle_state(rows)
+        self._dirty.clear()
+
+
+class RoyaleState(BattleState):
+    """
+    参加者が多い試合（バトルロイヤル）用の BattleState。
+    - 生存者の集合と、狙える相手（生存していて隠密でない）の索引を、HP/状態異常の更新のたびに差分で保つ
+    - living_count() / random_target() は参加者数によらず O(1)
+    - 倒れた参加者は倒れた時点で記録し、pop_fallen() で倒れた順に受け取る（毎行動の全員確認が要らない）
+    """
+
+    def __init__(self, db, participants, flush_interval=PVP_FLUSH_INTERVAL):
+        super().__init__(db, participants, flush_interval)
+        self._alive = set()
+        self._targets = []  # 狙える参加者（順序は不定。削除は末尾と入れ替える）
+        self._target_pos = {}  # player_id -> self._targets での位置
+        self._fallen = []
+        for pid, row in self._rows.items():
+            if row['hp'] > 0:
+                self._alive.add(pid)
+                if row['effect'] != _STEALTH:
+                    self._add_target(pid)
+            else:
+                # 開始時点で倒れている参加者は最下位側に並べる
+                self._fallen.append(pid)
+
+    def _add_target(self, pid):
+        self._target_pos[pid] = len(self._targets)
+        self._targets.append(pid)
+
+    def _remove_target(self, pid):
+        i = self._target_pos.pop(pid)
+        last = self._targets.pop()
+        if last != pid:
+            self._targets[i] = last
+            self._target_pos[last] = i
+
+    def _sync(self, pid):
+        row = self._rows[pid]
+        alive = row['hp'] > 0
+        if alive != (pid in self._alive):
+            if alive:
+                self._alive.add(pid)
+            else:
+                self._alive.discard(pid)
+                self._fallen.append(pid)
+        targetable = alive and row['effect'] != _STEALTH
+        if targetable != (pid in self._target_pos):
+            if targetable:
+                self._add_target(pid)
+            else:
+                self._remove_target(pid)
+
+    def set_status(self, pid, hp, eff, turn):
+        super().set_status(pid, hp, eff, turn)
+        self._sync(pid)
+
+    def damage(self, pid, dmg):
+        super().damage(pid, dmg)
+        self._sync(pid)
+
+    def set_effect(self, pid, eff, turn):
+        super().set_effect(pid, eff, turn)
+        self._sync(pid)
+
+    def is_alive(self, pid):
+        return pid in self._alive
+
+    def living_count(self):
+        return len(self._alive)
+
+    def pop_fallen(self):
+        """前回呼んでから倒れた参加者を、倒れた順に返す。"""
+        fallen, self._fallen = self._fallen, []
+        return fallen
+
+    def random_target(self, my_id, rng=random):
+        """自分以外の狙える相手から1人を選ぶ（いなければ None）。"""
+        n = len(self._targets)
+        me = self._target_pos.get(my_id)
+        if n - (me is not None) <= 0:
+            return None
+        if me is None:
+            return self._targets[rng.randrange(n)]
+        # 自分を除いた n-1 人から選ぶ
+        i = rng.randrange(n - 1)
+        return self._targets[i + 1 if i >= me else i]
+
+    def enemies(self, my_id, allow_stealth=False):
+        if allow_stealth:
+            return super().enemies(my_id, allow_stealth)
+        # 索引にある相手だけを見る（倒れた参加者は走査しない）
+        rows = self._rows
+        return [
+            {'id': pid, 'name': rows[pid]['name'], 'hp': rows[pid]['hp'], 'effect': rows[pid]['effect']}
+            for pid in self._targets if pid != my_id
+        ]
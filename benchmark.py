@@ -0,0 +1,203 @@
+# benchmark.py
+"""
+DBManager の各メソッドと、PvE/PvP の1戦・ゲームデータ初期化の所要時間を計測する。
+- sqlite は一時ディレクトリの専用ファイル、postgres は専用セッション（bench）を使い、遊んでいるデータには触れない
+- postgres に繋がらなければ、その分は飛ばす
+- --save-baseline で結果（中央値）をJSONに保存し、次回からはそれと比べて閾値を超えて遅くなった項目を報告する
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+from psycopg2 import OperationalError
+
+from config import LEVEL_UP_EXP, PVE_DROP_RARITY_WEIGHTS
+from db_manager import DBManager
+from db_pool import create_pool
+from models import Player
+from pve_system import PvESystem
+from pvp_system import PvPSystem
+from utils import ScriptedInput, set_input_provider
+
+CPU_NAMES = ["Player2", "Player3", "Player4"]
+# 実行したディレクトリに依らず、このファイルの隣に置く（.gitignore 済み）
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+
+
+def _open_db(backend, db_dir):
+    if backend == "sqlite":
+        return DBManager(pool=create_pool("sqlite", sqlite_path=os.path.join(db_dir, "bench.sqlite3")))
+    return DBManager(pool=create_pool("postgres"), session_id="bench")
+
+
+def _new_game(db):
+    """初期化したDBに Hero と CPU 3人を作り、Hero の Player を返す。"""
+    db.reset_all_game_data()
+    player = Player(db.get_or_create_player("Hero"))
+    db.ensure_cpu_players(CPU_NAMES)
+    return player
+
+
+def _summary(samples):
+    samples = sorted(samples)
+    return {
+        "median": statistics.median(samples),
+        "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        "n": len(samples),
+    }
+
+
+def _time_calls(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return _summary(samples)
+
+
+def bench_methods(db, repeat):
+    """DBManager の主なメソッドを、ゲーム中と同じ引数で repeat 回ずつ呼ぶ。"""
+    player = _new_game(db)
+    pid = player.id
+    bless_id = db.get_item_id_by_name("神の加護")
+
+    def add_and_consume():
+        with db.transaction():
+            db.add_item(pid, bless_id)
+            db.consume_item(pid, bless_id)
+
+    calls = {
+        "get_ranking": db.get_ranking,
+        "get_dense_ranking": db.get_dense_ranking,
+        "get_player_skills": lambda: db.get_player_skills(pid),
+        "get_learnable_skills": lambda: db.get_learnable_skills(pid),
+        "get_player_items": lambda: db.get_player_items(pid, "pvp_"),
+        "has_item_effect": lambda: db.has_item_effect(pid, "bless_regen"),
+        "add_item+consume_item": add_and_consume,
+        "get_items_by_type": lambda: db.get_items_by_type("pve_"),
+        "get_loot_table+draw": lambda: db.get_loot_table("pvp_", PVE_DROP_RARITY_WEIGHTS).draw(),
+        "get_pvp_participants_raw": db.get_pvp_participants_raw,
+        "get_player_status_row": lambda: db.get_player_status_row(pid),
+        "get_enemies_list": lambda: db.get_enemies_list(pid),
+        "update_player_status": lambda: db.update_player_status(pid, player.hp, player.mp, player.exp),
+        "log_pve": lambda: db.log_pve(pid, "スライム", True),
+        "full_recover_all_players": lambda: db.full_recover_all_players(LEVEL_UP_EXP),
+    }
+    return {f"db.{name}": _time_calls(fn, repeat) for name, fn in calls.items()}
+
+
+def _random_policy(rng):
+    return lambda prompt: str(rng.randint(0, 4))
+
+
+def bench_battles(db, repeat, seed):
+    """PvE 1戦（start_farm）と PvP 1試合（start_match）を、毎回初期化したDBで乱数入力により行う。"""
+    farm, match, reset = [], [], []
+    for i in range(repeat):
+        player = _new_game(db)
+        random.seed(seed + i)
+        set_input_provider(ScriptedInput(policy=_random_policy(random.Random(seed + i))))
+        start = time.perf_counter()
+        PvESystem(player, db).start_farm()
+        farm.append(time.perf_counter() - start)
+
+        # PvE で倒れていても PvP に参加できるよう、ゲームと同じく全回復してから始める
+        db.full_recover_all_players(LEVEL_UP_EXP)
+        player = Player(db.get_or_create_player("Hero"))
+        start = time.perf_counter()
+        PvPSystem(player, db, cpu_time_budget=None).start_match(1)
+        match.append(time.perf_counter() - start)
+
+        # ログや結果が溜まった状態からの初期化
+        start = time.perf_counter()
+        db.reset_all_game_data()
+        reset.append(time.perf_counter() - start)
+    set_input_provider(None)
+    return {
+        "pve.start_farm": _summary(farm),
+        "pvp.start_match": _summary(match),
+        "db.reset_all_game_data": _summary(reset),
+    }
+
+
+def run_backend(backend, repeat, battles, seed):
+    db_dir = tempfile.mkdtemp(prefix="bench_")
+    try:
+        try:
+            db = _open_db(backend, db_dir)
+        except OperationalError as e:
+            print(f"⚠️ {backend} に接続できないため飛ばします: {e}".strip())
+            return {}
+        with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+            results = bench_methods(db, repeat)
+            results.update(bench_battles(db, battles, seed))
+            db.reset_all_game_data()
+        db.pool.close_idle()
+        return {f"{backend}:{name}": r for name, r in results.items()}
+    finally:
+        shutil.rmtree(db_dir, ignore_errors=True)
+
+
+def report(results, baseline, threshold):
+    """結果を表で表示し、基準より threshold 以上遅くなった項目の数を返す。"""
+    regressions = 0
+    print(f"\n{'項目':<44} {'中央値(ms)':>11} {'p95(ms)':>10} {'基準(ms)':>10} {'比':>7}")
+    for name, r in results.items():
+        base = baseline.get(name)
+        line = f"{name:<44} {r['median'] * 1000:>11.3f} {r['p95'] * 1000:>10.3f}"
+        if base:
+            ratio = r["median"] / base
+            mark = ""
+            if ratio > 1 + threshold:
+                mark = " ❌ 遅くなった"
+                regressions += 1
+            elif ratio < 1 - threshold:
+                mark = " ✅ 速くなった"
+            line += f" {base * 1000:>10.3f} {ratio:>6.2f}x{mark}"
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DBManager と戦闘処理の所要時間を計測します")
+    parser.add_argument("--backends", nargs="+", choices=["sqlite", "postgres"], default=["sqlite", "postgres"],
+                        help="計測するDB（postgres は繋がらなければ飛ばす）")
+    parser.add_argument("--repeat", type=int, default=200, help="DBManager の各メソッドを呼ぶ回数")
+    parser.add_argument("--battles", type=int, default=10, help="PvE/PvP/初期化を計測する回数")
+    parser.add_argument("--seed", type=int, default=0, help="戦闘の乱数のシード（以降は+1ずつ）")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="比較する基準のJSONファイル")
+    parser.add_argument("--save-baseline", action="store_true", help="今回の結果を基準として保存する")
+    parser.add_argument("--threshold", type=float, default=0.25, help="遅くなったと判定する割合（0.25 = 25%%）")
+    args = parser.parse_args()
+
+    results = {}
+    for backend in args.backends:
+        print(f"⏱️ {backend} を計測中...")
+        results.update(run_backend(backend, args.repeat, args.battles, args.seed))
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    regressions = report(results, baseline, args.threshold)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({name: r["median"] for name, r in results.items()}, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 基準を {args.baseline} に保存しました")
+    elif regressions:
+        print(f"\n⚠️ {regressions} 項目が基準より {args.threshold:.0%} 以上遅くなりました")
+        raise SystemExit(1)
+    elif baseline:
+        print(f"\n✅ 基準より {args.threshold:.0%} 以上遅くなった項目はありません")
+
+
+if __name__ == "__main__":
+    main()
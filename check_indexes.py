@@ -0,0 +1,38 @@
+# check_indexes.py
+import sys
+from db_manager import DBManager
+
+# (説明, SQL, パラメータ, 使われるべきインデックス)
+CHECKS = [
+    ("get_ranking の並び替え", "SELECT player_id, player_name, score FROM players WHERE session_id = %s ORDER BY score DESC", ("",), "idx_players_session_score"),
+    ("プレイヤー名での引き当て", "SELECT player_id FROM players WHERE session_id = %s AND player_name = %s", ("", "Hero"), "idx_players_session_name"),
+    ("セッションの対戦履歴", "SELECT battle_id FROM pvp_battles WHERE session_id = %s", ("",), "idx_pvp_battles_session"),
+    ("effect_type の完全一致", "SELECT item_id FROM items WHERE effect_type = %s", ("bless_regen",), "idx_items_effect_type"),
+    ("effect_type の前方一致", "SELECT item_id, item_name, rarity FROM items WHERE effect_type LIKE %s", ("pvp_%",), "idx_items_effect_type_prefix"),
+    ("アイテム名での引き当て", "SELECT item_id FROM items WHERE item_name = %s LIMIT 1", ("神の加護",), "idx_items_item_name"),
+    ("モンスター名での引き当て", "SELECT monster_id FROM monsters WHERE monster_name = %s LIMIT 1", ("スライム",), "idx_monsters_monster_name"),
+    ("PvE履歴（プレイヤー別）", "SELECT COUNT(*) FROM pve_logs WHERE player_id = %s", (1,), "idx_pve_logs_player_id"),
+    ("PvP結果（プレイヤー別）", "SELECT SUM(point) FROM pvp_results WHERE player_id = %s", (1,), "idx_pvp_results_player_id"),
+]
+
+
+def main():
+    db = DBManager()
+    print(f"バックエンド: {db.backend}")
+    failed = 0
+    for label, sql, params, index_name in CHECKS:
+        plan = db.explain(sql, params)
+        ok = any(index_name in line for line in plan)
+        print(f"{'✅' if ok else '❌'} {label}: {index_name}")
+        if not ok:
+            failed += 1
+            for line in plan:
+                print(f"    {line}")
+    if failed:
+        print(f"\n⚠️ {failed} 件のクエリでインデックスが使われていません")
+        sys.exit(1)
+    print("\n✅ すべてのクエリでインデックスが使われています")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,5 +7,45 @@ DB_CONFIG = {
     'port': '5432'
 }
 
+# 'auto': PostgreSQLを試し、繋がらなければSQLite / 'postgres' / 'sqlite' / 'memory'（全テーブルをメモリ上で持つ）
+DB_BACKEND = 'auto'
+
 GAME_LOOP_COUNT = 3
-LEVEL_UP_EXP = 100
\ No newline at end of file
+LEVEL_UP_EXP = 100
+BASE_HP = 100  # 最大HP = BASE_HP + レベル * HP_PER_LEVEL
+HP_PER_LEVEL = 10
+BASE_MP = 50  # 全回復した時のMP
+PVE_DROP_RARITY_WEIGHTS = (60, 30, 9, 1)  # PvEのドロップ（PvP用アイテム）のレア度ごとの重み: ★1, ★2, ★3, ★4以上
+LOSER_GIFT_RARITY_WEIGHTS = (60, 30, 10)  # 敗者救済の支援物資（PvE用アイテム）の重み: ★1, ★2, ★3以上
+PVP_FLUSH_INTERVAL = 0  # PvP中にDBへ書き戻す行動数の間隔（0ならターン終了時のみ）
+PVP_ROYALE_THRESHOLD = 8  # 参加者がこれより多いPvPは大人数向け（バトルロイヤル）の処理で行う。CPUは探索せず、狙える相手からランダムに選んで最も威力の高い技で攻撃する
+PVP_CPU_CONTROL = True  # PvPで自分以外の参加者をCPU（先読み探索）が操作する。False なら全員を手動で操作する（Hotseat）
+PVP_CPU_NODE_BUDGET = 300  # CPUが1手に展開する局面数の上限（約5ミリ秒。反復深化はここで打ち切る）。局面数で決めるので、同じシードなら環境に依らず同じ結果になる
+PVP_CPU_MAX_DEPTH = 8  # CPUが先読みする行動数の上限
+PVP_CPU_TIME_BUDGET = 0.005  # 対話プレイ(main.py)でだけ使う、CPUが1手に使う探索時間の上限（秒）。シミュレーション/ベンチマークでは使わない
+PVE_HINT_MAX_STATES = 3000  # PvEのおすすめ行動を出すために1ターンで新しく解く状態数の上限（約0.1秒）。解ききれないターンはおすすめを出さない
+PVE_JOURNAL_FLUSH_EVERY = 20  # PvEの被弾記録をDBへまとめて書き戻す件数（戦闘終了時には必ず書き戻す）
+DB_QUERY_PROFILE = False  # 発行したSQLを記録し、ゲーム終了時にフェーズ別の集計と1ターン内の重複（N+1の疑い）を表示する
+TRACE_DIR = None  # ディレクトリを指定すると、1ゲームごとの処理時間の内訳を Chrome の trace-event 形式(JSON)で書き出す（chrome://tracing や Perfetto で開く）
+# ゲームデータの初期化を、初期状態のスナップショットの復元で行うバックエンド（SQLite: 「DBファイル名.clean」をコピーして戻す）
+# 'postgres' を加えると「DB名_clean」テンプレートDBから作り直す。CREATEDB 権限が必要で、他のセッションが繋がっていると使えず、
+# DB単位の権限・所有者やゲーム以外のテーブル/行も初期化のたびに消える（テンプレートDBも残る）ので、専用DBの時だけにする
+DB_RESET_FROM_SNAPSHOT = ('sqlite',)
+
+# コネクションプール
+DB_POOL_MAX_SIZE = 8  # 同時に貸し出すコネクションの上限
+DB_POOL_TIMEOUT = 10.0  # 空きコネクション待ちの上限（秒）
+DB_POOL_HEALTH_CHECK_INTERVAL = 30.0  # これ以上放置されたコネクションは貸出前に死活確認（秒）
+
+# SQLite（PostgreSQLに繋がらない時のフォールバック）の性能設定。接続ごとに PRAGMA として適用する
+# - WAL: 書き込み中でも他のコネクション（ランキング表示など）が待たされずに読める
+# - synchronous=NORMAL: WALではコミットごとのfsyncを省いても破損しない（電源断時に直近のコミットが失われうる）
+# 空の dict にすると SQLite の既定値のまま動かす
+SQLITE_PROFILE = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,  # バイト
+    'cache_size': -64000,  # 負の値はKiB単位（約64MB）
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000,  # 他の書き込みのロック解除を待つ時間（ミリ秒）
+}
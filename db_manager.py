@@ -1,53 +1,170 @@
 # db_manager.py
 from __future__ import annotations
 
+import glob
 from pathlib import Path
+import random
+import re
 import sqlite3
+import threading
+import weakref
 from contextlib import contextmanager
 
-import psycopg2
-from psycopg2 import OperationalError
+from psycopg2.extras import execute_values
+
+from config import BASE_HP, BASE_MP, DB_BACKEND, DB_RESET_FROM_SNAPSHOT, HP_PER_LEVEL
+from db_pool import create_pool, get_shared_pool
+from db_snapshot import capture_clean_snapshot, restore_clean_snapshot
+from journal import get_journal
+from leaderboard import Leaderboard
+from master_data import MasterData
+from memory_db import MemoryDBManager
+from migrations import migrate
+import query_profiler
+import tracing
+
+_SESSION_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+# UPDATE ... RETURNING は SQLite 3.35 から使える
+_SQLITE_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+
+def check_session_id(session_id):
+    """セッションIDは英数字・'_'・'-' の64文字以内（ジャーナルのファイル名にも使う）。"""
+    if session_id is not None and not _SESSION_ID_PATTERN.fullmatch(session_id):
+        raise ValueError(f"セッションIDに使えない文字が含まれています: {session_id!r}")
+    return session_id
+
+
+class _Lease:
+    """
+    スレッドが借りているコネクション。threading.local に入れておき、
+    connection_scope を使わずにスレッドが終わった時も（スレッドの local と一緒に捨てられた時点で）プールへ返す。
+    """
+    __slots__ = ("conn", "_finalizer", "__weakref__")
+
+    def __init__(self, pool, conn):
+        self.conn = conn
+        self._finalizer = weakref.finalize(self, pool.release, conn)
+
+    def release(self):
+        # 返却は1回だけ（finalize は2回目以降の呼び出しを無視する）
+        self._finalizer()
 
-from config import DB_CONFIG
 
 class DBManager:
-    def __init__(self):
-        self.conn = None
-        self.backend = None  # 'postgres' | 'sqlite'
+    def __init__(self, pool=None, session_id=None):
+        # コネクションはプールから借りる（スレッドごとに1本、返却するまで保持）
+        self.pool = pool if pool is not None else get_shared_pool()
+        self.backend = self.pool.backend  # 'postgres' | 'sqlite'
+        # セッション: 同じDBで並行する別々のゲーム。players / pvp_battles を session_id で分けて扱う
+        # None は従来どおりDB全体を1ゲームとして使う（初期化もDB全体。プレイヤーは session_id='' に入る）
+        self.session_id = check_session_id(session_id)
+        self._session = session_id or ''
+        # 同じスレッド・同じプールなら、セッションの違う DBManager も1本のコネクション（と transaction()）を共有する
+        self._local = self.pool.thread_local
+        self._master = None  # MasterData（マスタを書き換えたら None に戻して読み直す）
+        self._leaderboard = None  # Leaderboard（初回参照時に読み込み、以降はスコア更新のたびに反映）
         self._init_db()
+        self.journal = get_journal(self._journal_path())
+        self._replay_journal()
 
     def get_connection(self):
-        if self.conn is None or getattr(self.conn, "closed", False):
-            # まずPostgreSQLを試し、ダメならSQLiteで“このエディタだけで”動かす
-            try:
-                self.conn = psycopg2.connect(**DB_CONFIG)
-                self.backend = "postgres"
-            except OperationalError:
-                base_dir = Path(__file__).resolve().parent
-                db_path = base_dir / "game.sqlite3"
-                self.conn = sqlite3.connect(db_path)
-                self.backend = "sqlite"
-                try:
-                    self.conn.execute("PRAGMA foreign_keys = ON")
-                except Exception:
-                    pass
-        return self.conn
+        lease = getattr(self._local, "lease", None)
+        if lease is None:
+            lease = _Lease(self.pool, self.pool.acquire())
+            self._local.lease = lease
+        return lease.conn
+
+    def release_connection(self):
+        """
+        このスレッドが借りているコネクションをプールへ返却する（同じプールを使う他の DBManager の分も同じ1本）。
+        transaction() の途中なら、未確定の変更を捨てないように返却しない。
+        """
+        if getattr(self._local, "tx_depth", 0) > 0:
+            return
+        lease = getattr(self._local, "lease", None)
+        if lease is not None:
+            self._local.lease = None
+            lease.release()
+
+    @contextmanager
+    def connection_scope(self):
+        """ワーカースレッド用: ブロックを抜けたら借りたコネクションを返却する。"""
+        try:
+            yield self
+        finally:
+            self.release_connection()
 
     def _init_db(self):
-        conn = self.get_connection()
-        if self.backend == "postgres":
-            with conn.cursor() as cur:
-                self._apply_schema(cur)
-                self._seed_if_needed(cur)
-            conn.commit()
-        else:
-            cur = conn.cursor()
-            try:
-                self._apply_schema(cur)
-                self._seed_if_needed(cur)
-            finally:
-                cur.close()
-            conn.commit()
+        # 同じプールで確認済みなら問い合わせもしない。最新のDBなら schema_version を1回読むだけ
+        if self.pool.schema_ready:
+            return
+        migrate(self)
+        self.pool.schema_ready = True
+
+    def _journal_name(self):
+        """ジャーナルのファイル名の (前半, 拡張子)。セッションごとのファイルは間に '.<session_id>' が入る。"""
+        if self.backend == "sqlite":
+            return self.pool.location, ".pve_journal"
+        base_dir = Path(__file__).resolve().parent
+        return str(base_dir / f"pve_journal_{self.pool.location}"), ".jsonl"
+
+    def _journal_path(self):
+        # セッションごとに別ファイル（他のセッションの初期化で書き戻し待ちが捨てられないように）
+        stem, ext = self._journal_name()
+        suffix = f".{self.session_id}" if self.session_id else ""
+        return f"{stem}{suffix}{ext}"
+
+    def _discard_all_journals(self):
+        """DB全体の初期化用: 他のセッションの分も含めて、このDBのジャーナルをすべて書き戻さずに捨てる。"""
+        stem, ext = self._journal_name()
+        paths = {f"{stem}{ext}"}
+        for path in glob.glob(f"{glob.escape(stem)}.*{ext}"):
+            if _SESSION_ID_PATTERN.fullmatch(path[len(stem) + 1:-len(ext)]):
+                paths.add(path)
+        for path in paths:
+            # プロセス内のジャーナルは書き戻し待ちも捨てる（ファイルが無ければ何もしない）
+            get_journal(path).discard()
+
+    def _replay_journal(self):
+        # 前回のプロセスが書き戻せなかった分を反映する（プロセス内で1回だけ）
+        if self.journal.replayed:
+            return
+        self.journal.replayed = True
+        rows = self.journal.read_existing()
+        if rows:
+            print(f"⚠️ 前回書き戻せなかったプレイヤー状態を反映します ({len(rows)}件)")
+            self._update_players_status(rows)
+        self.journal.truncate()
+
+    @property
+    def master_data(self):
+        """items / skills / monsters のスナップショット（初回参照時と無効化後に読み込む）。"""
+        master = self._master
+        if master is None:
+            with self._cursor() as cur:
+                master = MasterData.load(cur, like_ignores_case=self.backend != "postgres")
+            self._commit()
+            self._master = master
+        return master
+
+    def invalidate_master_data(self):
+        self._master = None
+
+    @property
+    def leaderboard(self):
+        """
+        スコア順位表（top_k / bottom_k / rank_of）。このDBManager経由のスコア更新は即座に反映される。
+        別プロセスからの更新は反映されないので、その場合は invalidate_leaderboard() で読み直す。
+        """
+        lb = self._leaderboard
+        if lb is None:
+            lb = Leaderboard(self.get_ranking())
+            self._leaderboard = lb
+        return lb
+
+    def invalidate_leaderboard(self):
+        self._leaderboard = None
 
     def _apply_schema(self, cur):
         base_dir = Path(__file__).resolve().parent
@@ -88,6 +205,7 @@ class DBManager:
                 ),
                 ("神の加護", 4, "bless_regen", 10, "★★★★ 自分のターン開始時HP+10（PvE/PvP）"),
             )
+            self.invalidate_master_data()
 
     def _execute_sql_file(self, cur, path: Path):
         sql_text = path.read_text(encoding="utf-8")
@@ -108,31 +226,126 @@ class DBManager:
     def _ph(self, sql: str) -> str:
         return sql if self.backend == "postgres" else sql.replace("%s", "?")
 
+    def _commit(self):
+        # transaction() の中ではコミットを保留し、ブロックを抜けた時にまとめて確定する
+        if getattr(self._local, "tx_depth", 0) > 0:
+            return
+        self.get_connection().commit()
+        self._count_commit()
+
+    @staticmethod
+    def _count_commit():
+        profiler = query_profiler.active()
+        if profiler is not None:
+            profiler.count_commit()
+
+    @contextmanager
+    def transaction(self):
+        """
+        ブロック内の書き込みを1回のコミットにまとめる（1行動/1ターン単位での利用を想定）。
+        - 例外が出たらブロック内の変更をすべてロールバックして再送出する
+        - 入れ子にした場合は内側をSAVEPOINTで扱い、確定は最も外側のブロックで行う
+        - ブロック内で入力待ち(safe_input)をしないこと（exit時の初期化も保留されてしまう）
+        """
+        conn = self.get_connection()
+        depth = getattr(self._local, "tx_depth", 0)
+        savepoint = f"sp_{depth}"
+        if depth == 0:
+            if self.backend == "sqlite" and not conn.in_transaction:
+                # 読み取りから始まるブロックでも1つのトランザクションにする
+                conn.execute("BEGIN")
+        else:
+            with self._cursor() as cur:
+                cur.execute(f"SAVEPOINT {savepoint}")
+
+        self._local.tx_depth = depth + 1
+        try:
+            yield self
+        except BaseException:
+            self._local.tx_depth = depth
+            # ブロック内で反映済みのスコアも取り消されるので、順位表は読み直させる
+            self._leaderboard = None
+            if depth == 0:
+                conn.rollback()
+            else:
+                with self._cursor() as cur:
+                    cur.execute(f"ROLLBACK TO SAVEPOINT {savepoint}")
+                    cur.execute(f"RELEASE SAVEPOINT {savepoint}")
+            raise
+        self._local.tx_depth = depth
+        if depth == 0:
+            conn.commit()
+            self._count_commit()
+        else:
+            with self._cursor() as cur:
+                cur.execute(f"RELEASE SAVEPOINT {savepoint}")
+
     @contextmanager
     def _cursor(self):
         conn = self.get_connection()
+        # config.DB_QUERY_PROFILE が有効な時だけ、発行したSQLを記録するカーソルを渡す
+        profiler = query_profiler.active()
+        # トレース中は、カーソルを使っている間を呼び出したメソッド名のスパンとして記録する
+        with tracing.caller_span("db"):
+            if self.backend == "postgres":
+                with conn.cursor() as cur:
+                    yield cur if profiler is None else profiler.wrap(cur)
+            else:
+                cur = conn.cursor()
+                try:
+                    yield cur if profiler is None else profiler.wrap(cur)
+                finally:
+                    cur.close()
+
+    def explain(self, sql, params=()):
+        """実行計画を1行ずつの文字列で返す（インデックスが使われているかの確認用。transaction()の外で呼ぶ）。"""
+        with self._cursor() as cur:
+            if self.backend == "postgres":
+                # 行数の少ないテーブルでは常にSeq Scanが選ばれるため、使える索引があるかだけを見る
+                cur.execute("SET LOCAL enable_seqscan = off")
+                cur.execute("EXPLAIN " + sql, params)
+                plan = [r[0] for r in cur.fetchall()]
+            else:
+                cur.execute("EXPLAIN QUERY PLAN " + self._ph(sql), params)
+                plan = [r[-1] for r in cur.fetchall()]
         if self.backend == "postgres":
-            with conn.cursor() as cur:
-                yield cur
-        else:
-            cur = conn.cursor()
-            try:
-                yield cur
-            finally:
-                cur.close()
+            # SET LOCAL を後に残さない
+            self.get_connection().rollback()
+        return plan
 
     def reset_game_data(self):
         """ゲームを中止した時の初期化（プレイヤー/ログ/対戦結果を全消去）。"""
-        conn = self.get_connection()
     def reset_all_game_data(self):
-        """ゲームデータを完全に初期化する（プレイヤー、アイテム、ログなど全削除）。"""
-        conn = self.get_connection()
+        """
+        ゲームデータを完全に初期化する（プレイヤー、アイテム、ログなど全削除）。
+        セッションを指定したDBManagerでは、そのセッションのデータだけを削除する。
+        """
+        # 書き戻し待ちの状態は、消したプレイヤー（や同じIDで作り直したプレイヤー）へ書かせない
+        if self._leaderboard is not None:
+            self._leaderboard.clear()
+        if self.session_id is not None:
+            self.journal.discard()
+            self._delete_session_data()
+            return
+        # DB全体を消すと player_id も振り直されるので、他のセッションのジャーナルも捨てる
+        self._discard_all_journals()
+        use_snapshot = self.backend in DB_RESET_FROM_SNAPSHOT
+        if use_snapshot and restore_clean_snapshot(self):
+            # マスタも含めて書き戻したので読み直させる
+            self.invalidate_master_data()
+            return
+        self._delete_game_data()
+        if use_snapshot:
+            # 次回からはスナップショットの復元で済ませる
+            capture_clean_snapshot(self)
+
+    def _delete_game_data(self):
         if self.backend == "postgres":
             with self._cursor() as cur:
                 cur.execute(
                     "TRUNCATE TABLE pvp_results, pvp_battles, pve_logs, player_items, player_skills, players RESTART IDENTITY CASCADE"
                 )
-            conn.commit()
+            self._commit()
             return
 
         # sqlite
@@ -148,16 +361,28 @@ class DBManager:
                 cur.execute(f"DELETE FROM {table}")
             # SQLiteのAUTOINCREMENTをリセット
             cur.execute("DELETE FROM sqlite_sequence WHERE name IN ('players', 'pvp_battles', 'pve_logs')")
-        conn.commit()
+        self._commit()
+
+    def _delete_session_data(self):
+        # 子テーブルから消す（pvp_results / player_items / player_skills は CASCADE で消える）
+        with self._cursor() as cur:
+            cur.execute(self._ph("DELETE FROM pvp_battles WHERE session_id = %s"), (self._session,))
+            cur.execute(
+                self._ph("DELETE FROM pve_logs WHERE player_id IN (SELECT player_id FROM players WHERE session_id = %s)"),
+                (self._session,),
+            )
+            cur.execute(self._ph("DELETE FROM players WHERE session_id = %s"), (self._session,))
+        self._commit()
 
     def reset_points(self):
         """ゲーム開始前のポイント初期化（全プレイヤーのscore/bountyを0へ）。"""
-        conn = self.get_connection()
         with self._cursor() as cur:
-            cur.execute(self._ph("UPDATE players SET score = 0, bounty = 0"))
+            cur.execute(self._ph("UPDATE players SET score = 0, bounty = 0 WHERE session_id = %s"), (self._session,))
             # 過去の対戦履歴も削除
-            cur.execute("DELETE FROM pvp_battles")
-        conn.commit()
+            cur.execute(self._ph("DELETE FROM pvp_battles WHERE session_id = %s"), (self._session,))
+        self._commit()
+        if self._leaderboard is not None:
+            self._leaderboard.reset_scores()
 
     def ensure_cpu_players(self, cpu_names=None):
         """CPUプレイヤーを必ず用意する（存在しなければ作成）。"""
@@ -171,8 +396,8 @@ class DBManager:
         # 念のため存在確認（握りつぶさず、異常なら落とす）
         with self._cursor() as cur:
             placeholders = ",".join(["%s"] * len(cpu_names))
-            sql = f"SELECT player_name FROM players WHERE player_name IN ({placeholders})"
-            cur.execute(self._ph(sql), tuple(cpu_names))
+            sql = f"SELECT player_name FROM players WHERE session_id = %s AND player_name IN ({placeholders})"
+            cur.execute(self._ph(sql), (self._session, *cpu_names))
             rows = cur.fetchall() or []
         existing = {r[0] for r in rows}
         missing = [n for n in cpu_names if n not in existing]
@@ -182,19 +407,25 @@ class DBManager:
         return created_or_found
 
     def _check_add_column(self, cur, table, col, def_str):
-        cur.execute(f"SELECT column_name FROM information_schema.columns WHERE table_name='{table}' AND column_name='{col}'")
+        if self.backend == "postgres":
+            cur.execute(
+                "SELECT 1 FROM information_schema.columns WHERE table_name = %s AND column_name = %s",
+                (table, col),
+            )
+        else:
+            cur.execute(self._ph("SELECT 1 FROM pragma_table_info(%s) WHERE name = %s"), (table, col))
         if not cur.fetchone():
             print(f"⚠️ DBアップデート: {col} を追加")
             cur.execute(f"ALTER TABLE {table} ADD COLUMN {col} {def_str}")
 
     def get_or_create_player(self, name):
-        conn = self.get_connection()
         with self._cursor() as cur:
             cur.execute(
                 self._ph(
-                    "SELECT player_id, player_name, hp, mp, exp, agility, score, status_effect, status_turn, bounty FROM players WHERE player_name = %s"
+                    "SELECT player_id, player_name, hp, mp, exp, agility, score, status_effect, status_turn, bounty "
+                    "FROM players WHERE session_id = %s AND player_name = %s"
                 ),
-                (name,),
+                (self._session, name),
             )
             player = cur.fetchone()
             if player:
@@ -203,22 +434,22 @@ class DBManager:
             if self.backend == "postgres":
                 cur.execute(
                     """
-                    INSERT INTO players (player_name, hp, mp, exp, agility, score, status_effect, status_turn, bounty)
-                    VALUES (%s, 100, 50, 0, 10, 0, NULL, 0, 0)
+                    INSERT INTO players (session_id, player_name, hp, mp, exp, agility, score, status_effect, status_turn, bounty)
+                    VALUES (%s, %s, 100, 50, 0, 10, 0, NULL, 0, 0)
                     RETURNING player_id, player_name, hp, mp, exp, agility, score, status_effect, status_turn, bounty
                     """,
-                    (name,),
+                    (self._session, name),
                 )
                 new_player = cur.fetchone()
             else:
                 cur.execute(
                     self._ph(
                         """
-                        INSERT INTO players (player_name, hp, mp, exp, agility, score, status_effect, status_turn, bounty)
-                        VALUES (%s, 100, 50, 0, 10, 0, NULL, 0, 0)
+                        INSERT INTO players (session_id, player_name, hp, mp, exp, agility, score, status_effect, status_turn, bounty)
+                        VALUES (%s, %s, 100, 50, 0, 10, 0, NULL, 0, 0)
                         """
                     ),
-                    (name,),
+                    (self._session, name),
                 )
                 player_id = cur.lastrowid
                 cur.execute(
@@ -228,11 +459,12 @@ class DBManager:
                     (player_id,),
                 )
                 new_player = cur.fetchone()
-        conn.commit()
+        self._commit()
+        if self._leaderboard is not None:
+            self._leaderboard.set_score(new_player[0], new_player[1], new_player[6])
         return new_player
 
     def update_player_status(self, player_id, hp, mp, exp, status_effect=None, status_turn=0):
-        conn = self.get_connection()
         with self._cursor() as cur:
             cur.execute(
                 self._ph(
@@ -244,16 +476,38 @@ class DBManager:
                 ),
                 (hp, mp, exp, status_effect, status_turn, player_id),
             )
-        conn.commit()
+        self._commit()
+
+    def journal_player_status(self, player_id, hp, mp, exp, status_effect=None, status_turn=0):
+        """
+        update_player_status の書き込み遅延版。ジャーナルへ追記するだけで、一定件数ごとにまとめて書き戻す。
+        戦闘終了時など確定させたいところで flush_journal() を呼ぶこと（transaction()の外で）。
+        """
+        if self.journal.record(player_id, hp, mp, exp, status_effect, status_turn):
+            self.flush_journal()
+
+    def flush_journal(self):
+        rows = self.journal.take_pending()
+        if rows:
+            self._update_players_status(rows)
+        # DBへのコミットが済んでからジャーナルを消す（間で落ちても replay で同じ状態を書くだけ）
+        self.journal.truncate()
+
+    def _update_players_status(self, rows):
+        """rows: [(hp, mp, exp, status_effect, status_turn, player_id), ...] を1回のコミットで書く。"""
+        with self._cursor() as cur:
+            cur.executemany(
+                self._ph("UPDATE players SET hp=%s, mp=%s, exp=%s, status_effect=%s, status_turn=%s WHERE player_id=%s"),
+                rows,
+            )
+        self._commit()
 
     def update_bounty(self, player_id, new_bounty):
-        conn = self.get_connection()
         with self._cursor() as cur:
             cur.execute(self._ph("UPDATE players SET bounty = %s WHERE player_id = %s"), (new_bounty, player_id))
-        conn.commit()
+        self._commit()
 
     def register_pvp_result(self, battle_id, player_id, point):
-        conn = self.get_connection()
         with self._cursor() as cur:
             cur.execute(self._ph("UPDATE players SET score = score + %s WHERE player_id = %s"), (point, player_id))
             if battle_id:
@@ -279,48 +533,130 @@ class DBManager:
                         ),
                         (battle_id, player_id, point),
                     )
-        conn.commit()
+        self._commit()
+        if self._leaderboard is not None:
+            self._leaderboard.add_score(player_id, point)
+
+    def settle_pvp_battle(self, battle_id, awards, bounties):
+        """
+        PvP 1試合分の精算を1トランザクションでまとめて反映する。
+        - awards: {player_id: 加算ポイント}（players.score への加算 + pvp_results）
+        - bounties: {player_id: 新しい懸賞金}
+        """
+        score_rows = [(pid, pt) for pid, pt in awards.items()]
+        bounty_rows = [(pid, b) for pid, b in bounties.items()]
+        with self.transaction():
+            with self._cursor() as cur:
+                if self.backend == "postgres":
+                    if score_rows:
+                        execute_values(
+                            cur,
+                            """
+                            UPDATE players AS p SET score = p.score + v.point
+                            FROM (VALUES %s) AS v (player_id, point)
+                            WHERE p.player_id = v.player_id
+                            """,
+                            score_rows,
+                        )
+                        if battle_id:
+                            execute_values(
+                                cur,
+                                """
+                                INSERT INTO pvp_results (battle_id, player_id, point) VALUES %s
+                                ON CONFLICT (battle_id, player_id)
+                                DO UPDATE SET point = pvp_results.point + EXCLUDED.point
+                                """,
+                                [(battle_id, pid, pt) for pid, pt in score_rows],
+                            )
+                    if bounty_rows:
+                        execute_values(
+                            cur,
+                            """
+                            UPDATE players AS p SET bounty = v.bounty
+                            FROM (VALUES %s) AS v (player_id, bounty)
+                            WHERE p.player_id = v.player_id
+                            """,
+                            bounty_rows,
+                        )
+                else:
+                    cur.executemany(
+                        self._ph("UPDATE players SET score = score + %s WHERE player_id = %s"),
+                        [(pt, pid) for pid, pt in score_rows],
+                    )
+                    if battle_id:
+                        cur.executemany(
+                            self._ph(
+                                """
+                                INSERT INTO pvp_results (battle_id, player_id, point)
+                                VALUES (%s, %s, %s)
+                                ON CONFLICT (battle_id, player_id)
+                                DO UPDATE SET point = COALESCE(pvp_results.point, 0) + excluded.point
+                                """
+                            ),
+                            [(battle_id, pid, pt) for pid, pt in score_rows],
+                        )
+                    cur.executemany(
+                        self._ph("UPDATE players SET bounty = %s WHERE player_id = %s"),
+                        [(b, pid) for pid, b in bounty_rows],
+                    )
+            if self._leaderboard is not None:
+                for pid, pt in score_rows:
+                    self._leaderboard.add_score(pid, pt)
 
     def create_pvp_battle(self, host_player_id):
-        conn = self.get_connection()
         with self._cursor() as cur:
             if self.backend == "postgres":
                 cur.execute(
-                    "INSERT INTO pvp_battles (player_id) VALUES (%s) RETURNING battle_id",
-                    (host_player_id,),
+                    "INSERT INTO pvp_battles (player_id, session_id) VALUES (%s, %s) RETURNING battle_id",
+                    (host_player_id, self._session),
                 )
                 battle_id = cur.fetchone()[0]
             else:
-                cur.execute(self._ph("INSERT INTO pvp_battles (player_id) VALUES (%s)"), (host_player_id,))
+                cur.execute(
+                    self._ph("INSERT INTO pvp_battles (player_id, session_id) VALUES (%s, %s)"), (host_player_id, self._session)
+                )
                 battle_id = cur.lastrowid
-        conn.commit()
+        self._commit()
         return battle_id
 
     def log_pve(self, player_id, monster_name, is_win):
-        conn = self.get_connection()
+        monster_id = self.master_data.monster_id_by_name(monster_name) if monster_name else None
         with self._cursor() as cur:
-            monster_id = None
-            if monster_name:
-                cur.execute(self._ph("SELECT monster_id FROM monsters WHERE monster_name = %s LIMIT 1"), (monster_name,))
-                row = cur.fetchone()
-                monster_id = row[0] if row else None
-
             cur.execute(
                 self._ph("INSERT INTO pve_logs (player_id, monster_id, is_win) VALUES (%s, %s, %s)"),
                 (player_id, monster_id, int(bool(is_win)) if self.backend == "sqlite" else bool(is_win)),
             )
-        conn.commit()
+        self._commit()
 
     def get_ranking(self):
-        conn = self.get_connection()
         with self._cursor() as cur:
-            cur.execute("SELECT player_id, player_name, score FROM players ORDER BY score DESC")
+            cur.execute(
+                self._ph("SELECT player_id, player_name, score FROM players WHERE session_id = %s ORDER BY score DESC, player_id"),
+                (self._session,),
+            )
+            rows = cur.fetchall()
+        self._commit()
+        return rows
+
+    def get_dense_ranking(self, limit=None):
+        """(player_id, player_name, score, 順位) をDB側の DENSE_RANK で付けて返す（同点は同順位）。"""
+        sql = """
+            SELECT player_id, player_name, score, DENSE_RANK() OVER (ORDER BY score DESC) AS rnk
+            FROM players
+            WHERE session_id = %s
+            ORDER BY score DESC, player_id
+        """
+        args = (self._session,)
+        if limit is not None:
+            sql += " LIMIT %s"
+            args += (limit,)
+        with self._cursor() as cur:
+            cur.execute(self._ph(sql), args)
             rows = cur.fetchall()
-        conn.commit()
+        self._commit()
         return rows
 
     def get_player_skills(self, player_id):
-        conn = self.get_connection()
         with self._cursor() as cur:
             cur.execute(
                 self._ph(
@@ -334,44 +670,27 @@ class DBManager:
                 (player_id,),
             )
             rows = cur.fetchall()
-        conn.commit()
+        self._commit()
         return rows
 
     def get_learnable_skills(self, player_id):
-        conn = self.get_connection()
         with self._cursor() as cur:
-            cur.execute(
-                self._ph(
-                    """
-                    SELECT skill_id, skill_name, mp_cost, power, description, is_aoe
-                    FROM skills 
-                    WHERE skill_id NOT IN (SELECT skill_id FROM player_skills WHERE player_id = %s)
-                    ORDER BY RANDOM() 
-                    LIMIT 3
-                    """
-                ),
-                (player_id,),
-            )
-            rows = cur.fetchall()
-        conn.commit()
-        return rows
+            cur.execute(self._ph("SELECT skill_id FROM player_skills WHERE player_id = %s"), (player_id,))
+            learned = {r[0] for r in cur.fetchall()}
+        self._commit()
+        # スキル本体はマスタのスナップショットから選ぶ（未習得からランダムに3つ）
+        cands = [s for s in self.master_data.skills if s[0] not in learned]
+        return random.sample(cands, min(3, len(cands)))
 
     def learn_skill(self, player_id, skill_id):
-        conn = self.get_connection()
         with self._cursor() as cur:
             cur.execute(self._ph("INSERT INTO player_skills (player_id, skill_id) VALUES (%s, %s)"), (player_id, skill_id))
-        conn.commit()
+        self._commit()
 
     def get_item_id_by_name(self, item_name):
-        conn = self.get_connection()
-        with self._cursor() as cur:
-            cur.execute(self._ph("SELECT item_id FROM items WHERE item_name = %s LIMIT 1"), (item_name,))
-            row = cur.fetchone()
-        conn.commit()
-        return row[0] if row else None
+        return self.master_data.item_id_by_name(item_name)
 
     def has_item_effect(self, player_id, effect_type):
-        conn = self.get_connection()
         with self._cursor() as cur:
             cur.execute(
                 self._ph(
@@ -386,11 +705,10 @@ class DBManager:
                 (player_id, effect_type),
             )
             result = cur.fetchone() is not None
-        conn.commit()
+        self._commit()
         return result
 
     def add_item(self, player_id, item_id):
-        conn = self.get_connection()
         with self._cursor() as cur:
             cur.execute(
                 self._ph(
@@ -402,10 +720,9 @@ class DBManager:
                 ),
                 (player_id, item_id),
             )
-        conn.commit()
+        self._commit()
 
     def get_player_items(self, player_id, effect_filter=None):
-        conn = self.get_connection()
         with self._cursor() as cur:
             sql = """
                 SELECT i.item_id, i.item_name, i.rarity, i.effect_type, i.effect_value, i.description, pi.quantity
@@ -420,124 +737,207 @@ class DBManager:
             
             cur.execute(self._ph(sql), tuple(args))
             rows = cur.fetchall()
-        conn.commit()
+        self._commit()
         return rows
 
     def consume_item(self, player_id, item_id):
-        conn = self.get_connection()
         with self._cursor() as cur:
             cur.execute(
                 self._ph("UPDATE player_items SET quantity = quantity - 1 WHERE player_id = %s AND item_id = %s"),
                 (player_id, item_id),
             )
-        conn.commit()
+        self._commit()
     
     def get_items_by_type(self, type_prefix):
-        conn = self.get_connection()
-        with self._cursor() as cur:
-            # 安全のためパラメータ化クエリを使用
-            cur.execute(self._ph("SELECT item_id, item_name, rarity FROM items WHERE effect_type LIKE %s"), (f"{type_prefix}%",))
-            rows = cur.fetchall()
-        conn.commit()
-        return rows
+        return list(self.master_data.items_by_type(type_prefix))
+
+    def get_loot_table(self, type_prefix, rarity_weights):
+        return self.master_data.loot_table(type_prefix, rarity_weights)
 
     # --- PvPSystem用（生SQLをDBManagerに寄せる） ---
     def get_pvp_participants_raw(self):
-        conn = self.get_connection()
         with self._cursor() as cur:
             cur.execute(
-                "SELECT player_id, player_name, hp, agility, status_effect, status_turn, exp, mp, score, bounty FROM players WHERE hp > 0"
+                self._ph(
+                    "SELECT player_id, player_name, hp, agility, status_effect, status_turn, exp, mp, score, bounty "
+                    "FROM players WHERE session_id = %s AND hp > 0 ORDER BY player_id"
+                ),
+                (self._session,),
             )
             rows = cur.fetchall()
-        conn.commit()
+        self._commit()
         return rows
 
     def get_player_status_row(self, player_id):
-        conn = self.get_connection()
         with self._cursor() as cur:
             cur.execute(self._ph("SELECT hp, status_effect, status_turn FROM players WHERE player_id=%s"), (player_id,))
             row = cur.fetchone()
-        conn.commit()
+        self._commit()
         return row if row else (0, None, 0)
 
     def get_player_bounty(self, player_id):
-        conn = self.get_connection()
         with self._cursor() as cur:
             cur.execute(self._ph("SELECT bounty FROM players WHERE player_id=%s"), (player_id,))
             row = cur.fetchone()
-        conn.commit()
+        self._commit()
         return row[0] if row else 0
 
     def update_player_effect(self, player_id, hp, eff, turn):
-        conn = self.get_connection()
         with self._cursor() as cur:
             cur.execute(
                 self._ph("UPDATE players SET hp=%s, status_effect=%s, status_turn=%s WHERE player_id=%s"),
                 (hp, eff, turn, player_id),
             )
-        conn.commit()
+        self._commit()
 
     def damage_player_hp(self, player_id, dmg):
-        conn = self.get_connection()
         with self._cursor() as cur:
             cur.execute(self._ph("UPDATE players SET hp=hp-%s WHERE player_id=%s"), (dmg, player_id))
-        conn.commit()
+        self._commit()
+
+    def apply_area_damage(self, attacker_id, damage, defense_map=None, effect=None, target_ids=None):
+        """
+        全体攻撃を1回のUPDATEでまとめて反映する（対象の人数によらず1文・1コミット）。
+        - 対象: attacker_id 以外の、生存していて隠密でないプレイヤー
+          target_ids を渡した時は、その全員をそのまま対象にする（生存・隠密の判定は呼び出し側で済ませておく）
+        - 1人ごとのダメージは max(1, damage - 防御力)。defense_map: player_id -> 防御力（無ければ0）
+        - effect: (状態異常, ターン) を対象全員に付与する
+        [(player_id, 名前, 受けたダメージ, 残りHP)] を player_id 順で返す。
+        """
+        if damage <= 0 or (target_ids is not None and not target_ids):
+            return []
+        defense_map = {pid: d for pid, d in (defense_map or {}).items() if d}
+
+        if target_ids is None:
+            where = (
+                "session_id = %s AND hp > 0 AND player_id != %s"
+                " AND (status_effect IS NULL OR status_effect != '隠密')"
+            )
+            where_params = [self._session, attacker_id]
+        else:
+            where = f"session_id = %s AND player_id IN ({','.join(['%s'] * len(target_ids))})"
+            where_params = [self._session, *target_ids]
+
+        # 防御力のあるプレイヤーだけ CASE で引く
+        defense_sql, defense_params = "0", []
+        if defense_map:
+            defense_sql = "CASE player_id " + " ".join(["WHEN %s THEN %s"] * len(defense_map)) + " ELSE 0 END"
+            for pid, d in defense_map.items():
+                defense_params += [pid, d]
+        greatest = "GREATEST" if self.backend == "postgres" else "MAX"
+        sets = f"hp = hp - {greatest}(1, %s - {defense_sql})"
+        set_params = [damage, *defense_params]
+        if effect:
+            sets += ", status_effect = %s, status_turn = %s"
+            set_params += [effect[0], effect[1]]
+
+        with self._cursor() as cur:
+            if self.backend == "postgres" or _SQLITE_HAS_RETURNING:
+                cur.execute(
+                    self._ph(f"UPDATE players SET {sets} WHERE {where} RETURNING player_id, player_name, hp"),
+                    (*set_params, *where_params),
+                )
+                rows = cur.fetchall()
+            else:
+                # RETURNING の無い古いSQLite: 対象を読んでから、同じトランザクションで更新する
+                cur.execute(self._ph(f"SELECT player_id, player_name, hp FROM players WHERE {where}"), where_params)
+                before = cur.fetchall()
+                rows = []
+                if before:
+                    ids = [r[0] for r in before]
+                    cur.execute(
+                        self._ph(f"UPDATE players SET {sets} WHERE player_id IN ({','.join(['%s'] * len(ids))})"),
+                        (*set_params, *ids),
+                    )
+                    rows = [(pid, name, hp - max(1, damage - defense_map.get(pid, 0))) for pid, name, hp in before]
+        self._commit()
+        return sorted((pid, name, max(1, damage - defense_map.get(pid, 0)), hp) for pid, name, hp in rows)
 
     def set_player_effect(self, player_id, eff, turn):
-        conn = self.get_connection()
         with self._cursor() as cur:
             cur.execute(
                 self._ph("UPDATE players SET status_effect=%s, status_turn=%s WHERE player_id=%s"),
                 (eff, turn, player_id),
             )
-        conn.commit()
+        self._commit()
 
     def update_player_mp(self, player_id, mp):
-        conn = self.get_connection()
         with self._cursor() as cur:
             cur.execute(self._ph("UPDATE players SET mp=%s WHERE player_id=%s"), (mp, player_id))
-        conn.commit()
+        self._commit()
+
+    def update_players_battle_state(self, rows):
+        """rows: [(hp, mp, status_effect, status_turn, player_id), ...] を1回のコミットで書き戻す。"""
+        if not rows:
+            return
+        with self._cursor() as cur:
+            cur.executemany(
+                self._ph("UPDATE players SET hp=%s, mp=%s, status_effect=%s, status_turn=%s WHERE player_id=%s"),
+                rows,
+            )
+        self._commit()
 
     def get_enemies_list(self, my_id, allow_stealth=False):
-        conn = self.get_connection()
         with self._cursor() as cur:
-            sql = "SELECT player_id, player_name, hp, status_effect FROM players WHERE hp > 0 AND player_id != %s"
+            sql = "SELECT player_id, player_name, hp, status_effect FROM players WHERE session_id = %s AND hp > 0 AND player_id != %s"
             if not allow_stealth:
                 sql += " AND (status_effect IS NULL OR status_effect != '隠密')"
-            cur.execute(self._ph(sql), (my_id,))
+            # 並びはインデックスの選び方に左右されないよう登録順に固定する
+            sql += " ORDER BY player_id"
+            cur.execute(self._ph(sql), (self._session, my_id))
             rows = cur.fetchall()
-        conn.commit()
+        self._commit()
         return [{'id': r[0], 'name': r[1], 'hp': r[2], 'effect': r[3]} for r in rows]
 
     def get_player_name(self, player_id):
-        conn = self.get_connection()
         with self._cursor() as cur:
             cur.execute(self._ph("SELECT player_name FROM players WHERE player_id=%s"), (player_id,))
             row = cur.fetchone()
-        conn.commit()
+        self._commit()
         return row[0] if row else "?"
 
     # --- ゲーム進行用ユーティリティ ---
-    def full_recover_all_players(self, level_up_exp: int, base_hp: int = 100, hp_per_level: int = 10, base_mp: int = 50):
+    def full_recover_all_players(self, level_up_exp: int, base_hp: int = BASE_HP, hp_per_level: int = HP_PER_LEVEL,
+                                 base_mp: int = BASE_MP, player_ids=None):
         """
-        全プレイヤーを全回復する（HP/MP最大 + 状態異常リセット）。
+        全プレイヤー（player_ids を渡せばその中だけ）を全回復する（HP/MP最大 + 状態異常リセット）。
         - レベルは exp から算出: level = (exp // level_up_exp) + 1
-        - 最大HP: base_hp + level * hp_per_level
+        - 最大HP: base_hp + level * hp_per_level（models.max_hp_for_level と同じ式）
+        プレイヤーをPythonへ読み込まず、UPDATE 1文でDB側で計算する。
+        exp は整数の列なので、/ は PostgreSQL でも SQLite でも切り捨ての整数除算になる。
         """
-        conn = self.get_connection()
+        if player_ids is not None and not player_ids:
+            return
+        sql = ("UPDATE players SET hp = %s + ((exp / %s) + 1) * %s, mp = %s, status_effect = NULL, status_turn = 0"
+               " WHERE session_id = %s")
+        params = [int(base_hp), int(level_up_exp), int(hp_per_level), int(base_mp), self._session]
+        if player_ids is not None:
+            sql += f" AND player_id IN ({','.join(['%s'] * len(player_ids))})"
+            params += list(player_ids)
         with self._cursor() as cur:
-            cur.execute("SELECT player_id, exp FROM players")
-            rows = cur.fetchall() or []
-
-            # 少人数前提なのでPython側で計算して一括更新する（DB差異回避）
-            updates = []
-            for pid, exp in rows:
-                lvl = (int(exp) // int(level_up_exp)) + 1
-                max_hp = int(base_hp) + (lvl * int(hp_per_level))
-                updates.append((max_hp, int(base_mp), None, 0, pid))
-
-            cur.executemany(
-                self._ph("UPDATE players SET hp=%s, mp=%s, status_effect=%s, status_turn=%s WHERE player_id=%s"),
-                updates,
-            )
-        conn.commit()
\ No newline at end of file
+            cur.execute(self._ph(sql), params)
+        self._commit()
+
+_shared_dbs = {}  # session_id -> DBManager
+_shared_db_lock = threading.Lock()
+
+
+def create_db_manager(backend=None, session_id=None):
+    """config.DB_BACKEND（または引数）に応じたDBManagerを作る。'memory' ならDBを使わない実装を返す。"""
+    backend = backend or DB_BACKEND
+    if backend == "memory":
+        return MemoryDBManager(session_id=session_id)
+    if backend == DB_BACKEND:
+        # 共有プールを使い、同じスレッドではセッションが違っても同じコネクションを使うので、セッションごとに作っても増えない
+        return DBManager(session_id=session_id)
+    return DBManager(pool=create_pool(backend), session_id=session_id)
+
+
+def get_shared_db(session_id=None):
+    """プロセス内で共有するDBManagerを（セッションごとに1つ）返す（スキーマ適用は初回の1回だけ）。"""
+    with _shared_db_lock:
+        db = _shared_dbs.get(session_id)
+        if db is None:
+            db = create_db_manager(session_id=session_id)
+            _shared_dbs[session_id] = db
+        return db
@@ -0,0 +1,217 @@
+# db_pool.py
+from __future__ import annotations
+
+import functools
+import os
+from pathlib import Path
+import sqlite3
+import threading
+import time
+
+import psycopg2
+from psycopg2 import OperationalError
+
+from config import DB_BACKEND, DB_CONFIG, DB_POOL_MAX_SIZE, DB_POOL_TIMEOUT, DB_POOL_HEALTH_CHECK_INTERVAL, SQLITE_PROFILE
+
+
+class PoolTimeoutError(RuntimeError):
+    """空きコネクションを待っている間にタイムアウトした。"""
+
+
+class ConnectionPool:
+    """
+    上限付きのコネクションプール（postgres / sqlite 共通）。
+    - acquire() で貸出、release() で返却。上限に達したら返却を待つ（timeout秒まで）
+    - 一定時間使われていなかったコネクションは貸出前に死活確認し、死んでいれば作り直す
+    - sqliteはスレッドごとに別コネクションを貸し出す（同時に2スレッドで共有しない）
+    """
+
+    def __init__(self, backend, connect, location, max_size=DB_POOL_MAX_SIZE, timeout=DB_POOL_TIMEOUT,
+                 health_check_interval=DB_POOL_HEALTH_CHECK_INTERVAL):
+        self.backend = backend  # 'postgres' | 'sqlite'
+        self.location = location  # sqlite: ファイルパス / postgres: DB名
+        self._connect = connect
+        self._max_size = max(1, int(max_size))
+        self._timeout = timeout
+        self._health_check_interval = health_check_interval
+        self._idle = []  # [(conn, 最終返却時刻)]
+        self._size = 0  # 作成済みコネクション数（貸出中 + 待機中）
+        self._cond = threading.Condition()
+        self._closed = False
+        self.pid = os.getpid()
+        self.schema_ready = False  # スキーマが最新であることを確認済みか（DBManager._init_db が使う）
+        # スレッドごとの貸出中コネクションとトランザクションの深さ（同じプールを使う DBManager 全体で共有する）
+        self.thread_local = threading.local()
+
+    def add_idle(self, conn):
+        """バックエンド判定のために作ったコネクションを、そのままプールへ入れる。"""
+        with self._cond:
+            self._size += 1
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def acquire(self):
+        deadline = time.monotonic() + self._timeout
+        while True:
+            conn, last_used = None, None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise RuntimeError("コネクションプールは既に閉じられています")
+                    if self._idle:
+                        conn, last_used = self._idle.pop()
+                        break
+                    if self._size < self._max_size:
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeoutError(f"空きコネクションがありません（上限 {self._max_size}）")
+                    self._cond.wait(remaining)
+
+            if conn is None:
+                try:
+                    return self._connect()
+                except Exception:
+                    self._forget()
+                    raise
+
+            if time.monotonic() - last_used < self._health_check_interval or self._is_healthy(conn):
+                return conn
+            # 死んでいたコネクションは捨てて、もう一度取り直す
+            self._discard(conn)
+
+    def release(self, conn):
+        if conn is None:
+            return
+        try:
+            if self._in_transaction(conn):
+                # 未確定の変更を次の利用者へ持ち越さない
+                conn.rollback()
+        except Exception:
+            self._discard(conn)
+            return
+        with self._cond:
+            if self._closed:
+                self._size -= 1
+                self._close_quietly(conn)
+                return
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def close_all(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+    def close_idle(self):
+        """待機中のコネクションを閉じる（プールは使い続けられる）。貸出中のものが無ければ True。"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            in_use = self._size
+        for conn, _ in idle:
+            self._close_quietly(conn)
+        return in_use == 0
+
+    def _is_healthy(self, conn):
+        try:
+            if getattr(conn, "closed", False):
+                return False
+            cur = conn.cursor()
+            try:
+                cur.execute("SELECT 1")
+                cur.fetchone()
+            finally:
+                cur.close()
+            if self.backend == "postgres":
+                # SELECTで開始された暗黙のトランザクションを閉じておく
+                conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _in_transaction(self, conn):
+        if self.backend == "postgres":
+            return conn.status != psycopg2.extensions.STATUS_READY
+        return conn.in_transaction
+
+    def _discard(self, conn):
+        self._close_quietly(conn)
+        self._forget()
+
+    def _forget(self):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def _sqlite_path():
+    return Path(__file__).resolve().parent / "game.sqlite3"
+
+
+def _connect_sqlite(path=None):
+    # 貸出中は1スレッドだけが使うので、返却後に別スレッドへ貸し出せるようにする
+    busy_timeout = SQLITE_PROFILE.get('busy_timeout', 5000) / 1000
+    conn = sqlite3.connect(path or _sqlite_path(), timeout=busy_timeout, check_same_thread=False)
+    try:
+        conn.execute("PRAGMA foreign_keys = ON")
+    except Exception:
+        pass
+    apply_sqlite_profile(conn, SQLITE_PROFILE)
+    return conn
+
+
+def apply_sqlite_profile(conn, profile):
+    """config.SQLITE_PROFILE の PRAGMA を接続に適用する。"""
+    for name, value in profile.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+
+
+def _connect_postgres():
+    return psycopg2.connect(**DB_CONFIG)
+
+
+def create_pool(backend="auto", sqlite_path=None):
+    # 'auto' ならまずPostgreSQLを試し、ダメならSQLiteで“このエディタだけで”動かす
+    # sqlite_path: 既定の game.sqlite3 以外のファイルを使う（プロセスごとに別DBを持たせる時など）
+    if backend not in ("auto", "postgres", "sqlite"):
+        raise ValueError(f"コネクションプールを作れないバックエンドです: {backend}")
+    first = None
+    if backend in ("auto", "postgres"):
+        try:
+            first = _connect_postgres()
+            pool = ConnectionPool("postgres", _connect_postgres, DB_CONFIG['dbname'])
+        except OperationalError:
+            if backend == "postgres":
+                raise
+    if first is None:
+        path = str(sqlite_path or _sqlite_path())
+        first = _connect_sqlite(path)
+        pool = ConnectionPool("sqlite", functools.partial(_connect_sqlite, path), path)
+    pool.add_idle(first)
+    return pool
+
+
+_shared_pool = None
+_shared_pool_lock = threading.Lock()
+
+
+def get_shared_pool():
+    """プロセス内で共有するプールを返す（fork先のプロセスでは作り直す）。"""
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is None or _shared_pool.pid != os.getpid():
+            _shared_pool = create_pool(DB_BACKEND)
+        return _shared_pool
@@ -0,0 +1,183 @@
+# db_snapshot.py
+"""
+初期化直後（マスタだけが入った状態）のDBのスナップショット。
+reset_all_game_data はこれを丸ごと書き戻すので、プレイヤーやログが何行あっても時間が変わらない。
+- sqlite: 「DBファイル名.clean」へバックアップAPIでコピーし、復元時は逆向きにコピーする
+- postgres: 「DB名_clean」をテンプレートDBとして作り、復元時は CREATE DATABASE ... TEMPLATE で作り直す
+- スナップショットが無い/古い（schema_version が違う）/使えない時は False を返し、呼び出し側は DELETE/TRUNCATE で初期化する
+- どのバックエンドで使うかは config.DB_RESET_FROM_SNAPSHOT（既定は sqlite だけ。postgres はDBを消して作り直すので明示した時だけ）
+"""
+import os
+import sqlite3
+
+import psycopg2
+from psycopg2 import sql
+
+from config import DB_CONFIG
+from migrations import LATEST_VERSION
+
+
+def _snapshot_path(db):
+    return f"{db.pool.location}.clean"
+
+
+def _template_name(db):
+    return f"{db.pool.location}_clean"
+
+
+def _in_transaction(db):
+    return getattr(db._local, "tx_depth", 0) > 0
+
+
+def restore_clean_snapshot(db):
+    """スナップショットから初期状態へ戻す。戻せた場合は True。"""
+    if _in_transaction(db):
+        return False
+    if db.backend == "sqlite":
+        return _restore_sqlite(db)
+    return _restore_postgres(db)
+
+
+def capture_clean_snapshot(db):
+    """初期化した直後のDBをスナップショットとして保存する（最新のものが既にあれば何もしない）。"""
+    if _in_transaction(db):
+        return False
+    if db.backend == "sqlite":
+        return _capture_sqlite(db)
+    return _capture_postgres(db)
+
+
+# --- sqlite ---
+def _sqlite_snapshot_version(path):
+    if not os.path.exists(path):
+        return 0
+    conn = sqlite3.connect(path)
+    try:
+        row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+        return (row[0] if row else None) or 0
+    except sqlite3.Error:
+        return 0
+    finally:
+        conn.close()
+
+
+def _restore_sqlite(db):
+    path = _snapshot_path(db)
+    if _sqlite_snapshot_version(path) != LATEST_VERSION:
+        return False
+    db._commit()
+    src = sqlite3.connect(path)
+    try:
+        # コピー先は書き込みロックを取るので、他のコネクションとは普通の書き込みと同じく直列化される
+        src.backup(db.get_connection())
+    except sqlite3.Error:
+        return False
+    finally:
+        src.close()
+    return True
+
+
+def _capture_sqlite(db):
+    path = _snapshot_path(db)
+    if _sqlite_snapshot_version(path) == LATEST_VERSION:
+        return True
+    tmp_path = path + ".tmp"
+    db._commit()
+    dst = sqlite3.connect(tmp_path)
+    try:
+        db.get_connection().backup(dst)
+        # 元がWALでも、スナップショットは単一ファイルで持つ
+        dst.execute("PRAGMA journal_mode = DELETE")
+    except sqlite3.Error:
+        dst.close()
+        os.remove(tmp_path)
+        return False
+    dst.close()
+    os.replace(tmp_path, path)
+    return True
+
+
+# --- postgres ---
+def _connect_admin():
+    # DBの作成/削除は、対象DBに繋がっていない保守用DBから行う
+    conn = psycopg2.connect(**{**DB_CONFIG, 'dbname': 'postgres'})
+    conn.autocommit = True
+    return conn
+
+
+def _pg_template_version(name):
+    try:
+        conn = psycopg2.connect(**{**DB_CONFIG, 'dbname': name})
+    except psycopg2.OperationalError:
+        return 0
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT MAX(version) FROM schema_version")
+            row = cur.fetchone()
+        return (row[0] if row else None) or 0
+    except psycopg2.Error:
+        return 0
+    finally:
+        conn.close()
+
+
+def _release_all(db):
+    """CREATE/DROP DATABASE のため、プールのコネクションを全て閉じる。他のスレッドが使用中なら False。"""
+    db._commit()
+    db.release_connection()
+    return db.pool.close_idle()
+
+
+def _restore_postgres(db):
+    name, template = db.pool.location, _template_name(db)
+    if _pg_template_version(template) != LATEST_VERSION:
+        return False
+    if not _release_all(db):
+        return False
+    restoring = f"{name}_restoring"
+    try:
+        admin = _connect_admin()
+    except psycopg2.Error:
+        return False
+    try:
+        with admin.cursor() as cur:
+            cur.execute(sql.SQL("DROP DATABASE IF EXISTS {}").format(sql.Identifier(restoring)))
+            cur.execute(sql.SQL("CREATE DATABASE {} TEMPLATE {}").format(
+                sql.Identifier(restoring), sql.Identifier(template)))
+            try:
+                cur.execute(sql.SQL("DROP DATABASE {}").format(sql.Identifier(name)))
+            except psycopg2.Error:
+                # 他のセッションが繋がっていて消せなければ、元のDBはそのまま残す
+                cur.execute(sql.SQL("DROP DATABASE {}").format(sql.Identifier(restoring)))
+                return False
+            cur.execute(sql.SQL("ALTER DATABASE {} RENAME TO {}").format(
+                sql.Identifier(restoring), sql.Identifier(name)))
+    except psycopg2.Error:
+        return False
+    finally:
+        admin.close()
+    return True
+
+
+def _capture_postgres(db):
+    name, template = db.pool.location, _template_name(db)
+    if _pg_template_version(template) == LATEST_VERSION:
+        return True
+    # テンプレートにするDBには他のセッションが繋がっていてはいけない
+    if not _release_all(db):
+        return False
+    try:
+        admin = _connect_admin()
+    except psycopg2.Error:
+        return False
+    try:
+        with admin.cursor() as cur:
+            cur.execute(sql.SQL("DROP DATABASE IF EXISTS {}").format(sql.Identifier(template)))
+            cur.execute(sql.SQL("CREATE DATABASE {} TEMPLATE {}").format(
+                sql.Identifier(template), sql.Identifier(name)))
+    except psycopg2.Error:
+        # CREATEDB 権限が無いなど。スナップショット無しで動かす
+        return False
+    finally:
+        admin.close()
+    return True
@@ -2,15 +2,17 @@
 import random
 from pve_system import PvESystem
 from pvp_system import PvPSystem
-from config import GAME_LOOP_COUNT, LEVEL_UP_EXP
+from config import BASE_MP, GAME_LOOP_COUNT, LEVEL_UP_EXP, LOSER_GIFT_RARITY_WEIGHTS
+import query_profiler
+import tracing
 from utils import safe_input
 
 class GameManager:
-    def __init__(self, player, db_manager):
+    def __init__(self, player, db_manager, cpu_time_budget=None):
         self.player = player
         self.db = db_manager
         self.pve = PvESystem(player, db_manager)
-        self.pvp = PvPSystem(player, db_manager)
+        self.pvp = PvPSystem(player, db_manager, cpu_time_budget)
 
     def run_game_loop(self):
         print("\n=== 初期ボーナス ===")
@@ -37,8 +39,9 @@ class GameManager:
             
             # PvP用アイテムをいくつか付与
             items = self.db.get_items_by_type("pvp_")
-            for item in items:
-                self.db.add_item(self.player.id, item[0])
+            with self.db.transaction():
+                for item in items:
+                    self.db.add_item(self.player.id, item[0])
             print("✅ 最強セットを適用しました")
 
         self._show_ranking()
@@ -48,38 +51,33 @@ class GameManager:
             print(f"\n{'='*15} 第 {i} 戦 {'='*15}")
 
             print(f"\n--- 🏟️ PvE 第{i}戦（モンスター戦） ---")
-            self.pve.start_farm()
+            with query_profiler.phase("pve"), tracing.span("PvE farm", args={"round": i}):
+                self.pve.start_farm()
             self._full_recovery()
 
             print(f"\n--- ⚔️ PvP 第{i}戦 ---")
-            self.pvp.start_match(i)
+            with query_profiler.phase("pvp"), tracing.span("PvP match", args={"round": i}):
+                self.pvp.start_match(i)
             self._full_recovery()
 
-            self._distribute_loser_items()
+            with tracing.span("distribute_loser_items"):
+                self._distribute_loser_items()
             self._show_ranking()
 
         self._show_final_result()
 
     def _distribute_loser_items(self):
-        ranking = self.db.get_ranking()
-        if len(ranking) < 2: return
+        board = self.db.leaderboard
+        if len(board) < 2: return
 
-        losers = ranking[-2:]
-        gift_list = self.db.get_items_by_type("pve_")
-        if not gift_list: return
+        losers = board.bottom_k(2)
+        gift_table = self.db.get_loot_table("pve_", LOSER_GIFT_RARITY_WEIGHTS)
+        if gift_table is None: return
 
         print("\n🎁 --- 敗者救済タイム ---")
         for loser in losers:
             l_id, l_name = loser[0], loser[1]
-            weights = []
-            for item in gift_list:
-                rar = item[2]
-                if rar==1: w=60
-                elif rar==2: w=30
-                else: w=10
-                weights.append(w)
-            
-            gift = random.choices(gift_list, weights=weights, k=1)[0]
+            gift = gift_table.draw(random)
             self.db.add_item(l_id, gift[0])
             
             star = "★" * gift[2]
@@ -90,30 +88,27 @@ class GameManager:
 
     def _full_recovery(self):
         # 全プレイヤーを全回復（次のPvE/PvPに全員が参加できるようにする）
-        self.db.full_recover_all_players(LEVEL_UP_EXP)
+        with query_profiler.phase("recovery"), tracing.span("full_recovery"):
+            self.db.full_recover_all_players(LEVEL_UP_EXP)
 
         # 手元のプレイヤーオブジェクトも同期
-        max_hp = 100 + (self.player.level * 10)
+        max_hp = self.player.max_hp
         self.player.hp = max_hp
-        self.player.mp = 50
+        self.player.mp = BASE_MP
         self.player.status_effect = None
         self.player.status_turn = 0
         print(f"(全員回復: HP/MP/状態異常 - MaxHP:{max_hp})")
 
     def _show_ranking(self):
         print("\n📊 暫定順位")
-        ranking = self.db.get_ranking()
-        current_rank = 1
-        for i, r in enumerate(ranking):
-            # 前の人と同点なら同じ順位
-            if i > 0 and r[2] == ranking[i-1][2]:
-                display_rank = current_rank
-            else:
-                display_rank = i + 1
-                current_rank = display_rank
-            print(f"  {display_rank}位: {r[1]} ({r[2]}pt)")
+        with query_profiler.phase("ranking"), tracing.span("show_ranking"):
+            board = self.db.leaderboard
+            # 順位は順位表の dense rank（同点は同順位）
+            for r in board.top_k(len(board)):
+                print(f"  {board.rank_of(r[0])}位: {r[1]} ({r[2]}pt)")
 
     def _show_final_result(self):
         print("\n👑 最終結果")
-        for idx, r in enumerate(self.db.get_ranking()):
-            print(f"{idx+1}位: {r[1]} ({r[2]}pt)")
\ No newline at end of file
+        board = self.db.leaderboard
+        for r in board.top_k(len(board)):
+            print(f"{board.rank_of(r[0])}位: {r[1]} ({r[2]}pt)")
\ No newline at end of file
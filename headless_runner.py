@@ -0,0 +1,99 @@
+# headless_runner.py
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from db_manager import DBManager
+from db_pool import create_pool
+from main import play_game
+from memory_db import MemoryDBManager
+from utils import ScriptedInput, set_input_provider
+
+PLAYER_NAME = "Hero"
+
+
+def _open_worker_db(worker_no, backend, db_dir):
+    # ワーカー（プロセス）ごとに別のDBを使い、ゲーム同士がロックを取り合わないようにする
+    if backend == "memory":
+        return MemoryDBManager()
+    if backend == "sqlite":
+        path = os.path.join(db_dir, f"worker_{worker_no}.sqlite3")
+        return DBManager(pool=create_pool("sqlite", sqlite_path=path))
+    # PostgreSQLはDBを増やさず、ワーカーごとのセッションで分ける
+    return DBManager(pool=create_pool("postgres"), session_id=f"headless_{worker_no}")
+
+
+def _random_policy(rng):
+    # メニューの番号はどれも 0〜4 に収まる（範囲外は各画面の既定の行動になる）
+    return lambda prompt: str(rng.randint(0, 4))
+
+
+def run_worker(worker_no, game_seeds, backend, db_dir, script=()):
+    """game_seeds の数だけゲームを最後まで行い、(ワーカー番号, 所要秒, [(seed, 最終順位)]) を返す。"""
+    db = _open_worker_db(worker_no, backend, db_dir)
+    results = []
+    start = time.perf_counter()
+    with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+        for seed in game_seeds:
+            # 同じシードなら、どのワーカーで実行しても同じ結果になる
+            random.seed(seed)
+            set_input_provider(ScriptedInput([PLAYER_NAME, *script], policy=_random_policy(random.Random(seed))))
+            # 持ち時間では打ち切らない（CPUの探索が負荷で変わらないように）
+            play_game(db, cpu_time_budget=None)
+            results.append((seed, db.get_ranking()))
+    set_input_provider(None)
+    return worker_no, time.perf_counter() - start, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="入力を自動化したゲームを複数プロセスで並列に実行します")
+    parser.add_argument("--games", type=int, default=100, help="実行するゲーム数")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="プロセス数")
+    parser.add_argument("--backend", choices=["memory", "sqlite", "postgres"], default="memory", help="ワーカーが使うDB")
+    parser.add_argument("--seed", type=int, default=0, help="最初のゲームのシード（以降は+1ずつ）")
+    parser.add_argument("--script", help="最初に順に入力する内容（1行1入力）のファイル。尽きたらランダムに選ぶ")
+    args = parser.parse_args()
+
+    script = ()
+    if args.script:
+        with open(args.script, encoding="utf-8") as f:
+            script = tuple(line.rstrip("\n") for line in f)
+
+    workers = max(1, min(args.workers, args.games))
+    seeds = list(range(args.seed, args.seed + args.games))
+    db_dir = tempfile.mkdtemp(prefix="headless_")
+    print(f"{args.games} ゲームを {workers} プロセスで実行します（DB: {args.backend}）...")
+    try:
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(run_worker, w, seeds[w::workers], args.backend, db_dir, script)
+                for w in range(workers)
+            ]
+            outcomes = [f.result() for f in futures]
+        elapsed = time.perf_counter() - start
+    finally:
+        shutil.rmtree(db_dir, ignore_errors=True)
+
+    ranks, winners = Counter(), Counter()
+    for _, _, results in outcomes:
+        for _, ranking in results:
+            names = [r[1] for r in ranking]
+            winners[names[0]] += 1
+            ranks[names.index(PLAYER_NAME) + 1] += 1
+
+    print(f"\n⏱️ {elapsed:.2f} 秒 / {args.games / elapsed:.1f} ゲーム/秒")
+    for worker_no, worker_time, results in sorted(outcomes):
+        print(f"  ワーカー{worker_no}: {len(results)} ゲーム {worker_time:.2f} 秒 ({len(results) / worker_time:.1f} ゲーム/秒)")
+    print(f"\n{PLAYER_NAME} の順位: " + ", ".join(f"{r}位 {ranks[r]}回" for r in sorted(ranks)))
+    print("優勝: " + ", ".join(f"{name} {count}回" for name, count in winners.most_common()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# journal.py
+import json
+import os
+import threading
+
+from config import PVE_JOURNAL_FLUSH_EVERY
+
+
+class WriteBehindJournal:
+    """
+    プレイヤー状態の追記専用ジャーナル（PvEの被弾ごとの保存用）。
+    - record() はローカルファイルへ1行追記するだけ（コミットしない）
+    - flush_every 件たまるか flush() を呼んだ時に、プレイヤーごとの最新状態だけをまとめてDBへ書く
+    - 書き戻す前にプロセスが落ちても、次に DBManager を作った時に replay() で反映する
+    """
+
+    def __init__(self, path, flush_every=PVE_JOURNAL_FLUSH_EVERY):
+        self.path = path
+        self.flush_every = max(1, int(flush_every))
+        self._pending = {}  # player_id -> (hp, mp, exp, status_effect, status_turn)
+        self._records = 0
+        self._file = None
+        self._lock = threading.Lock()
+        self.replayed = False  # 起動時の replay を済ませたか（DBManager が使う）
+
+    def record(self, player_id, hp, mp, exp, status_effect=None, status_turn=0):
+        """追記する。書き戻しが必要な件数に達したら True を返す。"""
+        state = (hp, mp, exp, status_effect, status_turn)
+        line = json.dumps([player_id, *state], ensure_ascii=False)
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line + "\n")
+            # OSへ渡すだけ（fsyncはしない）。プロセスが落ちても残る
+            self._file.flush()
+            self._pending[player_id] = state
+            self._records += 1
+            return self._records >= self.flush_every
+
+    def take_pending(self):
+        """書き戻す行 [(hp, mp, exp, status_effect, status_turn, player_id), ...] を取り出す。"""
+        with self._lock:
+            rows = [state + (pid,) for pid, state in self._pending.items()]
+            self._pending = {}
+            self._records = 0
+            return rows
+
+    def truncate(self):
+        """DBへの書き戻しが確定した後に呼び、ジャーナルを空にする。"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def discard(self):
+        """書き戻さずに捨てる（ゲームデータを初期化した時など）。"""
+        self.take_pending()
+        self.truncate()
+
+    def read_existing(self):
+        """前回のプロセスが書き戻せなかった分を、プレイヤーごとの最新状態にまとめて返す。"""
+        if not os.path.exists(self.path):
+            return []
+        latest = {}
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    pid, *state = json.loads(line)
+                except ValueError:
+                    # 書き込み途中で落ちた最終行は捨てる
+                    continue
+                latest[pid] = tuple(state)
+        return [state + (pid,) for pid, state in latest.items()]
+
+
+_journals = {}
+_journals_lock = threading.Lock()
+
+
+def get_journal(path):
+    """同じファイルを指すジャーナルはプロセス内で1つにする。"""
+    with _journals_lock:
+        journal = _journals.get(path)
+        if journal is None:
+            journal = WriteBehindJournal(path)
+            _journals[path] = journal
+        return journal
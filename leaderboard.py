@@ -0,0 +1,97 @@
+# leaderboard.py
+from bisect import bisect_left, insort
+import threading
+
+
+class Leaderboard:
+    """
+    スコア順位表をメモリ上で増分管理する（DBManager がスコア更新のたびに反映する）。
+    - 並びは get_ranking と同じ score の降順（同点は player_id の昇順）
+    - rank_of は同点を同順位とする dense rank（1, 1, 2, ...）
+    - rank_of は O(log n)、top_k / bottom_k は O(log n + k)
+    - 更新は二分探索で位置を探し、ソート済みリストへ挿入/削除する。挿入/削除は要素をずらすので O(n) だが、
+      ずらすのは memmove 1回なので数万人程度までは木構造より速い（それ以上に増えるなら平衡木などに替える）
+    """
+
+    def __init__(self, rows=()):
+        # rows: (player_id, player_name, score)
+        self._entries = []  # (-score, player_id) の昇順 = 順位順
+        self._players = {}  # player_id -> (player_name, score)
+        self._scores = []  # 異なるスコアを -score の昇順で（dense rank 用）
+        self._score_counts = {}  # score -> 人数
+        self._lock = threading.Lock()
+        for pid, name, score in rows:
+            self._insert(pid, name, score)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _insert(self, pid, name, score):
+        insort(self._entries, (-score, pid))
+        self._players[pid] = (name, score)
+        count = self._score_counts.get(score, 0)
+        if count == 0:
+            insort(self._scores, -score)
+        self._score_counts[score] = count + 1
+
+    def _remove(self, pid):
+        name, score = self._players.pop(pid)
+        i = bisect_left(self._entries, (-score, pid))
+        del self._entries[i]
+        count = self._score_counts[score] - 1
+        if count == 0:
+            del self._score_counts[score]
+            del self._scores[bisect_left(self._scores, -score)]
+        else:
+            self._score_counts[score] = count
+        return name
+
+    def set_score(self, pid, name, score):
+        with self._lock:
+            if pid in self._players:
+                self._remove(pid)
+            self._insert(pid, name, score)
+
+    def add_score(self, pid, delta):
+        with self._lock:
+            if pid not in self._players:
+                return
+            score = self._players[pid][1]
+            name = self._remove(pid)
+            self._insert(pid, name, score + delta)
+
+    def reset_scores(self):
+        """全員のスコアを0にする（reset_points 用）。"""
+        with self._lock:
+            self._players = {pid: (name, 0) for pid, (name, _) in self._players.items()}
+            self._entries = sorted((0, pid) for pid in self._players)
+            self._scores = [0] if self._players else []
+            self._score_counts = {0: len(self._players)} if self._players else {}
+
+    def clear(self):
+        with self._lock:
+            self._entries, self._players, self._scores, self._score_counts = [], {}, [], {}
+
+    def _row(self, entry):
+        pid = entry[1]
+        return (pid, self._players[pid][0], -entry[0])
+
+    def top_k(self, n):
+        """上位 n 人を (player_id, player_name, score) で返す。"""
+        with self._lock:
+            return [self._row(e) for e in self._entries[:max(0, n)]]
+
+    def bottom_k(self, n):
+        """下位 n 人を順位順（get_ranking()[-n:] と同じ並び）で返す。"""
+        with self._lock:
+            if n <= 0:
+                return []
+            return [self._row(e) for e in self._entries[-n:]]
+
+    def rank_of(self, pid):
+        """dense rank（同点は同順位）。いなければ None。"""
+        with self._lock:
+            info = self._players.get(pid)
+            if info is None:
+                return None
+            return bisect_left(self._scores, -info[1]) + 1
@@ -0,0 +1,71 @@
+# loot_table.py
+"""
+重み付きの抽選（PvEのドロップ・敗者救済の支援物資）を Walker の alias method で行う抽選表。
+- 表は作る時に1回だけ O(n) で組み立て（Vose の方法）、以降の1回の抽選は O(1)
+- 1回の抽選で使う乱数は rng.random() の1回だけ（ゲームの random を渡せばシード固定で同じ結果になる）
+- アイテムの表は MasterData.loot_table() が作って使い回す（マスタを読み直すと作り直される）
+"""
+import random
+
+
+def rarity_weight(rarity, rarity_weights):
+    """
+    rarity_weights[i] が ★(i+1) の重み。最後の値はそれ以外のレア度（それ以上も、0以下や NULL も）に使う。
+    （元の if rar == 1: ... elif ...: else: の分岐と同じ割り当て）
+    """
+    if rarity in range(1, len(rarity_weights) + 1):
+        return rarity_weights[rarity - 1]
+    return rarity_weights[-1]
+
+
+class LootTable:
+    def __init__(self, entries, weights):
+        if len(entries) != len(weights):
+            raise ValueError("entries と weights の長さが違います")
+        total = sum(weights)
+        if not entries or total <= 0 or any(w < 0 for w in weights):
+            raise ValueError("重みは0以上で、合計が正である必要があります")
+        self.entries = tuple(entries)
+        n = len(self.entries)
+
+        # 各列の高さを平均1に揃え、1に足りない列の残りを1を超える列から埋める
+        scaled = [w * n / total for w in weights]
+        self._prob = [1.0] * n
+        self._alias = list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self._prob[s] = scaled[s]
+            self._alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            (small if scaled[l] < 1.0 else large).append(l)
+        # 残った列は誤差を除けば高さ1（self._prob の初期値のまま）
+
+    @classmethod
+    def from_items(cls, items, rarity_weights):
+        """items: (item_id, item_name, rarity, ...) の行。レア度ごとの重みで表を作る（アイテムが無ければ None）。"""
+        items = tuple(items)
+        if not items:
+            return None
+        return cls(items, [rarity_weight(r[2], rarity_weights) for r in items])
+
+    def __len__(self):
+        return len(self.entries)
+
+    def draw(self, rng=None):
+        x = (rng or random).random() * len(self.entries)
+        i = int(x)
+        return self.entries[i if x - i < self._prob[i] else self._alias[i]]
+
+    def draw_many(self, k, rng=None):
+        """k 個をまとめて引く（重複あり）。シミュレーションなどで大量に引く時用。"""
+        rand = (rng or random).random
+        n = len(self.entries)
+        entries, prob, alias = self.entries, self._prob, self._alias
+        result = []
+        for _ in range(k):
+            x = rand() * n
+            i = int(x)
+            result.append(entries[i if x - i < prob[i] else alias[i]])
+        return result
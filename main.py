@@ -1,16 +1,44 @@
 # main.py
-from db_manager import DBManager
+import sys
+from config import DB_QUERY_PROFILE, PVP_CPU_TIME_BUDGET, TRACE_DIR
+from db_manager import get_shared_db
+import query_profiler
+import tracing
 from models import Player
 from game_manager import GameManager
-from utils import safe_input
+from utils import bind_game_db, safe_input
 
-def main():
-    db = DBManager()
+def main(session_id=None):
+    # session_id を指定すると、同じDBの他のゲームに触れずに遊ぶ（初期化もそのセッション分だけ）
+    profiler = query_profiler.enable() if DB_QUERY_PROFILE else None
+    # 人が遊ぶ時だけ、CPUの探索に持ち時間の上限も付ける（遅い環境でも待たされないように）
+    play_game(get_shared_db(session_id), cpu_time_budget=PVP_CPU_TIME_BUDGET)
+    if profiler is not None:
+        print(profiler.report())
+
+def play_game(db, cpu_time_budget=None):
+    """
+    db で1ゲームを最初から最後まで行う（入力は utils.safe_input 経由）。終わった GameManager を返す。
+    cpu_time_budget: CPUの探索の持ち時間（秒）。None なら局面数だけで打ち切り、同じシードなら同じ結果になる
+    """
+    bind_game_db(db)
+    tracer = tracing.start() if TRACE_DIR else None
+    try:
+        with tracing.span("play_game"):
+            return _play(db, cpu_time_budget)
+    finally:
+        # 'exit' で途中終了した場合も、そこまでの分を書き出す
+        if tracer is not None:
+            tracing.stop()
+            print(f"🧭 トレースを書き出しました: {tracer.write(tracing.trace_path(TRACE_DIR, db.session_id))}")
+
+def _play(db, cpu_time_budget):
     print("RPG演習 Start")
     
     # ゲーム開始時に全データを初期化（クリーンな状態にする）
     print("🔄 ゲームデータを初期化中...")
-    db.reset_all_game_data()
+    with tracing.span("reset_all_game_data"):
+        db.reset_all_game_data()
     print("✅ 初期化完了")
 
     name = safe_input("名前: ")
@@ -21,9 +49,12 @@ def main():
     print("👥 対戦相手を作成中...")
     db.ensure_cpu_players(["Player2", "Player3", "Player4"])
 
-    manager = GameManager(player, db)
+    manager = GameManager(player, db, cpu_time_budget)
     # Ctrl+Cは捕まえない（Pythonプログラム自体を停止する）
-    manager.run_game_loop()
+    with tracing.span("run_game_loop"):
+        manager.run_game_loop()
+    return manager
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # python main.py [セッションID]
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
\ No newline at end of file
@@ -0,0 +1,83 @@
+# master_data.py
+import re
+from types import MappingProxyType
+
+from loot_table import LootTable
+
+
+class MasterData:
+    """
+    items / skills / monsters（ゲーム中に変わらないマスタ）の読み取り専用スナップショット。
+    DBManager._init_db で1回だけ読み込み、マスタを書き換えた時は作り直す。
+    """
+
+    def __init__(self, items, skills, monsters, like_ignores_case=True):
+        # items: item_id, item_name, rarity, effect_type, effect_value, description
+        self.items = tuple(tuple(r) for r in items)
+        # skills: skill_id, skill_name, mp_cost, power, description, is_aoe
+        self.skills = tuple(tuple(r) for r in skills)
+        # monsters: monster_id, monster_name, hp, attack, agility
+        self.monsters = tuple(tuple(r) for r in monsters)
+
+        item_ids = {}
+        for r in self.items:
+            item_ids.setdefault(r[1], r[0])  # 同名があれば LIMIT 1 と同じく最初の1件
+        self._item_id_by_name = MappingProxyType(item_ids)
+
+        monster_ids = {}
+        for r in self.monsters:
+            monster_ids.setdefault(r[1], r[0])
+        self._monster_id_by_name = MappingProxyType(monster_ids)
+
+        # effect_type LIKE 'prefix%' と同じ判定にする（SQLite の LIKE は ASCII の大文字小文字を区別しない）
+        self._like_flags = re.DOTALL | (re.IGNORECASE | re.ASCII if like_ignores_case else 0)
+        self._like_patterns = {}
+        self._items_by_type = {}
+        self._loot_tables = {}
+
+    @classmethod
+    def load(cls, cur, like_ignores_case=True):
+        cur.execute("SELECT item_id, item_name, rarity, effect_type, effect_value, description FROM items ORDER BY item_id")
+        items = cur.fetchall()
+        cur.execute("SELECT skill_id, skill_name, mp_cost, power, description, is_aoe FROM skills ORDER BY skill_id")
+        skills = cur.fetchall()
+        cur.execute("SELECT monster_id, monster_name, hp, attack, agility FROM monsters ORDER BY monster_id")
+        monsters = cur.fetchall()
+        return cls(items, skills, monsters, like_ignores_case)
+
+    def effect_type_matches(self, effect_type, type_prefix):
+        """effect_type LIKE 'type_prefix%' と同じ判定（'_' は任意の1文字、'%' は任意の文字列。NULL は一致しない）。"""
+        if effect_type is None:
+            return False
+        pattern = self._like_patterns.get(type_prefix)
+        if pattern is None:
+            pattern = re.compile(
+                "".join("." if c == "_" else ".*" if c == "%" else re.escape(c) for c in type_prefix),
+                self._like_flags,
+            )
+            self._like_patterns[type_prefix] = pattern
+        return pattern.match(effect_type) is not None
+
+    def items_by_type(self, type_prefix):
+        """effect_type LIKE 'type_prefix%' のアイテムの (item_id, item_name, rarity) 一覧。"""
+        rows = self._items_by_type.get(type_prefix)
+        if rows is None:
+            rows = tuple(
+                (r[0], r[1], r[2]) for r in self.items
+                if self.effect_type_matches(r[3], type_prefix)
+            )
+            self._items_by_type[type_prefix] = rows
+        return rows
+
+    def loot_table(self, type_prefix, rarity_weights):
+        """items_by_type(type_prefix) をレア度の重みで引く LootTable（アイテムが無ければ None）。"""
+        key = (type_prefix, tuple(rarity_weights))
+        if key not in self._loot_tables:
+            self._loot_tables[key] = LootTable.from_items(self.items_by_type(type_prefix), key[1])
+        return self._loot_tables[key]
+
+    def item_id_by_name(self, item_name):
+        return self._item_id_by_name.get(item_name)
+
+    def monster_id_by_name(self, monster_name):
+        return self._monster_id_by_name.get(monster_name)
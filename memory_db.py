@@ -0,0 +1,415 @@
+# memory_db.py
+from __future__ import annotations
+
+from contextlib import contextmanager
+from pathlib import Path
+import random
+import sqlite3
+
+from config import BASE_HP, BASE_MP, HP_PER_LEVEL
+from leaderboard import Leaderboard
+from master_data import MasterData
+
+
+_MISSING = object()  # 取り消し用の記録で「元は行が無かった」を表す
+_ALL = (None, None)  # 取り消し用の記録で「全消去する前のテーブル一式」のキー
+
+
+def _load_master_data():
+    # マスタの定義は seed_sqlite.sql を唯一の正とし、起動時に1回だけメモリ上のSQLiteで読み込む
+    sql_dir = Path(__file__).resolve().parent / "sql"
+    conn = sqlite3.connect(":memory:")
+    try:
+        conn.executescript((sql_dir / "schema_sqlite.sql").read_text(encoding="utf-8"))
+        conn.executescript((sql_dir / "seed_sqlite.sql").read_text(encoding="utf-8"))
+        cur = conn.cursor()
+        try:
+            return MasterData.load(cur)
+        finally:
+            cur.close()
+    finally:
+        conn.close()
+
+
+class MemoryDBManager:
+    """
+    全テーブルをPythonのdictで持つ DBManager 互換のバックエンド（config.DB_BACKEND = 'memory'）。
+    - ゲーム中はSQLの解析もディスクI/Oも行わない（大量シミュレーション・動作確認用）
+    - 戻り値の形（タプルの列順など）は DBManager と揃えている
+    - プロセス内・1スレッドからの利用を想定（プロセスが終わればデータは消える）
+    - インスタンスごとに別のDBなので、session_id は DBManager との互換のために持つだけ
+    """
+
+    backend = "memory"
+
+    def __init__(self, session_id=None):
+        self.session_id = session_id
+        self._master = _load_master_data()
+        self._items_by_id = {r[0]: r for r in self._master.items}
+        self._skills_by_id = {r[0]: r for r in self._master.skills}
+        self._tx_stack = []
+        self._leaderboard = None
+        self._clear_game_tables()
+
+    def _clear_game_tables(self):
+        # players: player_id -> {列名: 値}。名前からの引き当て用に二次索引を持つ
+        self._players = {}
+        self._player_id_by_name = {}
+        self._player_items = {}  # player_id -> {item_id: quantity}
+        self._player_skills = {}  # player_id -> [skill_id, ...]（習得順）
+        self._pve_logs = []  # (log_id, player_id, monster_id, is_win)
+        self._pvp_battles = {}  # battle_id -> host player_id
+        self._pvp_results = {}  # (battle_id, player_id) -> point
+        self._seq = {'players': 0, 'pvp_battles': 0, 'pve_logs': 0}
+
+    # --- DBManager と同じインターフェース（接続・トランザクション） ---
+    def release_connection(self):
+        pass
+
+    @contextmanager
+    def connection_scope(self):
+        yield self
+
+    @property
+    def master_data(self):
+        return self._master
+
+    def invalidate_master_data(self):
+        # マスタはプロセス内で変更されないので、読み直す必要はない
+        pass
+
+    @property
+    def leaderboard(self):
+        if self._leaderboard is None:
+            self._leaderboard = Leaderboard(self.get_ranking())
+        return self._leaderboard
+
+    def invalidate_leaderboard(self):
+        self._leaderboard = None
+
+    # トランザクション中の取り消し用に、書き換える行の元の値だけを記録する（undo log）
+    # _tx_stack: 入れ子の段ごとに {(テーブル名, キー): 元の値}。1段につき同じ行は最初の1回だけ記録する
+    def _touch(self, table, key):
+        """table[key] を書き換える前に呼ぶ（トランザクションの外では何もしない）。"""
+        if not self._tx_stack:
+            return
+        undo = self._tx_stack[-1]
+        if _ALL in undo or (table, key) in undo:
+            return
+        if table == '_pve_logs':
+            undo[(table, key)] = len(self._pve_logs)  # 追記だけなので長さを覚えれば戻せる
+            return
+        old = getattr(self, table).get(key, _MISSING)
+        if isinstance(old, dict):
+            old = dict(old)
+        elif isinstance(old, list):
+            old = list(old)
+        undo[(table, key)] = old
+
+    def _writable_player(self, player_id):
+        p = self._players.get(player_id)
+        if p is not None:
+            self._touch('_players', player_id)
+        return p
+
+    def _tables(self):
+        return (self._players, self._player_id_by_name, self._player_items, self._player_skills,
+                self._pve_logs, self._pvp_battles, self._pvp_results, self._seq)
+
+    def _rollback(self, undo):
+        tables = undo.get(_ALL)
+        if tables is not None:
+            # 全消去の前のテーブルに戻してから、それより前に記録した行を戻す
+            (self._players, self._player_id_by_name, self._player_items, self._player_skills,
+             self._pve_logs, self._pvp_battles, self._pvp_results, self._seq) = tables
+        for (table, key), old in undo.items():
+            if table is None:
+                continue
+            if table == '_pve_logs':
+                del self._pve_logs[old:]
+            elif old is _MISSING:
+                getattr(self, table).pop(key, None)
+            else:
+                getattr(self, table)[key] = old
+
+    @contextmanager
+    def transaction(self):
+        """
+        DBManager.transaction と同じく、例外が出たらブロック内の変更を元に戻す（入れ子可）。
+        書き換えた行の元の値だけを記録するので、コストはブロック内で書き換えた行数に比例する。
+        """
+        self._tx_stack.append({})
+        try:
+            yield self
+        except BaseException:
+            self._rollback(self._tx_stack.pop())
+            self._leaderboard = None
+            raise
+        undo = self._tx_stack.pop()
+        if self._tx_stack:
+            # 内側の記録は外側へ引き継ぐ（外側で例外が出たら内側の変更も戻す）
+            outer = self._tx_stack[-1]
+            if _ALL not in outer:
+                for k, old in undo.items():
+                    outer.setdefault(k, old)
+
+    def explain(self, sql, params=()):
+        # SQLを実行しないので実行計画もない
+        return []
+
+    # --- リセット ---
+    def reset_game_data(self):
+        """ゲームを中止した時の初期化（プレイヤー/ログ/対戦結果を全消去）。"""
+
+    def reset_all_game_data(self):
+        if self._tx_stack and _ALL not in self._tx_stack[-1]:
+            # テーブルは作り直すので、元のテーブルをそのまま取っておけば戻せる
+            self._tx_stack[-1][_ALL] = self._tables()
+        self._clear_game_tables()
+        if self._leaderboard is not None:
+            self._leaderboard.clear()
+
+    def reset_points(self):
+        for pid, p in self._players.items():
+            self._touch('_players', pid)
+            p['score'] = 0
+            p['bounty'] = 0
+        for battle_id in self._pvp_battles:
+            self._touch('_pvp_battles', battle_id)
+        for key in self._pvp_results:
+            self._touch('_pvp_results', key)
+        self._pvp_battles.clear()
+        self._pvp_results.clear()  # pvp_battles 削除時の CASCADE 相当
+        if self._leaderboard is not None:
+            self._leaderboard.reset_scores()
+
+    # --- プレイヤー ---
+    def ensure_cpu_players(self, cpu_names=None):
+        if cpu_names is None:
+            cpu_names = ["CPU_A", "CPU_B", "CPU_C"]
+        return [self.get_or_create_player(name) for name in cpu_names]
+
+    @staticmethod
+    def _player_row(p):
+        return (p['player_id'], p['player_name'], p['hp'], p['mp'], p['exp'], p['agility'],
+                p['score'], p['status_effect'], p['status_turn'], p['bounty'])
+
+    def get_or_create_player(self, name):
+        pid = self._player_id_by_name.get(name)
+        if pid is None:
+            self._touch('_seq', 'players')
+            self._seq['players'] += 1
+            pid = self._seq['players']
+            self._touch('_players', pid)
+            self._touch('_player_id_by_name', name)
+            self._players[pid] = {
+                'player_id': pid, 'player_name': name, 'hp': 100, 'mp': 50, 'exp': 0, 'agility': 10,
+                'score': 0, 'status_effect': None, 'status_turn': 0, 'bounty': 0,
+            }
+            self._player_id_by_name[name] = pid
+            if self._leaderboard is not None:
+                self._leaderboard.set_score(pid, name, 0)
+        return self._player_row(self._players[pid])
+
+    def update_player_status(self, player_id, hp, mp, exp, status_effect=None, status_turn=0):
+        p = self._writable_player(player_id)
+        if p:
+            p.update(hp=hp, mp=mp, exp=exp, status_effect=status_effect, status_turn=status_turn)
+
+    def journal_player_status(self, player_id, hp, mp, exp, status_effect=None, status_turn=0):
+        # メモリ上なので書き込みを遅らせる意味がない
+        self.update_player_status(player_id, hp, mp, exp, status_effect, status_turn)
+
+    def flush_journal(self):
+        pass
+
+    def update_bounty(self, player_id, new_bounty):
+        p = self._writable_player(player_id)
+        if p:
+            p['bounty'] = new_bounty
+
+    def register_pvp_result(self, battle_id, player_id, point):
+        p = self._writable_player(player_id)
+        if p:
+            p['score'] += point
+            if self._leaderboard is not None:
+                self._leaderboard.add_score(player_id, point)
+        if battle_id:
+            key = (battle_id, player_id)
+            self._touch('_pvp_results', key)
+            self._pvp_results[key] = (self._pvp_results.get(key) or 0) + point
+
+    def settle_pvp_battle(self, battle_id, awards, bounties):
+        with self.transaction():
+            for pid, pt in awards.items():
+                self.register_pvp_result(battle_id, pid, pt)
+            for pid, b in bounties.items():
+                self.update_bounty(pid, b)
+
+    def create_pvp_battle(self, host_player_id):
+        self._touch('_seq', 'pvp_battles')
+        self._seq['pvp_battles'] += 1
+        battle_id = self._seq['pvp_battles']
+        self._touch('_pvp_battles', battle_id)
+        self._pvp_battles[battle_id] = host_player_id
+        return battle_id
+
+    def log_pve(self, player_id, monster_name, is_win):
+        monster_id = self._master.monster_id_by_name(monster_name) if monster_name else None
+        self._touch('_seq', 'pve_logs')
+        self._touch('_pve_logs', None)
+        self._seq['pve_logs'] += 1
+        self._pve_logs.append((self._seq['pve_logs'], player_id, monster_id, bool(is_win)))
+
+    def get_ranking(self):
+        # sortedは安定なので、同点は登録順 = player_id 順（DBManager の ORDER BY と同じ）
+        players = sorted(self._players.values(), key=lambda p: -p['score'])
+        return [(p['player_id'], p['player_name'], p['score']) for p in players]
+
+    def get_dense_ranking(self, limit=None):
+        rows, rank, prev = [], 0, None
+        for pid, name, score in self.get_ranking():
+            if score != prev:
+                rank, prev = rank + 1, score
+            rows.append((pid, name, score, rank))
+        return rows if limit is None else rows[:limit]
+
+    # --- スキル ---
+    def get_player_skills(self, player_id):
+        return [self._skills_by_id[sid] for sid in self._player_skills.get(player_id, [])]
+
+    def get_learnable_skills(self, player_id):
+        learned = set(self._player_skills.get(player_id, []))
+        cands = [s for s in self._master.skills if s[0] not in learned]
+        return random.sample(cands, min(3, len(cands)))
+
+    def learn_skill(self, player_id, skill_id):
+        if skill_id in self._player_skills.get(player_id, ()):
+            # DBでは主キー違反になる
+            raise ValueError(f"既に習得済みのスキルです: player_id={player_id}, skill_id={skill_id}")
+        self._touch('_player_skills', player_id)
+        skills = self._player_skills.setdefault(player_id, [])
+        skills.append(skill_id)
+
+    # --- アイテム ---
+    def get_item_id_by_name(self, item_name):
+        return self._master.item_id_by_name(item_name)
+
+    def has_item_effect(self, player_id, effect_type):
+        for item_id, qty in self._player_items.get(player_id, {}).items():
+            if qty > 0 and self._items_by_id[item_id][3] == effect_type:
+                return True
+        return False
+
+    def add_item(self, player_id, item_id):
+        self._touch('_player_items', player_id)
+        items = self._player_items.setdefault(player_id, {})
+        items[item_id] = items.get(item_id, 0) + 1
+
+    def get_player_items(self, player_id, effect_filter=None):
+        rows = []
+        for item_id, qty in self._player_items.get(player_id, {}).items():
+            if qty <= 0:
+                continue
+            item = self._items_by_id[item_id]
+            if effect_filter and not self._master.effect_type_matches(item[3], effect_filter):
+                continue
+            rows.append(item + (qty,))
+        return rows
+
+    def consume_item(self, player_id, item_id):
+        items = self._player_items.get(player_id)
+        if items and item_id in items:
+            self._touch('_player_items', player_id)
+            items[item_id] -= 1
+
+    def get_items_by_type(self, type_prefix):
+        return list(self._master.items_by_type(type_prefix))
+
+    def get_loot_table(self, type_prefix, rarity_weights):
+        return self._master.loot_table(type_prefix, rarity_weights)
+
+    # --- PvPSystem用 ---
+    def get_pvp_participants_raw(self):
+        return [
+            (p['player_id'], p['player_name'], p['hp'], p['agility'], p['status_effect'], p['status_turn'],
+             p['exp'], p['mp'], p['score'], p['bounty'])
+            for p in self._players.values() if p['hp'] > 0
+        ]
+
+    def get_player_status_row(self, player_id):
+        p = self._players.get(player_id)
+        return (p['hp'], p['status_effect'], p['status_turn']) if p else (0, None, 0)
+
+    def get_player_bounty(self, player_id):
+        p = self._players.get(player_id)
+        return p['bounty'] if p else 0
+
+    def update_player_effect(self, player_id, hp, eff, turn):
+        p = self._writable_player(player_id)
+        if p:
+            p.update(hp=hp, status_effect=eff, status_turn=turn)
+
+    def damage_player_hp(self, player_id, dmg):
+        p = self._writable_player(player_id)
+        if p:
+            p['hp'] -= dmg
+
+    def apply_area_damage(self, attacker_id, damage, defense_map=None, effect=None, target_ids=None):
+        if damage <= 0:
+            return []
+        defense_map = defense_map or {}
+        wanted = None if target_ids is None else set(target_ids)
+        hits = []
+        for p in self._players.values():
+            pid = p['player_id']
+            if wanted is not None:
+                if pid not in wanted:
+                    continue
+            elif p['hp'] <= 0 or pid == attacker_id or p['status_effect'] == '隠密':
+                continue
+            dealt = max(1, damage - defense_map.get(pid, 0))
+            self._touch('_players', pid)
+            p['hp'] -= dealt
+            if effect:
+                p.update(status_effect=effect[0], status_turn=effect[1])
+            hits.append((pid, p['player_name'], dealt, p['hp']))
+        return sorted(hits)
+
+    def set_player_effect(self, player_id, eff, turn):
+        p = self._writable_player(player_id)
+        if p:
+            p.update(status_effect=eff, status_turn=turn)
+
+    def update_player_mp(self, player_id, mp):
+        p = self._writable_player(player_id)
+        if p:
+            p['mp'] = mp
+
+    def update_players_battle_state(self, rows):
+        for hp, mp, eff, turn, pid in rows:
+            p = self._writable_player(pid)
+            if p:
+                p.update(hp=hp, mp=mp, status_effect=eff, status_turn=turn)
+
+    def get_enemies_list(self, my_id, allow_stealth=False):
+        return [
+            {'id': p['player_id'], 'name': p['player_name'], 'hp': p['hp'], 'effect': p['status_effect']}
+            for p in self._players.values()
+            if p['hp'] > 0 and p['player_id'] != my_id and (allow_stealth or p['status_effect'] != '隠密')
+        ]
+
+    def get_player_name(self, player_id):
+        p = self._players.get(player_id)
+        return p['player_name'] if p else "?"
+
+    # --- ゲーム進行用ユーティリティ ---
+    def full_recover_all_players(self, level_up_exp: int, base_hp: int = BASE_HP, hp_per_level: int = HP_PER_LEVEL,
+                                 base_mp: int = BASE_MP, player_ids=None):
+        wanted = None if player_ids is None else set(player_ids)
+        for p in self._players.values():
+            if wanted is not None and p['player_id'] not in wanted:
+                continue
+            lvl = (int(p['exp']) // int(level_up_exp)) + 1
+            self._touch('_players', p['player_id'])
+            p.update(hp=int(base_hp) + (lvl * int(hp_per_level)), mp=int(base_mp), status_effect=None, status_turn=0)
@@ -0,0 +1,130 @@
+# migrations.py
+"""
+スキーマのバージョン管理。
+- 適用済みのバージョンは schema_version テーブルに記録する
+- 最新のDBなら起動時は SELECT 1回で終わり、DDLやシードは流さない
+- 各マイグレーションは既存DBに何度流しても安全なように書く（IF NOT EXISTS / 列の存在確認）
+"""
+import sqlite3
+
+import psycopg2
+
+# pg_advisory_xact_lock 用のキー（同時に起動した複数プロセスのマイグレーションを直列化する）
+MIGRATION_LOCK_ID = 73110001
+
+
+def _v1_baseline(db, cur):
+    # テーブル/インデックス（schema*.sql）と初期マスタ
+    db._apply_schema(cur)
+    db._seed_if_needed(cur)
+
+
+_PLAYER_COLUMNS = "player_id, player_name, hp, mp, exp, agility, score, status_effect, status_turn, bounty"
+
+
+def _v2_session_partition(db, cur):
+    # players / pvp_battles に session_id を足し、プレイヤー名の一意制約を (session_id, player_name) に変える
+    if db.backend == "postgres":
+        db._check_add_column(cur, "players", "session_id", "VARCHAR(64) NOT NULL DEFAULT ''")
+        cur.execute("ALTER TABLE players DROP CONSTRAINT IF EXISTS players_player_name_key")
+    else:
+        cur.execute("SELECT 1 FROM pragma_table_info('players') WHERE name = 'session_id'")
+        if not cur.fetchone():
+            # SQLiteは列の UNIQUE を外せないので作り直す（migrate() が外部キーを止めているので子テーブルは消えない）
+            print("⚠️ DBアップデート: players を作り直して session_id を追加")
+            cur.execute(
+                """
+                CREATE TABLE players_v2 (
+                  player_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  player_name TEXT NOT NULL,
+                  hp INTEGER DEFAULT 100,
+                  mp INTEGER DEFAULT 50,
+                  exp INTEGER DEFAULT 0,
+                  agility INTEGER DEFAULT 10,
+                  score INTEGER DEFAULT 0,
+                  status_effect TEXT DEFAULT NULL,
+                  status_turn INTEGER DEFAULT 0,
+                  bounty INTEGER DEFAULT 0,
+                  session_id TEXT NOT NULL DEFAULT ''
+                )
+                """
+            )
+            cur.execute(f"INSERT INTO players_v2 ({_PLAYER_COLUMNS}) SELECT {_PLAYER_COLUMNS} FROM players")
+            cur.execute("DROP TABLE players")
+            cur.execute("ALTER TABLE players_v2 RENAME TO players")
+    db._check_add_column(
+        cur, "pvp_battles", "session_id", "VARCHAR(64) NOT NULL DEFAULT ''" if db.backend == "postgres" else "TEXT NOT NULL DEFAULT ''"
+    )
+
+    # セッション内のクエリはすべて session_id で絞るので、インデックスも session_id を先頭にする
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_players_session_name ON players (session_id, player_name)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_players_session_score ON players (session_id, score DESC)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_pvp_battles_session ON pvp_battles (session_id)")
+    cur.execute("DROP INDEX IF EXISTS idx_players_score")
+
+
+# (バージョン, 説明, 適用関数)。末尾に追加していく
+MIGRATIONS = [
+    (1, "schema*.sql + 初期マスタ", _v1_baseline),
+    (2, "session_id でゲームを分割", _v2_session_partition),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def read_version(db):
+    """適用済みのバージョンを返す（schema_version が無ければ 0）。"""
+    conn = db.get_connection()
+    try:
+        with db._cursor() as cur:
+            cur.execute("SELECT MAX(version) FROM schema_version")
+            row = cur.fetchone()
+    except (sqlite3.OperationalError, psycopg2.ProgrammingError):
+        conn.rollback()
+        return 0
+    conn.commit()
+    return (row[0] if row else None) or 0
+
+
+def migrate(db):
+    """未適用のマイグレーションを1つのトランザクションで順に流す。流した場合は True。"""
+    version = read_version(db)
+    if version >= LATEST_VERSION:
+        return False
+
+    conn = db.get_connection()
+    if db.backend == "sqlite":
+        # テーブルの作り直しで子テーブルの行が CASCADE で消えないように（トランザクションの外でしか切り替えられない）
+        conn.execute("PRAGMA foreign_keys = OFF")
+    try:
+        with db._cursor() as cur:
+            if db.backend == "postgres":
+                cur.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+            else:
+                # DDLも含めて1つのトランザクションにし、他プロセスの書き込みを待たせる
+                cur.execute("BEGIN IMMEDIATE")
+            for v, description, apply in MIGRATIONS:
+                if v <= version:
+                    continue
+                if version > 0:
+                    print(f"⚠️ DBアップデート: v{v} {description}")
+                apply(db, cur)
+                cur.execute(
+                    db._ph(
+                        "INSERT INTO schema_version (version, description) VALUES (%s, %s) "
+                        "ON CONFLICT (version) DO NOTHING"
+                    ),
+                    (v, description),
+                )
+            if db.backend == "sqlite":
+                cur.execute("PRAGMA foreign_key_check")
+                broken = cur.fetchall()
+                if broken:
+                    raise RuntimeError(f"マイグレーション後に外部キーの不整合があります: {broken[:5]}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if db.backend == "sqlite":
+            conn.execute("PRAGMA foreign_keys = ON")
+    return True
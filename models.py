@@ -1,5 +1,15 @@
 # models.py
-from config import LEVEL_UP_EXP
+from config import BASE_HP, HP_PER_LEVEL, LEVEL_UP_EXP
+
+
+def level_from_exp(exp):
+    return (exp // LEVEL_UP_EXP) + 1
+
+
+def max_hp_for_level(level):
+    # DBManager.full_recover_all_players の UPDATE も同じ式で計算している
+    return BASE_HP + level * HP_PER_LEVEL
+
 
 class Player:
     def __init__(self, data):
@@ -9,10 +19,14 @@ class Player:
         self.mp = data[3]
         self.exp = data[4]
         self.agility = data[5] if len(data) > 5 else 10
-        self.level = (self.exp // LEVEL_UP_EXP) + 1
+        self.level = level_from_exp(self.exp)
         self.status_effect = data[7] if len(data) > 7 else None
         self.status_turn = data[8] if len(data) > 8 else 0
 
+    @property
+    def max_hp(self):
+        return max_hp_for_level(self.level)
+
     @property
     def attack_power(self):
         return 10 + (self.level * 5)
@@ -20,7 +34,7 @@ class Player:
     def add_exp(self, amount):
         old_level = self.level
         self.exp += amount
-        self.level = (self.exp // LEVEL_UP_EXP) + 1
+        self.level = level_from_exp(self.exp)
         print(f"✨ {self.name} は経験値を {amount} 獲得した！ (Total: {self.exp})")
         return self.level > old_level
 
@@ -0,0 +1,119 @@
+# pve_estimator.py
+"""
+PvE（ファームフェーズ）の勝率と期待EXPを、NumPyで数千戦をまとめてシミュレーションして見積もる。
+- ルールは PvESystem.start_farm と同じ（プレイヤー先攻、状態異常、神の加護、アイテムの倍率）
+- プレイヤーの行動は単純な方針で決める: 次の被弾で倒れるならヒール、それ以外は使える中で期待ダメージ最大の技
+- ゲーム本体の random には触れない（専用の乱数生成器を使う）
+"""
+import numpy as np
+
+from models import max_hp_for_level
+from pve_solver import BLESS_REGEN, POISON_DAMAGE, SKILL_RULES
+
+# 状態異常のコード（配列で持つため）
+_NONE, _FREEZE, _STUN, _POISON = 0, 1, 2, 3
+_EFFECT_CODES = {None: _NONE, "氷結": _FREEZE, "気絶": _STUN, "毒": _POISON}
+_NO_DAMAGE = ("ヒール", "隠れ身")
+MAX_ROUNDS = 200  # これ以上続く戦闘は負け扱い（MPが尽きた後も殴り合うので実際はすぐ終わる）
+
+
+def _attack_plan(skills, attack_power):
+    """通常攻撃より期待ダメージが大きい技を、期待ダメージの大きい順に (MP, 威力%, 命中率, 状態異常, 確率, ターン, 吸収) で返す。"""
+    plan = []
+    for s in skills:
+        name, mp_cost, power = s[1], s[2], s[3]
+        if name in _NO_DAMAGE:
+            continue
+        hit, eff_name, eff_rate, eff_turn = SKILL_RULES.get(name, (1.0, None, 0.0, 0))
+        eff = _EFFECT_CODES[eff_name]
+        expected = attack_power * power / 100 * hit
+        if eff == _POISON:
+            expected += POISON_DAMAGE * eff_turn
+        if expected <= attack_power:
+            continue
+        plan.append((expected, (mp_cost, power, hit, eff, eff_rate, eff_turn, name == "ドレイン")))
+    plan.sort(key=lambda p: -p[0])
+    return [p[1] for p in plan]
+
+
+def estimate(level, hp, mp, skills, monster, dmg_rate=1.0, exp_rate=1.0, bless=False, n=4000, rng=None):
+    """
+    monster: (名前, HP, 攻撃力, Agility, EXP)。skills: get_player_skills() の行。
+    (勝率, 期待EXP, 平均ターン数) を返す。
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    atk = 10 + level * 5
+    max_hp = max_hp_for_level(level)
+    _, m_hp, m_atk, _, win_exp = monster
+    plan = _attack_plan(skills, atk)
+    heal = next((s for s in skills if s[1] == "ヒール"), None)
+
+    p_hp = np.full(n, hp, dtype=np.int64)
+    p_mp = np.full(n, mp, dtype=np.int64)
+    h = np.full(n, m_hp, dtype=np.int64)
+    eff = np.full(n, _NONE, dtype=np.int8)
+    eff_turn = np.zeros(n, dtype=np.int64)
+    alive = np.ones(n, dtype=bool)  # 決着していない戦闘
+    won = np.zeros(n, dtype=bool)
+    rounds = np.zeros(n, dtype=np.int64)
+
+    for _ in range(MAX_ROUNDS):
+        if not alive.any():
+            break
+        rounds += alive
+
+        # --- プレイヤーのターン ---
+        if bless:
+            p_hp = np.where(alive, np.minimum(max_hp, p_hp + BLESS_REGEN), p_hp)
+        base = atk * rng.uniform(0.9, 1.1, n)
+        dmg = np.where(alive, base, 0).astype(np.int64)  # 通常攻撃
+        decided = ~alive
+        if heal is not None:
+            use = ~decided & (p_hp <= m_atk) & (p_mp >= heal[2])
+            p_mp = np.where(use, p_mp - heal[2], p_mp)
+            p_hp = np.where(use, p_hp + int(atk * 2), p_hp)
+            dmg = np.where(use, 0, dmg)
+            decided |= use
+        for mp_cost, power, hit, s_eff, s_rate, s_turn, drain in plan:
+            use = ~decided & (p_mp >= mp_cost)
+            if not use.any():
+                continue
+            s_dmg = (atk * power / 100 * rng.uniform(0.9, 1.1, n)).astype(np.int64)
+            if hit < 1.0:
+                s_dmg = np.where(rng.random(n) < hit, s_dmg, 0)
+            p_mp = np.where(use, p_mp - mp_cost, p_mp)
+            dmg = np.where(use, s_dmg, dmg)
+            if drain:
+                p_hp = np.where(use, p_hp + s_dmg // 2, p_hp)
+            if s_eff != _NONE:
+                apply = use & (rng.random(n) < s_rate)
+                eff = np.where(apply, s_eff, eff)
+                eff_turn = np.where(apply, s_turn, eff_turn)
+            decided |= use
+        h -= (dmg * dmg_rate).astype(np.int64)
+        won |= alive & (h <= 0)
+        alive &= h > 0
+
+        # --- モンスターのターン（状態異常の処理は start_farm と同じ順序） ---
+        skip = alive & ((eff == _FREEZE) | (eff == _STUN))
+        h = np.where(alive & (eff == _POISON), h - POISON_DAMAGE, h)
+        ticking = alive & (eff_turn > 0)
+        eff_turn = np.where(ticking, eff_turn - 1, eff_turn)
+        eff = np.where(ticking & (eff_turn == 0), _NONE, eff)
+        won |= alive & (h <= 0)
+        alive &= h > 0
+        hits = alive & ~skip
+        p_hp = np.where(hits, p_hp - m_atk, p_hp)
+        alive &= p_hp > 0
+
+    win_rate = float(won.mean())
+    return win_rate, win_rate * int(win_exp * exp_rate), float(rounds.mean())
+
+
+def estimate_all(player, skills, monsters, dmg_rate=1.0, exp_rate=1.0, bless=False, n=4000, seed=None):
+    """各モンスターについて estimate() を行う（メニュー表示やまとめての分析用）。"""
+    rng = np.random.default_rng(seed)
+    return [
+        estimate(player.level, player.hp, player.mp, skills, m, dmg_rate, exp_rate, bless, n, rng)
+        for m in monsters
+    ]
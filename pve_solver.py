@@ -0,0 +1,211 @@
+# pve_solver.py
+"""
+PvE（ファームフェーズ）の1対1の戦闘を、勝率を最大にする行動を選ぶ問題として動的計画法で解く。
+- 状態は (プレイヤーHP, MP, モンスターHP, モンスターの状態異常, 残りターン)。プレイヤーの番の開始時点で持つ
+- どの行動でもモンスターHPかMPのどちらかが必ず減るので、状態は循環しない（メモ化再帰で解ける）
+- ダメージ int(基礎値 * uniform(0.9, 1.1)) は、取りうる整数ごとの確率に直して厳密に扱う
+- 解いた表は (レベル, スキル, モンスター, ダメージ倍率, 神の加護) ごとに保持し、同じ条件なら使い回す
+- 強い敵やスキルが多い時は状態が数万になるので、1回の solve で新しく解く状態の数に上限を付けられる
+  （打ち切っても解き終わった状態は覚えているので、次の呼び出しは続きから解く）
+"""
+from functools import lru_cache
+
+from models import max_hp_for_level
+
+# 技名 -> (命中率, 付与する状態異常, 付与確率, 継続ターン)。PvESystem._calc_skill_dmg と同じ
+SKILL_RULES = {
+    "全力斬り": (0.7, None, 0.0, 0),
+    "ブリザード": (1.0, "氷結", 0.3, 1),
+    "ポイズン": (1.0, "毒", 1.0, 3),
+    "スタン撃ち": (1.0, "気絶", 0.5, 1),
+}
+POISON_DAMAGE = 10
+BLESS_REGEN = 10
+_SKIP_EFFECTS = ("氷結", "気絶")
+
+
+class _StateLimit(Exception):
+    pass
+
+
+def damage_distribution(base):
+    """int(base * random.uniform(0.9, 1.1)) の分布を [(ダメージ, 確率)] で返す。"""
+    if base <= 0:
+        return [(0, 1.0)]
+    lo, hi = base * 0.9, base * 1.1
+    dist = []
+    for k in range(int(lo), int(hi) + 1):
+        width = min(hi, k + 1) - max(lo, k)
+        if width > 0:
+            dist.append((k, width / (hi - lo)))
+    return dist
+
+
+class PvESolver:
+    """
+    1体のモンスターとの戦闘の最適方針。
+    行動番号は 0 = 通常攻撃、i = skills[i-1]（start_farm の入力と同じ）。
+    """
+
+    def __init__(self, level, skills, monster, dmg_rate=1.0, bless=False):
+        # monster: (名前, HP, 攻撃力, Agility, EXP)
+        self.attack_power = 10 + level * 5
+        self.max_hp = max_hp_for_level(level)
+        self.monster_attack = monster[2]
+        self.win_exp = monster[4]
+        self.bless = bless
+        self.skills = list(skills)
+        self._actions = self._build_actions(dmg_rate)
+        self._memo = {}
+        self._state_budget = None  # 今の solve で、あと何状態新しく解いてよいか（None なら無制限）
+
+        # 探索を打ち切るための上限/下限の計算に使う値
+        self._min_attack = min(o[1] for o in self._actions[0][2])
+        self._max_damage = max(o[1] for _, _, outs in self._actions for o in outs) + POISON_DAMAGE
+        heals = [(cost, max(o[2] for o in outs)) for _, cost, outs in self._actions if cost > 0 and any(o[2] for o in outs)]
+        self._heal_per_mp = max((gain / cost for cost, gain in heals), default=0.0)
+        skip_costs = [cost for _, cost, outs in self._actions if any(o[3] in _SKIP_EFFECTS for o in outs)]
+        self._min_skip_cost = min(skip_costs, default=0)
+
+    def _build_actions(self, dmg_rate):
+        """[(行動番号, MP, [(確率, ダメージ, 回復量, 付与する状態異常, ターン)])]"""
+        atk = self.attack_power
+
+        def outcomes(base, hit=1.0, eff=None, eff_rate=0.0, eff_turn=0, heal=0, drain=False):
+            merged = {}
+            effects = [(eff_rate, eff), (1.0 - eff_rate, None)] if eff else [(1.0, None)]
+            for dmg, p in damage_distribution(base):
+                for hit_p, d in ((hit, dmg), (1.0 - hit, 0)):
+                    if hit_p <= 0:
+                        continue
+                    gain = heal + (d // 2 if drain else 0)
+                    d = int(d * dmg_rate)
+                    for eff_p, e in effects:
+                        if eff_p <= 0:
+                            continue
+                        key = (d, gain, e, eff_turn if e else 0)
+                        merged[key] = merged.get(key, 0.0) + p * hit_p * eff_p
+            return [(p,) + key for key, p in merged.items()]
+
+        actions = [(0, 0, outcomes(atk))]
+        for i, s in enumerate(self.skills, start=1):
+            name, mp_cost, power = s[1], s[2], s[3]
+            if name == "ヒール":
+                actions.append((i, mp_cost, outcomes(0, heal=int(atk * 2))))
+            elif name == "隠れ身":
+                actions.append((i, mp_cost, outcomes(0)))
+            else:
+                hit, eff, eff_rate, eff_turn = SKILL_RULES.get(name, (1.0, None, 0.0, 0))
+                actions.append((i, mp_cost, outcomes(atk * (power / 100), hit, eff, eff_rate, eff_turn,
+                                                     drain=(name == "ドレイン"))))
+        return actions
+
+    def solve(self, hp, mp, monster_hp, effect=None, effect_turn=0, max_states=None):
+        """
+        (最適な行動番号, 勝率) を返す。
+        max_states を渡すと、新しく解く状態がそれを超えた時点で打ち切って None を返す。
+        """
+        self._state_budget = max_states
+        try:
+            return self._solve(hp, mp, monster_hp, effect, effect_turn)
+        except _StateLimit:
+            return None
+        finally:
+            self._state_budget = None
+
+    def win_rate(self, hp, mp, monster_hp, effect=None, effect_turn=0):
+        return self._solve(hp, mp, monster_hp, effect, effect_turn)[1]
+
+    def expected_exp(self, hp, mp, monster_hp, effect=None, effect_turn=0, exp_rate=1.0):
+        return self.win_rate(hp, mp, monster_hp, effect, effect_turn) * int(self.win_exp * exp_rate)
+
+    def _solve(self, hp, mp, monster_hp, effect, effect_turn):
+        key = (hp, mp, monster_hp, effect, effect_turn)
+        found = self._memo.get(key)
+        if found is not None:
+            return found
+
+        if self._sure_win(hp, monster_hp):
+            best = (0, 1.0)
+        elif self._hopeless(hp, mp, monster_hp):
+            best = (0, 0.0)
+        else:
+            if self._state_budget is not None:
+                if self._state_budget <= 0:
+                    raise _StateLimit
+                self._state_budget -= 1
+            best = self._search(hp, mp, monster_hp, effect, effect_turn)
+        self._memo[key] = best
+        return best
+
+    def _sure_win(self, hp, monster_hp):
+        # 最小ダメージの通常攻撃だけで、倒れる前に倒しきれるか（状態異常や神の加護は有利にしか働かない）
+        if self.bless:
+            hp = min(hp, self.max_hp)
+        hits = -(-monster_hp // self._min_attack) if self._min_attack > 0 else None
+        return hits is not None and hp - (hits - 1) * self.monster_attack > 0
+
+    def _hopeless(self, hp, mp, monster_hp):
+        # 回復・行動不能を最大限に使い、毎ターン最大ダメージを出しても倒しきれないか
+        net_loss = self.monster_attack - (BLESS_REGEN if self.bless else 0)
+        if net_loss <= 0:
+            return False
+        hp_pool = hp + mp * self._heal_per_mp
+        turns = -(-hp_pool // net_loss) + 1
+        if self._min_skip_cost > 0:
+            turns += mp // self._min_skip_cost
+        return turns * self._max_damage < monster_hp
+
+    def _search(self, hp, mp, monster_hp, effect, effect_turn):
+        if self.bless:
+            hp = min(self.max_hp, hp + BLESS_REGEN)
+        solve = self._solve
+        monster_attack = self.monster_attack
+        best = (0, -1.0)
+        for action, mp_cost, outcomes in self._actions:
+            if mp < mp_cost:
+                continue
+            rest_mp = mp - mp_cost
+            value = 0.0
+            for p, dmg, gain, new_effect, new_turn in outcomes:
+                m_hp = monster_hp - dmg
+                if m_hp <= 0:
+                    value += p
+                    continue
+                # 新しく付与した状態異常は、かかっていたものを上書きする
+                eff, eff_turn = (new_effect, new_turn) if new_effect else (effect, effect_turn)
+
+                # モンスターの番（start_farm と同じ順序: 行動不能の判定 → 毒 → ターン経過 → 攻撃）
+                skip = eff in _SKIP_EFFECTS
+                if eff == "毒":
+                    m_hp -= POISON_DAMAGE
+                if eff_turn > 0:
+                    eff_turn -= 1
+                    if eff_turn == 0:
+                        eff = None
+                if m_hp <= 0:
+                    value += p
+                    continue
+                next_hp = hp + gain
+                if not skip:
+                    next_hp -= monster_attack
+                    if next_hp <= 0:
+                        continue
+                value += p * solve(next_hp, rest_mp, m_hp, eff, eff_turn)[1]
+            # 同じ勝率なら番号の小さい（MPを使わない）行動を選ぶ
+            if value > best[1] + 1e-12:
+                best = (action, value)
+                if value >= 1.0 - 1e-12:
+                    # 確実に勝てるならそれ以上は探さない
+                    break
+        return best
+
+
+@lru_cache(maxsize=64)
+def _cached_solver(level, skills, monster, dmg_rate, bless):
+    return PvESolver(level, skills, monster, dmg_rate, bless)
+
+
+def get_solver(level, skills, monster, dmg_rate=1.0, bless=False):
+    """条件が同じなら、前に解いた表を持つ PvESolver を返す。skills は get_player_skills() の行。"""
+    return _cached_solver(level, tuple(tuple(s) for s in skills), tuple(monster), dmg_rate, bless)
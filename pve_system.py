@@ -1,7 +1,23 @@
 # pve_system.py
 import random
-from models import Monster
+from config import PVE_DROP_RARITY_WEIGHTS, PVE_HINT_MAX_STATES
+from models import Monster, level_from_exp
+from pve_solver import get_solver
+import query_profiler
+import tracing
 from utils import safe_input
+
+try:
+    # NumPy が無ければ勝率の見積もりを出さないだけ
+    from pve_estimator import estimate_all
+except ImportError:
+    estimate_all = None
+
+# ファームのモンスター (名前, HP, 攻撃力, Agility, EXP)
+FARM_MONSTERS = [
+    ("スライム", 30, 10, 5, 10), ("ゴブリン", 50, 15, 12, 50),
+    ("ドラゴン", 150, 30, 20, 100), ("魔王の影", 300, 50, 40, 200)
+]
  
 class PvESystem:
     def __init__(self, player, db_manager):
@@ -39,6 +55,7 @@ class PvESystem:
 
         while True:
             turn_count += 1
+            query_profiler.next_turn()
             living = self._count_living_in_list(chosen)
             if living <= 1:
                 break
@@ -51,7 +68,7 @@ class PvESystem:
             # agilityで行動順（固定ステータス）。同値ならIDが小さい順
             turn_order = sorted(chosen, key=lambda x: (x[3], -x[0]), reverse=True)
 
-            for p_data in turn_order:
+            for p_data in tracing.span_iter(turn_order, f"PvE Turn {turn_count}", args={"living": living}):
                 pid, name, _, agi, _, _, exp, _, _, _ = p_data
 
                 hp, eff, eff_turn = self.db.get_player_status_row(pid)
@@ -74,7 +91,7 @@ class PvESystem:
 
                 # 神の加護: 自分のターン開始時にHP+10
                 if pid == self.player.id and self.db.has_item_effect(self.player.id, "bless_regen"):
-                    max_hp = 100 + (self.player.level * 10)
+                    max_hp = self.player.max_hp
                     healed = min(max_hp, hp + 10)
                     if healed != hp:
                         diff = healed - hp
@@ -86,7 +103,7 @@ class PvESystem:
                 if skip_turn:
                     continue
 
-                lvl = (exp // 100) + 1
+                lvl = level_from_exp(exp)
                 atk = 10 + (lvl * 5)
 
                 if pid == self.player.id:
@@ -161,8 +178,8 @@ class PvESystem:
             print(f"{i+1}.{s[1]}{aoe}(MP:{s[2]}, {s[3]}%)")
 
         try:
-            act = int(input(">> "))
-        except:
+            act = int(safe_input(">> "))
+        except ValueError:
             act = 0
 
 
@@ -191,69 +208,70 @@ class PvESystem:
                 print(f"  {i+1}. {t[1]} (HP:{t[2]}) {st}")
 
             try:
-                t_idx = int(input("  対象番号>> "))
+                t_idx = int(safe_input("  対象番号>> "))
                 if 1 <= t_idx <= len(targets):
                     target = targets[t_idx - 1]
-            except:
+            except ValueError:
                 pass
             if not target:
                 target = targets[0]
 
-        if act == 0:
-            damage = int(atk * random.uniform(0.9, 1.1))
-            print(f"  ⚔️ 通常攻撃 -> {target[1]} (威力:{damage})")
-        elif selected_skill is not None:
-            s_name, s_mp, s_power, _ = selected_skill[1], selected_skill[2], selected_skill[3], selected_skill[5]
-            if self.player.mp < s_mp:
-                print("  MP不足！")
-                return
-
-            self.player.mp -= s_mp
-            self.db.update_player_mp(self.player.id, self.player.mp)
-
-            if s_name == "隠れ身":
-                self.player.status_effect = "隠密"
-                self.player.status_turn = 1
-                self.db.set_player_effect(self.player.id, "隠密", 1)
-                print("  🥷 隠れ身！ (敵から狙われなくなった)")
-                return
-
-            if s_name == "ヒール":
-                self.player.hp += int(atk * 2)
-                self.db.update_player_effect(self.player.id, self.player.hp, self.player.status_effect, self.player.status_turn)
-                print(f"  ✨ {s_name}！ (HP回復)")
-                return
+        # 入力が済んでから、行動の結果を1回のコミットでまとめて反映する
+        with self.db.transaction():
+            if act == 0:
+                damage = int(atk * random.uniform(0.9, 1.1))
+                print(f"  ⚔️ 通常攻撃 -> {target[1]} (威力:{damage})")
+            elif selected_skill is not None:
+                s_name, s_mp, s_power, _ = selected_skill[1], selected_skill[2], selected_skill[3], selected_skill[5]
+                if self.player.mp < s_mp:
+                    print("  MP不足！")
+                    return
+
+                self.player.mp -= s_mp
+                self.db.update_player_mp(self.player.id, self.player.mp)
+
+                if s_name == "隠れ身":
+                    self.player.status_effect = "隠密"
+                    self.player.status_turn = 1
+                    self.db.set_player_effect(self.player.id, "隠密", 1)
+                    print("  🥷 隠れ身！ (敵から狙われなくなった)")
+                    return
+
+                if s_name == "ヒール":
+                    self.player.hp += int(atk * 2)
+                    self.db.update_player_effect(self.player.id, self.player.hp, self.player.status_effect, self.player.status_turn)
+                    print(f"  ✨ {s_name}！ (HP回復)")
+                    return
+
+                base = atk * (s_power / 100)
+                damage = int(base * random.uniform(0.9, 1.1))
+                damage, apply_eff = self._calc_skill_dmg(s_name, s_power)
+
+                if is_aoe:
+                    print(f"  🌏 {s_name}！ (全体 / 威力:{damage})")
+                else:
+                    print(f"  ✨ {s_name} -> {target[1]} (威力:{damage})")
 
-            base = atk * (s_power / 100)
-            damage = int(base * random.uniform(0.9, 1.1))
-            damage, apply_eff = self._calc_skill_dmg(s_name, s_power)
+                if s_name == "ドレイン":
+                    self.player.hp += damage // 2
+                    self.db.update_player_effect(self.player.id, self.player.hp, self.player.status_effect, self.player.status_turn)
 
             if is_aoe:
-                print(f"  🌏 {s_name}！ (全体 / 威力:{damage})")
+                if targets is None:
+                    targets = self._pick_targets_from_chosen(self.player.id, chosen)
+                # 対象全員へのダメージと状態異常を1文でまとめて反映する（PvEでは防御力なし）
+                hits = self.db.apply_area_damage(self.player.id, damage, effect=apply_eff, target_ids=[t[0] for t in targets])
+                dealt = {pid: d for pid, _, d, _ in hits}
+                for pid, name, thp, teff in targets:
+                    if pid in dealt:
+                        print(f"    -> {name} に {dealt[pid]} ダメージ！")
             else:
-                print(f"  ✨ {s_name} -> {target[1]} (威力:{damage})")
-
-            if s_name == "ドレイン":
-                self.player.hp += damage // 2
-                self.db.update_player_effect(self.player.id, self.player.hp, self.player.status_effect, self.player.status_turn)
-
-        if is_aoe:
-            if targets is None:
-                targets = self._pick_targets_from_chosen(self.player.id, chosen)
-            for pid, name, thp, teff in targets:
-                if damage <= 0:
-                    continue
-                self.db.damage_player_hp(pid, damage)
-                print(f"    -> {name} に {damage} ダメージ！")
-                if apply_eff:
-                    self.db.set_player_effect(pid, apply_eff[0], apply_eff[1])
-        else:
-            if target and damage > 0:
-                self.db.damage_player_hp(target[0], damage)
-                print(f"    -> {target[1]} に {damage} ダメージ！")
-                if apply_eff:
-                    self.db.set_player_effect(target[0], apply_eff[0], apply_eff[1])
-                    print(f"    -> {target[1]} は {apply_eff[0]} になった！")
+                if target and damage > 0:
+                    self.db.damage_player_hp(target[0], damage)
+                    print(f"    -> {target[1]} に {damage} ダメージ！")
+                    if apply_eff:
+                        self.db.set_player_effect(target[0], apply_eff[0], apply_eff[1])
+                        print(f"    -> {target[1]} は {apply_eff[0]} になった！")
 
     def _cpu_turn_pve_pvp(self, pid, name, atk, chosen):
         targets = self._pick_targets_from_chosen(pid, chosen)
@@ -278,7 +296,7 @@ class PvESystem:
                 i_id, i_name, i_val = item[0], item[1], item[4]
                 if item[3] == "pve_heal":
                     old_hp = self.player.hp
-                    self.player.hp = min(self.player.hp + i_val, 100 + (self.player.level*10))
+                    self.player.hp = min(self.player.hp + i_val, self.player.max_hp)
                     diff = self.player.hp - old_hp
                     print(f"  💊 {i_name} 消費 -> HP {diff} 回復 (HP: {self.player.hp})")
                 elif item[3] == "pve_exp":
@@ -290,13 +308,11 @@ class PvESystem:
                 self.db.consume_item(self.player.id, i_id)
             print("")
  
-        # (名前, HP, 攻撃力, Agility, EXP)
-        monsters = [
-            ("スライム", 30, 10, 5, 10), ("ゴブリン", 50, 15, 12, 50),
-            ("ドラゴン", 150, 30, 20, 100), ("魔王の影", 300, 50, 40, 200)
-        ]
+        monsters = FARM_MONSTERS
+        estimates = self._estimate_farm(monsters, bonus_dmg_rate, bonus_exp_rate)
         for i, m in enumerate(monsters):
-            print(f"  {i+1}. {m[0]} (HP:{m[1]}, ATK:{m[2]}, AGI:{m[3]}, EXP:{m[4]})")
+            hint = f" 勝率:{estimates[i][0]:.0%} 期待EXP:{estimates[i][1]:.0f}" if estimates else ""
+            print(f"  {i+1}. {m[0]} (HP:{m[1]}, ATK:{m[2]}, AGI:{m[3]}, EXP:{m[4]}){hint}")
        
         monster = None
         win_exp = 0
@@ -312,12 +328,19 @@ class PvESystem:
             except ValueError: pass
  
         print(f"\nBattle Start: {monster.name} (HP:{monster.hp}, AGI:{monster.agility}) vs You (AGI:{self.player.agility})")
+        # 勝率が最大になる行動を毎ターン案内する（同じ条件の表は使い回す）
+        # 表は戦闘開始時には解かず、毎ターン PVE_HINT_MAX_STATES 状態ずつ解き進め、解けたターンだけ案内する
+        solver = get_solver(
+            self.player.level, self.db.get_player_skills(self.player.id), d, bonus_dmg_rate,
+            self.db.has_item_effect(self.player.id, "bless_regen"),
+        )
        
         while monster.hp > 0 and self.player.is_alive():
+            query_profiler.next_turn()
             # 行動順決定: ルール変更によりプレイヤーが必ず先攻
             turn_order = [("player", self.player), ("monster", monster)]
 
-            for p_type, actor in turn_order:
+            for p_type, actor in tracing.span_iter(turn_order, "PvE farm turn", args={"monster_hp": monster.hp, "hp": self.player.hp}):
                 if monster.hp <= 0 or not self.player.is_alive(): break
 
                 # 状態異常チェック
@@ -325,7 +348,7 @@ class PvESystem:
                 if actor.status_effect in ["氷結", "気絶"]:
                     print(f"❄️ {actor.name if p_type=='monster' else 'あなた'} は {actor.status_effect} で動けない！")
                     skip_turn = True
-                
+            
                 if actor.status_effect == "毒":
                     actor.hp -= 10
                     print(f"☠️ {actor.name if p_type=='monster' else 'あなた'} に毒ダメージ！ (HP: {actor.hp})")
@@ -335,15 +358,20 @@ class PvESystem:
                     if actor.status_turn == 0:
                         print(f"✨ {actor.name if p_type=='monster' else 'あなた'} の {actor.status_effect} が切れた！")
                         actor.status_effect = None
-                
+            
                 if actor.hp <= 0: continue
 
                 if skip_turn: continue
 
                 if p_type == "player":
                     # --- プレイヤーのターン ---
+                    # おすすめは神の加護の回復前の状態で引く（ソルバーの状態の取り方に合わせる）
+                    hint = solver.solve(
+                        self.player.hp, self.player.mp, monster.hp, monster.status_effect, monster.status_turn,
+                        max_states=PVE_HINT_MAX_STATES,
+                    )
                     if self.db.has_item_effect(self.player.id, "bless_regen"):
-                        max_hp = 100 + (self.player.level * 10)
+                        max_hp = self.player.max_hp
                         old_hp = self.player.hp
                         self.player.hp = min(max_hp, self.player.hp + 10)
                         if self.player.hp > old_hp:
@@ -351,21 +379,25 @@ class PvESystem:
 
                     atk = self.player.attack_power
                     print(f"\nあなたのターン (Lv.{self.player.level} 攻:{atk}, HP:{self.player.hp}, MP:{self.player.mp})")
-                
+            
                     my_skills = self.db.get_player_skills(self.player.id)
                     print("0. 通常攻撃 (100%)")
                     for i, s in enumerate(my_skills):
                         aoe = "[全体]" if s[5] else ""
                         print(f"{i+1}. {s[1]}{aoe} (MP:{s[2]}, 威力:{s[3]}%)")
-                
+                    if hint is not None:
+                        best_act, best_rate = hint
+                        best_name = "通常攻撃" if best_act == 0 else my_skills[best_act - 1][1]
+                        print(f"💡 おすすめ: {best_act}. {best_name} (勝率 {best_rate:.0%})")
+            
                     try: 
                         act_str = safe_input(">> ")
                         act = int(act_str)
                     except ValueError: act = 0
-    
+
                     damage = 0
                     effect = None
-                
+            
                     if act == 0:
                         base_dmg = self.player.attack_power
                         damage = int(base_dmg * random.uniform(0.9, 1.1))
@@ -374,7 +406,7 @@ class PvESystem:
                         if self.player.mp >= s[2]:
                             self.player.mp -= s[2]
                             damage, effect = self._calc_skill_dmg(s[1], s[3])
-                            
+                        
                             if s[1] == "ヒール": 
                                 heal_val = int(self.player.attack_power*2)
                                 self.player.hp += heal_val
@@ -384,7 +416,7 @@ class PvESystem:
                                 self.player.hp += heal_val
                                 print(f"  🧛 ドレイン！ (HP {heal_val} 吸収 -> {self.player.hp})")
                             elif s[1] == "隠れ身": print("  (気配を消した！)")
-                            
+                        
                             if effect:
                                 monster.status_effect = effect[0]
                                 monster.status_turn = effect[1]
@@ -392,7 +424,7 @@ class PvESystem:
                             print("MP不足！通常攻撃を行います。")
                             base_dmg = self.player.attack_power
                             damage = int(base_dmg * random.uniform(0.9, 1.1))
-                    
+                
                     damage = int(damage * bonus_dmg_rate)
                     if damage > 0:
                         print(f"  ⚔️ ダメージ: {damage}")
@@ -402,8 +434,8 @@ class PvESystem:
                     # --- モンスターのターン ---
                     dmg = monster.attack
                     self.player.hp -= dmg
-                    # ダメージを受けたら即座にDBへ反映（強制終了対策）
-                    self._update_db()
+                    # ダメージを受けたらジャーナルへ記録（強制終了対策。DBへはまとめて書き戻す）
+                    self._journal_db()
                     print(f"\n💀 {monster.name} の攻撃！ {dmg} ダメージ (残りHP: {self.player.hp})")
 
             # 決着判定
@@ -414,15 +446,23 @@ class PvESystem:
                     self._process_level_up()
                 self._check_drop()
                 self.db.log_pve(self.player.id, monster.name, True)
-                self._update_db()
+                self._save_battle_result()
                 break
             
             if not self.player.is_alive():
                 print("☠️ 敗北...")
                 self.db.log_pve(self.player.id, monster.name, False)
-                self._update_db()
+                self._save_battle_result()
                 break
  
+    def _estimate_farm(self, monsters, dmg_rate, exp_rate):
+        # 今のHP/MP・習得スキル・使ったアイテムで各モンスターと戦った場合の (勝率, 期待EXP, 平均ターン数)
+        if estimate_all is None:
+            return None
+        skills = self.db.get_player_skills(self.player.id)
+        bless = self.db.has_item_effect(self.player.id, "bless_regen")
+        return estimate_all(self.player, skills, monsters, dmg_rate, exp_rate, bless)
+
     def _calc_skill_dmg(self, name, power_pct):
         base = self.player.attack_power * (power_pct / 100)
         dmg = int(base * random.uniform(0.9, 1.1))
@@ -449,24 +489,23 @@ class PvESystem:
         except ValueError: pass
  
     def _check_drop(self):
-        drop_list = self.db.get_items_by_type("pvp_")
-        if not drop_list: return
+        drop_table = self.db.get_loot_table("pvp_", PVE_DROP_RARITY_WEIGHTS)
+        if drop_table is None: return
  
         if random.random() < 0.4:
-            weights = []
-            for item in drop_list:
-                rar = item[2]
-                if rar == 1: w = 60
-                elif rar == 2: w = 30
-                elif rar == 3: w = 9
-                else: w = 1
-                weights.append(w)
-           
-            dropped = random.choices(drop_list, weights=weights, k=1)[0]
+            dropped = drop_table.draw(random)
             self.db.add_item(self.player.id, dropped[0])
             star = "★" * dropped[2]
             print(f"\n🎁 {star}「{dropped[1]}」をドロップ！(次のPvPで使用されます)")
  
     def _update_db(self):
         self.db.update_player_status(self.player.id, self.player.hp, self.player.mp, self.player.exp, self.player.status_effect, self.player.status_turn)
+
+    def _journal_db(self):
+        self.db.journal_player_status(self.player.id, self.player.hp, self.player.mp, self.player.exp, self.player.status_effect, self.player.status_turn)
+
+    def _save_battle_result(self):
+        # 戦闘終了時は最新状態をジャーナル経由で1回のコミットで確定させる
+        self._journal_db()
+        self.db.flush_journal()
  
\ No newline at end of file
@@ -0,0 +1,210 @@
+# pvp_ai.py
+"""
+PvPでCPUが操作する参加者の行動（スキルと対象）を、先読み探索で決める。
+- 探索は expectimax: 自分の手番は最大、他の参加者の手番は候補の行動を等確率、状態異常の付与は確率で平均する
+- ダメージの乱数(0.9〜1.1倍)は平均値で扱い、分岐させない
+- 反復深化で1手ずつ深く読み、1手あたりに展開できる局面数（node_budget）を使い切ったら、読み切った深さで一番良かった行動を返す
+  局面数で打ち切るので、同じ局面からは実行環境の速さや負荷に依らず同じ行動を選ぶ
+- 対話プレイでは持ち時間（time_budget 秒）でも打ち切れる（こちらは環境によって読める深さが変わる）
+- 同じ局面（状態・手番・残り深さ）の評価値は置換表に覚えて使い回す
+"""
+import time
+
+from config import PVP_CPU_MAX_DEPTH, PVP_CPU_NODE_BUDGET
+
+# 技名 -> (付与する状態異常, 付与確率, 継続ターン)。PvPSystem._apply_skill_effect と同じ
+_SKILL_EFFECTS = {
+    "ブリザード": ("氷結", 0.3, 1),
+    "ポイズン": ("毒", 1.0, 3),
+    "スタン撃ち": ("気絶", 0.5, 1),
+}
+_SKIP_EFFECTS = ("氷結", "気絶")
+_STEALTH = "隠密"
+
+
+class _SearchLimit(Exception):
+    pass
+
+
+class PvPSearchAI:
+    """
+    1試合分の静的な情報（行動順・攻撃力・防御力・懸賞金・スキル）を持ち、choose() で1手ずつ決める。
+    行動は (行動番号, スキル, 対象ID) で返す。行動番号は 0 = 通常攻撃、i = skills[i-1]。
+    """
+
+    def __init__(self, order, atk, defense, bounty, skills, node_budget=PVP_CPU_NODE_BUDGET, max_depth=PVP_CPU_MAX_DEPTH,
+                 time_budget=None):
+        # order: 行動順の player_id。atk / defense / bounty / skills: player_id -> 値
+        self.order = list(order)
+        self._index = {pid: i for i, pid in enumerate(self.order)}
+        self._atk = [atk[pid] for pid in self.order]
+        self._def = [defense[pid] for pid in self.order]
+        self._bounty = [bounty[pid] for pid in self.order]
+        self._skills = [list(skills[pid]) for pid in self.order]
+        self.node_budget = node_budget
+        self.max_depth = max_depth
+        self.time_budget = time_budget
+        self._nodes_left = None
+        self._deadline = None
+        self._table = {}
+        self.last_depth = 0  # 直前の choose() で読み切った深さ（確認用）
+
+    def choose(self, actor_id, rows):
+        """
+        rows: player_id -> (hp, mp, 状態異常, 残りターン)。actor_id の番の開始処理（行動不能・ターン経過）が済んだ状態で呼ぶ。
+        """
+        state = (tuple(rows[pid] for pid in self.order), 0)
+        me = self._index[actor_id]
+        actions = self._actions(state, me, me)
+        if not actions:
+            return None
+        best = actions[0][0]
+        # node_budget も time_budget も None なら max_depth まで必ず読む
+        self._nodes_left = self.node_budget
+        self._deadline = time.perf_counter() + self.time_budget if self.time_budget is not None else None
+        self._table = {}
+        self.last_depth = 0
+        for depth in range(1, self.max_depth + 1):
+            try:
+                value_best = None
+                for action, outcomes in actions:
+                    value = sum(p * self._value(s, self._next(me), depth - 1, me) for p, s in outcomes)
+                    if value_best is None or value > value_best:
+                        value_best, depth_best = value, action
+            except _SearchLimit:
+                break
+            best = depth_best
+            self.last_depth = depth
+        act, target = best
+        skill = self._skills[me][act - 1] if act else None
+        return act, skill, (self.order[target] if target is not None else None)
+
+    def _next(self, pos):
+        return (pos + 1) % len(self.order)
+
+    def _value(self, state, pos, depth, me):
+        # 末端の評価も含めて、呼ばれた局面を1つと数える
+        if self._nodes_left is not None:
+            if self._nodes_left <= 0:
+                raise _SearchLimit
+            self._nodes_left -= 1
+        rows = state[0]
+        alive = sum(1 for r in rows if r[0] > 0)
+        if depth == 0 or rows[me][0] <= 0 or alive <= 1:
+            return self._evaluate(state, me)
+        if self._deadline is not None and time.perf_counter() > self._deadline:
+            raise _SearchLimit
+        key = (state, pos, depth)
+        found = self._table.get(key)
+        if found is not None:
+            return found
+
+        hp, mp, eff, turn = rows[pos]
+        if hp <= 0:
+            # 倒れた参加者の番は飛ばす（深さは使わない）
+            value = self._value(state, self._next(pos), depth, me)
+        else:
+            # 手番の開始処理（PvPSystem.start_match と同じ）: 行動不能の判定 → ターン経過
+            skip = eff in _SKIP_EFFECTS
+            if turn > 0:
+                turn -= 1
+                if turn == 0:
+                    eff = None
+                state = (self._replace(rows, pos, (hp, mp, eff, turn)), state[1])
+            if skip:
+                value = self._value(state, self._next(pos), depth - 1, me)
+            else:
+                actions = self._actions(state, pos, me)
+                if not actions:
+                    value = self._value(state, self._next(pos), depth - 1, me)
+                else:
+                    values = [
+                        sum(p * self._value(s, self._next(pos), depth - 1, me) for p, s in outcomes)
+                        for _, outcomes in actions
+                    ]
+                    value = max(values) if pos == me else sum(values) / len(values)
+        self._table[key] = value
+        return value
+
+    def _evaluate(self, state, me):
+        rows, gain = state
+        enemies_dead = sum(1 for i, r in enumerate(rows) if i != me and r[0] <= 0)
+        if rows[me][0] <= 0:
+            # 先に倒れるほど順位が下がる
+            return -100.0 + 30 * enemies_dead + gain
+        enemy_hp = sum(max(0, r[0]) for i, r in enumerate(rows) if i != me)
+        return 30 * enemies_dead + gain + 0.5 * rows[me][0] - 0.5 * enemy_hp / (len(rows) - 1)
+
+    @staticmethod
+    def _replace(rows, i, row):
+        return rows[:i] + (row,) + rows[i + 1:]
+
+    def _actions(self, state, pos, me):
+        """[((行動番号, 対象位置), [(確率, 次の状態)])]。自分以外は対象を最もHPの低い相手に絞る。"""
+        rows = state[0]
+        visible = [i for i, r in enumerate(rows) if i != pos and r[0] > 0 and r[2] != _STEALTH]
+        targets = visible
+        if pos != me and visible:
+            targets = [min(visible, key=lambda i: rows[i][0])]
+        atk = self._atk[pos]
+        mp = rows[pos][1]
+
+        actions = []
+        for t in targets:
+            actions.append(((0, t), self._hit(state, pos, [t], atk, None, 0, me)))
+        for act, s in enumerate(self._skills[pos], start=1):
+            name, cost, power, is_aoe = s[1], s[2], s[3], s[5]
+            if mp < cost:
+                continue
+            if name == "隠れ身":
+                actions.append(((act, None), [(1.0, self._self_cast(state, pos, cost, 0, _STEALTH))]))
+            elif name == "ヒール":
+                actions.append(((act, None), [(1.0, self._self_cast(state, pos, cost, int(atk * 2), None))]))
+            elif is_aoe:
+                if visible:
+                    actions.append(((act, None), self._hit(state, pos, visible, int(atk * power / 100), name, cost, me)))
+            else:
+                for t in targets:
+                    actions.append(((act, t), self._hit(state, pos, [t], int(atk * power / 100), name, cost, me)))
+        return actions
+
+    def _self_cast(self, state, pos, cost, heal, effect):
+        rows, gain = state
+        hp, mp, eff, turn = rows[pos]
+        if effect:
+            eff, turn = effect, 1
+        return (self._replace(rows, pos, (hp + heal, mp - cost, eff, turn)), gain)
+
+    def _hit(self, state, pos, targets, damage, skill_name, cost, me):
+        rows, gain = state
+        hp, mp, eff, turn = rows[pos]
+        if eff == _STEALTH:
+            # 攻撃すると隠密は解ける
+            eff, turn = None, 0
+        if skill_name == "ドレイン":
+            hp += damage // 2
+        rows = self._replace(rows, pos, (hp, mp - cost, eff, turn))
+        if damage <= 0:
+            return [(1.0, (rows, gain))]
+
+        effect = _SKILL_EFFECTS.get(skill_name)
+        branches = [(1.0, None)]
+        if effect:
+            branches = [(effect[1], effect)]
+            if effect[1] < 1.0:
+                branches.append((1.0 - effect[1], None))
+
+        outcomes = []
+        for p, applied in branches:
+            new_rows, new_gain = rows, gain
+            for t in targets:
+                t_hp, t_mp, t_eff, t_turn = new_rows[t]
+                t_hp -= max(1, damage - self._def[t])
+                if applied:
+                    t_eff, t_turn = applied[0], applied[2]
+                # 懸賞金は倒した参加者に入る（自分の分だけ評価に足す）
+                if pos == me and t_hp <= 0:
+                    new_gain += self._bounty[t]
+                new_rows = self._replace(new_rows, t, (t_hp, t_mp, t_eff, t_turn))
+            outcomes.append((p, (new_rows, new_gain)))
+        return outcomes
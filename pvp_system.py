@@ -1,12 +1,23 @@
 # pvp_system.py
 import random
 import time
+from battle_state import BattleState, RoyaleState
+from config import PVP_CPU_CONTROL, PVP_ROYALE_THRESHOLD
+from models import level_from_exp
+from pvp_ai import PvPSearchAI
+import query_profiler
+import tracing
 from utils import safe_input
 
 class PvPSystem:
-    def __init__(self, player, db_manager):
+    def __init__(self, player, db_manager, cpu_time_budget=None):
         self.player = player
         self.db = db_manager
+        # CPUの探索は局面数（config.PVP_CPU_NODE_BUDGET）で打ち切る。対話プレイでは持ち時間（秒）の上限も付けられる
+        self.cpu_time_budget = cpu_time_budget
+        self.state = None  # 試合中のみ BattleState を保持する
+        self._ai = None  # 試合中のみ CPU の探索AI を保持する
+        self._skills = {}
 
     def start_match(self, round_number):
         if not self.player.is_alive(): return
@@ -21,59 +32,85 @@ class PvPSystem:
 
         stat_map = {}
         
-        for p in participants_data:
-            pid = p[0]
-            stat_map[pid] = {'atk': 0, 'def': 0, 'spd': 0, 'score_rate': 1.0, 'bounty': p[9]}
+        # アイテム消費はまとめて1回のコミットで確定する
+        with self.db.transaction():
+            for p in participants_data:
+                pid = p[0]
+                stat_map[pid] = {'atk': 0, 'def': 0, 'spd': 0, 'score_rate': 1.0, 'bounty': p[9]}
             
-            p_items = self.db.get_player_items(pid, "pvp_")
+                p_items = self.db.get_player_items(pid, "pvp_")
             
-            if pid == self.player.id and p_items:
-                print("\n🎒 PvPアイテム使用:")
+                if pid == self.player.id and p_items:
+                    print("\n🎒 PvPアイテム使用:")
             
-            for item in p_items:
-                i_id, i_name, i_type, i_val = item[0], item[1], item[3], item[4]
-                if i_type == "pvp_atk":
-                    stat_map[pid]['atk'] += i_val
-                    if pid == self.player.id: print(f"  ⚔️ {i_name} 消費 -> 攻撃力+{i_val}")
-                elif i_type == "pvp_def":
-                    stat_map[pid]['def'] += i_val
-                    if pid == self.player.id: print(f"  🛡️ {i_name} 消費 -> 防御力+{i_val}")
-                elif i_type == "pvp_spd":
-                    stat_map[pid]['spd'] += i_val
-                    if pid == self.player.id: print(f"  👟 {i_name} 消費 -> 素早さ+{i_val}")
-                elif i_type == "pvp_score":
-                    stat_map[pid]['score_rate'] = float(i_val)
-                    if pid == self.player.id: print(f"  💍 {i_name} 消費 -> スコア {i_val}倍")
-                self.db.consume_item(pid, i_id)
+                for item in p_items:
+                    i_id, i_name, i_type, i_val = item[0], item[1], item[3], item[4]
+                    if i_type == "pvp_atk":
+                        stat_map[pid]['atk'] += i_val
+                        if pid == self.player.id: print(f"  ⚔️ {i_name} 消費 -> 攻撃力+{i_val}")
+                    elif i_type == "pvp_def":
+                        stat_map[pid]['def'] += i_val
+                        if pid == self.player.id: print(f"  🛡️ {i_name} 消費 -> 防御力+{i_val}")
+                    elif i_type == "pvp_spd":
+                        stat_map[pid]['spd'] += i_val
+                        if pid == self.player.id: print(f"  👟 {i_name} 消費 -> 素早さ+{i_val}")
+                    elif i_type == "pvp_score":
+                        stat_map[pid]['score_rate'] = float(i_val)
+                        if pid == self.player.id: print(f"  💍 {i_name} 消費 -> スコア {i_val}倍")
+                    self.db.consume_item(pid, i_id)
             
-            if pid == self.player.id and p_items: print("")
+                if pid == self.player.id and p_items: print("")
+
+        # 以降の対戦中はHP/MP/状態異常をメモリ上で扱い、ターン終了時にまとめてDBへ書き戻す
+        # 大人数なら、生存者と狙える相手の索引を持つ RoyaleState にする（毎行動の全員確認をしない）
+        royale = len(participants_data) > PVP_ROYALE_THRESHOLD
+        self.state = (RoyaleState if royale else BattleState)(self.db, participants_data)
+        self._skills = {}
+
+        # Agilityが高い順、同値ならIDが小さい順（プレイヤー優先）。素早さは試合中に変わらないので1回だけ並べる
+        turn_order = sorted(participants_data, key=lambda x: (x[3] + stat_map[x[0]]['spd'], -x[0]), reverse=True)
+        if PVP_CPU_CONTROL and not royale:
+            # 攻撃力/防御力も試合中に変わらないので、CPUの探索に必要な情報は開始時に1回だけ渡す
+            self._ai = PvPSearchAI(
+                [p[0] for p in turn_order],
+                {p[0]: 10 + level_from_exp(p[6]) * 5 + stat_map[p[0]]['atk'] for p in participants_data},
+                {p[0]: stat_map[p[0]]['def'] for p in participants_data},
+                {p[0]: stat_map[p[0]]['bounty'] for p in participants_data},
+                {p[0]: self._get_skills(p[0]) for p in participants_data},
+                time_budget=self.cpu_time_budget,
+            )
+        has_bless = self.db.has_item_effect(self.player.id, "bless_regen")
 
         dead_record = []
         # 懸賞金（賞金首）討伐ボーナスはここに集計し、順位ポイント付与時に“勝ち残り順を崩さない範囲で”加算する
         bounty_bonus = {}
         turn_count = 0
+        if royale:
+            dead_record.extend(self.state.pop_fallen())
         
         while True:
             turn_count += 1
+            query_profiler.next_turn()
             living_count = self._count_living_players(participants_data)
             if living_count <= 1: break
 
             print(f"\n--- Turn {turn_count} (生存: {living_count}人) ---")
-            
-            # Agilityが高い順、同値ならIDが小さい順（プレイヤー優先）
-            turn_order = sorted(participants_data, key=lambda x: (x[3] + stat_map[x[0]]['spd'], -x[0]), reverse=True)
+            if royale:
+                # 倒れた参加者を行動順から外す（このターンの行動数に比例する手間で済む）
+                turn_order = [p for p in turn_order if self.state.is_alive(p[0])]
 
-            for p_data in turn_order:
+            for p_data in tracing.span_iter(turn_order, f"PvP Turn {turn_count}", args={"living": living_count}):
                 actor_id, actor_name, actor_exp = p_data[0], p_data[1], p_data[6]
-                
+            
                 hp, eff, turn = self._get_status(actor_id)
                 if hp <= 0:
-                    if actor_id not in dead_record: dead_record.append(actor_id)
+                    # 大人数の試合では倒れた時点で記録済み
+                    if not royale and actor_id not in dead_record: dead_record.append(actor_id)
                     continue
 
                 # 神の加護: 自分のターン開始時にHP+10（PvE/PvP）
-                if actor_id == self.player.id and self.db.has_item_effect(self.player.id, "bless_regen"):
-                    max_hp = 100 + (self.player.level * 10)
+                if actor_id == self.player.id and has_bless:
+                    max_hp = self.player.max_hp
                     healed = min(max_hp, hp + 10)
                     if healed != hp:
                         diff = healed - hp
@@ -82,7 +119,7 @@ class PvPSystem:
                         self._update_status(actor_id, hp, eff, turn)
                         print(f"✨ 神の加護: {actor_name} のHPが {diff} 回復した！ (HP: {hp})")
 
-                actor_lvl = (actor_exp // 100) + 1
+                actor_lvl = level_from_exp(actor_exp)
                 base_atk = 10 + (actor_lvl * 5)
                 final_atk = base_atk + stat_map[actor_id]['atk']
 
@@ -90,7 +127,7 @@ class PvPSystem:
                 if eff in ["氷結", "気絶"]:
                     print(f"❄️ {actor_name} は {eff} で動けない！")
                     skip_turn = True
-                
+            
                 if turn > 0:
                     turn -= 1
                     if turn == 0:
@@ -100,12 +137,23 @@ class PvPSystem:
 
                 if skip_turn: continue
 
-                if actor_id == self.player.id:
-                    self._manual_turn(actor_id, actor_name, final_atk, hp, stat_map, is_me=True)
+                with tracing.span(f"{actor_name} の行動", args={"player_id": actor_id}):
+                    if actor_id == self.player.id:
+                        self._manual_turn(actor_id, actor_name, final_atk, hp, stat_map, is_me=True)
+                    elif royale:
+                        self._royale_cpu_turn(actor_id, actor_name, final_atk, stat_map)
+                    elif PVP_CPU_CONTROL:
+                        self._cpu_turn(actor_id, actor_name, final_atk, stat_map)
+                    else:
+                        self._manual_turn(actor_id, actor_name, final_atk, hp, stat_map, is_me=False)
+            
+                if royale:
+                    self._record_fallen(actor_id, actor_name, dead_record, stat_map, bounty_bonus)
                 else:
-                    self._manual_turn(actor_id, actor_name, final_atk, hp, stat_map, is_me=False)
-                
-                self._check_deaths_and_bounty(actor_id, actor_name, participants_data, dead_record, stat_map, bounty_bonus)
+                    self._check_deaths_and_bounty(actor_id, actor_name, participants_data, dead_record, stat_map, bounty_bonus)
+                self.state.end_action()
+
+            self.state.flush()
 
         # バトルが完全に終了したタイミングで1回だけスコアを確定・加算する
         self._calculate_score_and_update_bounty(
@@ -115,17 +163,16 @@ class PvPSystem:
             stat_map[self.player.id]['score_rate'],
             round_number,
             bounty_bonus,
+            display_limit=10 if royale else None,
         )
+        self.state = None
+        self._ai = None
 
     def _get_participants_raw(self):
         return self.db.get_pvp_participants_raw()
 
     def _count_living_players(self, participants):
-        count = 0
-        for p in participants:
-            hp, _, _ = self._get_status(p[0])
-            if hp > 0: count += 1
-        return count
+        return self.state.living_count()
 
     def _check_deaths_and_bounty(self, attacker_id, attacker_name, participants, dead_record, stat_map, bounty_bonus):
         for p in participants:
@@ -143,15 +190,24 @@ class PvPSystem:
                     print(f"💰 {attacker_name} が賞金首 {target_name} を討ち取った！ (+{target_bounty}pt)")
                     bounty_bonus[attacker_id] = bounty_bonus.get(attacker_id, 0) + int(target_bounty)
 
+    def _record_fallen(self, attacker_id, attacker_name, dead_record, stat_map, bounty_bonus):
+        # _check_deaths_and_bounty の大人数版: この行動で倒れた参加者だけを見る
+        for pid in self.state.pop_fallen():
+            target_name = self._get_name(pid)
+            print(f"💀 {target_name} は力尽きた...")
+            dead_record.append(pid)
+
+            target_bounty = stat_map[pid]['bounty']
+            if target_bounty > 0:
+                print(f"💰 {attacker_name} が賞金首 {target_name} を討ち取った！ (+{target_bounty}pt)")
+                bounty_bonus[attacker_id] = bounty_bonus.get(attacker_id, 0) + int(target_bounty)
+
     def _manual_turn(self, pid, name, atk, hp, stat_map, is_me=False):
-        # 自分のMPはself.player.mpで持っているが、他人のMPはDBから取る必要がある
-        # 統一するため、常にDBから最新状態を取得する
-        row = self.db.get_or_create_player(name) # nameから取得
-        # row: id, name, hp, mp, exp, agi, score, eff, turn, bounty
-        current_mp = row[3]
+        # 自分のMPはself.player.mpで持っているが、統一するため常に対戦中の状態から取得する
+        current_mp = self._get_mp(pid)
 
         print(f"\n👉 {name} の番 (HP:{hp}, MP:{current_mp})")
-        skills = self.db.get_player_skills(pid)
+        skills = self._get_skills(pid)
         print("0. 通常攻撃")
         for i, s in enumerate(skills): 
             aoe = "[全体]" if s[5] else ""
@@ -163,8 +219,6 @@ class PvPSystem:
         except ValueError: act = 0
         
 
-        damage = 0
-        apply_eff = None
         is_aoe = False
         target = None
 
@@ -201,9 +255,16 @@ class PvPSystem:
             if not target:
                 target = enemies[0]
 
+        self._resolve_action(pid, name, atk, stat_map, act, selected_skill, target, enemies, is_me)
+
+    def _resolve_action(self, pid, name, atk, stat_map, act, selected_skill, target, enemies, is_me=False):
+        current_mp = self._get_mp(pid)
+        damage = 0
+        apply_eff = None
+        is_aoe = bool(selected_skill[5]) if selected_skill is not None else False
+
         # 攻撃行動を行う場合は、隠密を解除
-        # DB上のステータスを確認
-        eff, turn = row[7], row[8]
+        _, eff, turn = self._get_status(pid)
         
         if eff == "隠密" and act != 0 and selected_skill is not None and selected_skill[1] == "隠れ身":
             pass
@@ -233,7 +294,7 @@ class PvPSystem:
             else:
                 # MP消費
                 new_mp = current_mp - s_mp
-                self.db.update_player_mp(pid, new_mp)
+                self._set_mp(pid, new_mp)
                 if is_me: self.player.mp = new_mp
 
                 if s_name == "隠れ身":
@@ -275,16 +336,12 @@ class PvPSystem:
 
         # ダメージ適用
         if is_aoe:
-            aoe_enemies = self._get_enemies_list(pid, allow_stealth=False)
-            for enemy in aoe_enemies:
-                if damage > 0:
-                    enemy_def = stat_map[enemy['id']]['def']
-                    final_dmg = max(1, damage - enemy_def)
-                    self._damage_player(enemy['id'], final_dmg)
-                    print(f"    -> {enemy['name']} に {final_dmg} ダメージ！ (防:{enemy_def})")
-                    if apply_eff:
-                        self._set_effect(enemy['id'], apply_eff[0], apply_eff[1])
-                        print(f"    -> {enemy['name']} は {apply_eff[0]} になった！")
+            # 対象全員へのダメージと状態異常をまとめて反映する
+            defense = {p: s['def'] for p, s in stat_map.items() if s['def']}
+            for enemy_id, enemy_name, final_dmg, _ in self.state.apply_area_damage(pid, damage, defense, apply_eff):
+                print(f"    -> {enemy_name} に {final_dmg} ダメージ！ (防:{defense.get(enemy_id, 0)})")
+                if apply_eff:
+                    print(f"    -> {enemy_name} は {apply_eff[0]} になった！")
         elif target and damage > 0:
             enemy_def = stat_map[target['id']]['def']
             final_dmg = max(1, damage - enemy_def)
@@ -295,13 +352,40 @@ class PvPSystem:
                 print(f"    -> {target['name']} は {apply_eff[0]} になった！")
 
     def _cpu_turn(self, pid, name, atk, stat_map):
-        # 廃止されたが、念のため残すか、あるいは削除
-        pass
-
-    def _calculate_score_and_update_bounty(self, battle_id, participants, dead_record, my_multiplier, round_number, bounty_bonus):
+        hp, _, _ = self._get_status(pid)
+        print(f"\n🤖 {name} の番 (HP:{hp}, MP:{self._get_mp(pid)})")
+        choice = self._ai.choose(pid, self.state.snapshot())
+        if choice is None:
+            print("  (攻撃できる相手がいません...)")
+            return
+        act, selected_skill, target_id = choice
+        enemies = self._get_enemies_list(pid, allow_stealth=False)
+        target = next((e for e in enemies if e['id'] == target_id), None)
+        self._resolve_action(pid, name, atk, stat_map, act, selected_skill, target, enemies)
+
+    def _royale_cpu_turn(self, pid, name, atk, stat_map):
+        # 大人数の試合のCPU: 狙える相手からランダムに1人選び、MPの足りる単体攻撃の中で最も威力の高い技（無ければ通常攻撃）を使う
+        target_id = self.state.random_target(pid)
+        print(f"\n🤖 {name} の番")
+        if target_id is None:
+            print("  (攻撃できる相手がいません...)")
+            return
+        act, selected_skill = 0, None
+        mp = self._get_mp(pid)
+        for i, s in enumerate(self._get_skills(pid), start=1):
+            if s[5] or s[1] in ["ヒール", "隠れ身"] or s[2] > mp or s[3] <= 100:
+                continue
+            if selected_skill is None or s[3] > selected_skill[3]:
+                act, selected_skill = i, s
+        target = {'id': target_id, 'name': self._get_name(target_id)}
+        self._resolve_action(pid, name, atk, stat_map, act, selected_skill, target, None)
+
+    def _calculate_score_and_update_bounty(self, battle_id, participants, dead_record, my_multiplier, round_number, bounty_bonus, display_limit=None):
+        # display_limit: 表示する上位の人数（自分は常に表示する）。None なら全員
         rank_order = list(dead_record)
+        ranked = set(rank_order)
         for p in participants:
-            if p[0] not in rank_order:
+            if p[0] not in ranked:
                 rank_order.append(p[0])
         
         # 順位ごとのポイント定義 (1位, 2位, 3位, 4位...)
@@ -318,6 +402,11 @@ class PvPSystem:
         # 1位から順に表示するために逆順にする
         display_order = list(reversed(rank_order))
 
+        # 参加者の懸賞金は試合中に変わらないので、開始時に読み込んだ値を使う
+        current_bounty = {p[0]: p[9] for p in participants}
+        awards = {}
+        bounties = {}
+
         prev_awarded = None
         for i, pid in enumerate(display_order):
             rank = i + 1
@@ -350,17 +439,20 @@ class PvPSystem:
                     bonus_msg = " (賞金ptは順位維持のため加算なし)"
             
             p_name = self._get_name(pid)
-            print(f"  {rank}位: {p_name} (+{final_pt}pt{bonus_msg}){item_effect_msg}")
-            self.db.register_pvp_result(battle_id, pid, final_pt)
+            if display_limit is None or rank <= display_limit or pid == self.player.id:
+                print(f"  {rank}位: {p_name} (+{final_pt}pt{bonus_msg}){item_effect_msg}")
+            awards[pid] = awards.get(pid, 0) + final_pt
             prev_awarded = final_pt
 
             if pid == survivor_id:
-                current = self._get_bounty(pid)
-                new_bounty = min(50, current + 10)
-                self.db.update_bounty(pid, new_bounty)
+                new_bounty = min(50, current_bounty.get(pid, 0) + 10)
+                bounties[pid] = new_bounty
                 print(f"    👑 賞金首ボーナス！ {p_name} の懸賞金が {new_bounty}pt にアップ！")
             else:
-                self.db.update_bounty(pid, 0)
+                bounties[pid] = 0
+
+        # スコア・対戦結果・懸賞金を1トランザクションでまとめて確定する
+        self.db.settle_pvp_battle(battle_id, awards, bounties)
 
     def _apply_skill_effect(self, name, damage):
         if name == "ブリザード": return (damage, ("氷結", 1)) if random.random() < 0.3 else (damage, None)
@@ -369,26 +461,35 @@ class PvPSystem:
         return (damage, None)
 
     def _get_status(self, pid):
-        return self.db.get_player_status_row(pid)
+        return self.state.status(pid)
+
+    def _get_skills(self, pid):
+        # 対戦中にスキルは増えないので、参加者ごとに1回だけ取得する
+        if pid not in self._skills:
+            self._skills[pid] = self.db.get_player_skills(pid)
+        return self._skills[pid]
+
+    def _get_mp(self, pid):
+        return self.state.mp(pid)
 
-    def _get_bounty(self, pid):
-        return self.db.get_player_bounty(pid)
+    def _set_mp(self, pid, mp):
+        self.state.set_mp(pid, mp)
 
     def _update_status(self, pid, hp, eff, turn):
-        self.db.update_player_effect(pid, hp, eff, turn)
+        self.state.set_status(pid, hp, eff, turn)
 
     def _damage_player(self, pid, dmg):
-        self.db.damage_player_hp(pid, dmg)
+        self.state.damage(pid, dmg)
 
     def _set_effect(self, pid, eff, turn):
-        self.db.set_player_effect(pid, eff, turn)
+        self.state.set_effect(pid, eff, turn)
 
     def _update_me(self):
         self._update_status(self.player.id, self.player.hp, self.player.status_effect, self.player.status_turn)
-        self.db.update_player_mp(self.player.id, self.player.mp)
+        self._set_mp(self.player.id, self.player.mp)
 
     def _get_enemies_list(self, my_id, allow_stealth=False):
-        return self.db.get_enemies_list(my_id, allow_stealth=allow_stealth)
+        return self.state.enemies(my_id, allow_stealth=allow_stealth)
 
     def _get_name(self, pid):
-        return self.db.get_player_name(pid)
\ No newline at end of file
+        return self.state.name(pid)
\ No newline at end of file
@@ -0,0 +1,259 @@
+# query_profiler.py
+"""
+DBManager が発行するSQLの計測（config.DB_QUERY_PROFILE = True の時だけ有効）。
+- 1文ごとに 呼び出し元・所要時間・行数 を記録し、コミット数も数える
+- phase()（PvE/PvP/回復/ランキングなど）ごとに集計する
+- next_turn() で区切った1ターンの中で、同じSQLが何度も発行されていたら報告する
+  （同じパラメータなら重複、パラメータ違いなら参加者ごとのループ = N+1 の疑い）
+無効の時は active() が None を返すだけで、DBManager 側は何もしない。
+"""
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+import os
+import re
+import sys
+import time
+
+REPEAT_THRESHOLD = 3  # 1ターンでこの回数以上発行された同じSQLを報告する
+
+# 呼び出し元を探す時に飛ばすファイル（DBManager の内部）
+_INTERNAL_FILES = {"db_manager.py", "query_profiler.py", "contextlib.py", "extras.py", "master_data.py"}
+_SPACES = re.compile(r"\s+")
+
+_active = None
+
+
+class _Statement:
+    __slots__ = ("phase", "turn", "sql", "params", "site", "method", "seconds", "rows")
+
+    def __init__(self, phase, turn, sql, params, site, method, seconds, rows):
+        self.phase = phase
+        self.turn = turn
+        self.sql = sql
+        self.params = params
+        self.site = site
+        self.method = method
+        self.seconds = seconds
+        self.rows = rows
+
+
+class _ProfiledCursor:
+    """execute / executemany を計測し、それ以外はそのままカーソルへ渡す。"""
+
+    def __init__(self, cur, profiler):
+        self._cur = cur
+        self._profiler = profiler
+        self._last = None
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def execute(self, sql, params=None):
+        start = time.perf_counter()
+        result = self._cur.execute(sql) if params is None else self._cur.execute(sql, params)
+        self._last = self._profiler.record(sql, params, time.perf_counter() - start, self._cur.rowcount)
+        return result
+
+    def executemany(self, sql, seq):
+        seq = list(seq)
+        start = time.perf_counter()
+        result = self._cur.executemany(sql, seq)
+        self._last = self._profiler.record(sql, f"<{len(seq)} rows>", time.perf_counter() - start, self._cur.rowcount)
+        return result
+
+    # SELECT の行数は rowcount で取れない（sqlite は -1）ので、取り出した行数で数える
+    def fetchone(self):
+        row = self._cur.fetchone()
+        if row is not None:
+            self._add_rows(1)
+        return row
+
+    def fetchall(self):
+        rows = self._cur.fetchall()
+        self._add_rows(len(rows))
+        return rows
+
+    def fetchmany(self, size=None):
+        rows = self._cur.fetchmany() if size is None else self._cur.fetchmany(size)
+        self._add_rows(len(rows))
+        return rows
+
+    def _add_rows(self, n):
+        if self._last is not None:
+            self._last.rows = max(self._last.rows, 0) + n
+
+
+class QueryProfiler:
+    def __init__(self, repeat_threshold=REPEAT_THRESHOLD):
+        self.repeat_threshold = repeat_threshold
+        self.statements = []
+        self.commits = Counter()  # phase -> コミット数
+        self.phase_name = "other"
+        self.turn = 0  # 今のターンの通し番号（ターンの外は 0）
+        self._turns = 0
+
+    def wrap(self, cur):
+        return _ProfiledCursor(cur, self)
+
+    def record(self, sql, params, seconds, rowcount):
+        if isinstance(sql, bytes):
+            sql = sql.decode("utf-8", "replace")
+        site, method = _call_site()
+        stmt = _Statement(self.phase_name, self.turn, _SPACES.sub(" ", sql).strip(), _freeze(params),
+                          site, method, seconds, rowcount)
+        self.statements.append(stmt)
+        return stmt
+
+    def count_commit(self):
+        self.commits[self.phase_name] += 1
+
+    @contextmanager
+    def phase(self, name):
+        outer, outer_turn = self.phase_name, self.turn
+        self.phase_name, self.turn = name, 0
+        try:
+            yield self
+        finally:
+            self.phase_name, self.turn = outer, outer_turn
+
+    def next_turn(self):
+        # 別の試合の同じターン番号と混ざらないよう、通し番号にする
+        self._turns += 1
+        self.turn = self._turns
+
+    def phase_summary(self):
+        """[(phase, 文数, コミット数, 合計秒, 行数)]"""
+        stats = defaultdict(lambda: [0, 0.0, 0])
+        for s in self.statements:
+            st = stats[s.phase]
+            st[0] += 1
+            st[1] += s.seconds
+            st[2] += max(s.rows, 0)
+        phases = list(stats) + [p for p in self.commits if p not in stats]
+        return [(p, stats[p][0], self.commits[p], stats[p][1], stats[p][2]) for p in phases]
+
+    def statement_summary(self):
+        """SQLごとに [(SQL, 回数, 合計秒, 行数, 呼び出し元Counter)] を合計時間の長い順で返す。"""
+        stats = {}
+        for s in self.statements:
+            st = stats.setdefault(s.sql, [0, 0.0, 0, Counter()])
+            st[0] += 1
+            st[1] += s.seconds
+            st[2] += max(s.rows, 0)
+            st[3][_label(s)] += 1
+        return sorted(((sql, *st) for sql, st in stats.items()), key=lambda r: -r[2])
+
+    def repeated_in_turn(self):
+        """
+        1ターンの中で repeat_threshold 回以上発行されたSQL。
+        [(phase, SQL, 該当ターン数, 1ターンの最大回数, 異なるパラメータの最大数, 呼び出し元Counter)]
+        """
+        by_turn = defaultdict(list)
+        for s in self.statements:
+            if s.turn > 0:
+                by_turn[(s.turn, s.sql)].append(s)
+        found = {}
+        for (_, sql), stmts in by_turn.items():
+            phase = stmts[0].phase
+            if len(stmts) < self.repeat_threshold:
+                continue
+            f = found.setdefault((phase, sql), [0, 0, 0, Counter()])
+            f[0] += 1
+            f[1] = max(f[1], len(stmts))
+            f[2] = max(f[2], len({s.params for s in stmts}))
+            for s in stmts:
+                f[3][_label(s)] += 1
+        return sorted(((phase, sql, *f) for (phase, sql), f in found.items()), key=lambda r: (-r[3], r[0]))
+
+    def report(self, top=10):
+        lines = ["\n🔎 クエリ計測"]
+        lines.append(f"  {'フェーズ':<10} {'文数':>6} {'コミット':>8} {'合計(ms)':>10} {'行数':>7}")
+        for phase, count, commits, seconds, rows in self.phase_summary():
+            lines.append(f"  {phase:<10} {count:>6} {commits:>8} {seconds * 1000:>10.2f} {rows:>7}")
+
+        lines.append(f"\n  合計時間の長いSQL (上位{top}件):")
+        for sql, count, seconds, rows, sites in self.statement_summary()[:top]:
+            lines.append(f"  {count:>5}回 {seconds * 1000:>8.2f}ms {rows:>6}行  {_short(sql)}")
+            lines.append(f"        {_sites(sites)}")
+
+        repeated = self.repeated_in_turn()
+        if repeated:
+            lines.append(f"\n  ⚠️ 1ターンに{self.repeat_threshold}回以上発行されたSQL:")
+            for phase, sql, turns, most, distinct, sites in repeated:
+                kind = "同じパラメータで重複" if distinct == 1 else f"パラメータ違い{distinct}種 (N+1の疑い)"
+                lines.append(f"  [{phase}] {turns}ターンで最大{most}回 / {kind}  {_short(sql)}")
+                lines.append(f"        {_sites(sites)}")
+        return "\n".join(lines)
+
+
+def _freeze(params):
+    if isinstance(params, (list, tuple)):
+        return tuple(_freeze(p) for p in params)
+    if isinstance(params, dict):
+        return tuple(sorted(params.items()))
+    return params
+
+
+def _call_site():
+    """(DBManagerの外で最初に見つかった呼び出し元 'file:line func', 呼ばれた DBManager のメソッド名)"""
+    frame = sys._getframe(1)
+    method = None
+    while frame is not None:
+        filename = os.path.basename(frame.f_code.co_filename)
+        if filename not in _INTERNAL_FILES:
+            return f"{filename}:{frame.f_lineno} {frame.f_code.co_name}", method
+        if filename == "db_manager.py":
+            # 内部で呼び合っている場合は、一番外側（ゲームのコードから呼ばれた）メソッドを残す
+            method = frame.f_code.co_name
+        frame = frame.f_back
+    return "?", method
+
+
+def _label(s):
+    return f"{s.method} <- {s.site}" if s.method else s.site
+
+
+def _short(sql, width=90):
+    return sql if len(sql) <= width else sql[:width - 3] + "..."
+
+
+def _sites(sites, limit=2):
+    text = ", ".join(f"{site} ({n})" for site, n in sites.most_common(limit))
+    if len(sites) > limit:
+        text += f" 他{len(sites) - limit}箇所"
+    return text
+
+
+def enable(profiler=None):
+    """計測を始め、記録先の QueryProfiler を返す。"""
+    global _active
+    _active = profiler or QueryProfiler()
+    return _active
+
+
+def disable():
+    global _active
+    _active = None
+
+
+def active():
+    return _active
+
+
+@contextmanager
+def phase(name):
+    """ブロック内のSQLを name のフェーズとして集計する（計測していなければ何もしない）。"""
+    if _active is None:
+        yield None
+        return
+    with _active.phase(name) as profiler:
+        yield profiler
+
+
+def next_turn():
+    """次のターンに入ったことを記録する（計測していなければ何もしない）。"""
+    if _active is not None:
+        _active.next_turn()
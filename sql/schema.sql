@@ -42,7 +42,7 @@ CREATE TABLE IF NOT EXISTS initial_selections (
 -- 2. プレイヤー・状態系
 CREATE TABLE IF NOT EXISTS players (
     player_id SERIAL PRIMARY KEY,
-    player_name VARCHAR(50) NOT NULL UNIQUE,
+    player_name VARCHAR(50) NOT NULL,
     hp INT DEFAULT 100,
     mp INT DEFAULT 50,
     exp INT DEFAULT 0,
@@ -52,7 +52,9 @@ CREATE TABLE IF NOT EXISTS players (
     score INT DEFAULT 0,
     status_effect VARCHAR(20) DEFAULT NULL,
     status_turn INT DEFAULT 0,
-    bounty INT DEFAULT 0
+    bounty INT DEFAULT 0,
+    -- 同じDBで複数のゲームを並行させる時の区切り（名前の一意性は migrations.py の v2 でセッション内に限定）
+    session_id VARCHAR(64) NOT NULL DEFAULT ''
 );
 
 CREATE TABLE IF NOT EXISTS player_items (
@@ -87,6 +89,7 @@ CREATE TABLE IF NOT EXISTS pvp_battles (
     battle_id SERIAL PRIMARY KEY,
     player_id INT NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    session_id VARCHAR(64) NOT NULL DEFAULT '',
     FOREIGN KEY (player_id) REFERENCES players(player_id)
 );
 
@@ -99,3 +102,23 @@ CREATE TABLE IF NOT EXISTS pvp_results (
     FOREIGN KEY (battle_id) REFERENCES pvp_battles(battle_id) ON DELETE CASCADE,
     FOREIGN KEY (player_id) REFERENCES players(player_id) ON DELETE CASCADE
 );
+
+-- スキーマのバージョン管理（migrations.py が適用済みバージョンを記録する）
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INT PRIMARY KEY,
+    description VARCHAR(100),
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 4. インデックス（実際のクエリに合わせたもの）
+-- players / pvp_battles の session_id を先頭にしたインデックスは migrations.py の v2 で作る
+-- has_item_effect 等: effect_type = %s
+CREATE INDEX IF NOT EXISTS idx_items_effect_type ON items (effect_type);
+-- get_items_by_type / get_player_items: effect_type LIKE 'pvp_%'（前方一致はロケールに依存しない pattern_ops が必要）
+CREATE INDEX IF NOT EXISTS idx_items_effect_type_prefix ON items (effect_type varchar_pattern_ops);
+-- 名前での引き当て（_ensure_required_master_data / get_item_id_by_name / log_pve）。同名の重複も防ぐ
+CREATE UNIQUE INDEX IF NOT EXISTS idx_items_item_name ON items (item_name);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_monsters_monster_name ON monsters (monster_name);
+-- プレイヤー単位の履歴参照と、players削除時のCASCADE
+CREATE INDEX IF NOT EXISTS idx_pve_logs_player_id ON pve_logs (player_id);
+CREATE INDEX IF NOT EXISTS idx_pvp_results_player_id ON pvp_results (player_id);
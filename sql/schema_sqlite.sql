@@ -42,7 +42,7 @@ CREATE TABLE IF NOT EXISTS initial_selections (
 
 CREATE TABLE IF NOT EXISTS players (
   player_id INTEGER PRIMARY KEY AUTOINCREMENT,
-  player_name TEXT NOT NULL UNIQUE,
+  player_name TEXT NOT NULL,
   hp INTEGER DEFAULT 100,
   mp INTEGER DEFAULT 50,
   exp INTEGER DEFAULT 0,
@@ -50,7 +50,9 @@ CREATE TABLE IF NOT EXISTS players (
   score INTEGER DEFAULT 0,
   status_effect TEXT DEFAULT NULL,
   status_turn INTEGER DEFAULT 0,
-  bounty INTEGER DEFAULT 0
+  bounty INTEGER DEFAULT 0,
+  -- 同じDBで複数のゲームを並行させる時の区切り（名前の一意性は migrations.py の v2 でセッション内に限定）
+  session_id TEXT NOT NULL DEFAULT ''
 );
 
 CREATE TABLE IF NOT EXISTS player_items (
@@ -84,6 +86,7 @@ CREATE TABLE IF NOT EXISTS pvp_battles (
   battle_id INTEGER PRIMARY KEY AUTOINCREMENT,
   player_id INTEGER NOT NULL,
   created_at TEXT DEFAULT (datetime('now')),
+  session_id TEXT NOT NULL DEFAULT '',
   FOREIGN KEY (player_id) REFERENCES players(player_id)
 );
 
@@ -95,3 +98,19 @@ CREATE TABLE IF NOT EXISTS pvp_results (
   FOREIGN KEY (battle_id) REFERENCES pvp_battles(battle_id) ON DELETE CASCADE,
   FOREIGN KEY (player_id) REFERENCES players(player_id) ON DELETE CASCADE
 );
+
+CREATE TABLE IF NOT EXISTS schema_version (
+  version INTEGER PRIMARY KEY,
+  description TEXT,
+  applied_at TEXT DEFAULT (datetime('now'))
+);
+
+-- インデックス（実際のクエリに合わせたもの）
+-- players / pvp_battles の session_id を先頭にしたインデックスは migrations.py の v2 で作る
+CREATE INDEX IF NOT EXISTS idx_items_effect_type ON items (effect_type);
+-- LIKEは大文字小文字を区別しないため、前方一致の最適化にはNOCASEのインデックスが必要
+CREATE INDEX IF NOT EXISTS idx_items_effect_type_prefix ON items (effect_type COLLATE NOCASE);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_items_item_name ON items (item_name);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_monsters_monster_name ON monsters (monster_name);
+CREATE INDEX IF NOT EXISTS idx_pve_logs_player_id ON pve_logs (player_id);
+CREATE INDEX IF NOT EXISTS idx_pvp_results_player_id ON pvp_results (player_id);
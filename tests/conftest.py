@@ -0,0 +1,38 @@
+# tests/conftest.py
+import os
+import sys
+
+import pytest
+
+# リポジトリ直下のモジュール（db_manager など）を import できるようにする
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_manager import DBManager  # noqa: E402
+from db_pool import create_pool  # noqa: E402
+from memory_db import MemoryDBManager  # noqa: E402
+
+
+@pytest.fixture
+def open_sqlite():
+    """open_sqlite(path, session_id=None) で SQLite の DBManager を開く（テストの終わりにプールを閉じる）。"""
+    pools = []
+
+    def _open(path, session_id=None, pool=None):
+        if pool is None:
+            pool = create_pool("sqlite", sqlite_path=str(path))
+            pools.append(pool)
+        return DBManager(pool=pool, session_id=session_id)
+
+    yield _open
+    for pool in pools:
+        pool.close_all()
+
+
+@pytest.fixture(params=["sqlite", "memory"])
+def db(request, tmp_path, open_sqlite):
+    """初期化済みのDB（SQLite は一時ディレクトリのファイル、memory は MemoryDBManager）。"""
+    if request.param == "memory":
+        return MemoryDBManager()
+    manager = open_sqlite(tmp_path / "test.sqlite3")
+    manager.reset_all_game_data()
+    return manager
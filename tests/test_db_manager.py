@@ -0,0 +1,266 @@
+# tests/test_db_manager.py
+"""DBManager.transaction() のロールバック/SAVEPOINT と、migrate() による古いDBの更新。"""
+import sqlite3
+
+import pytest
+
+from config import DB_POOL_MAX_SIZE
+import migrations
+from migrations import LATEST_VERSION, migrate, read_version
+
+
+class _Boom(Exception):
+    pass
+
+
+def _hp(db, pid):
+    return db.get_player_status_row(pid)[0]
+
+
+def _item_qty(db, pid, item_id):
+    return {r[0]: r[-1] for r in db.get_player_items(pid)}.get(item_id, 0)
+
+
+def test_transaction_rolls_back_every_write_on_error(db):
+    pid = db.get_or_create_player("Hero")[0]
+    bless = db.get_item_id_by_name("神の加護")
+
+    with pytest.raises(_Boom):
+        with db.transaction():
+            db.update_player_status(pid, 1, 0, 500)
+            db.add_item(pid, bless)
+            db.get_or_create_player("Ghost")
+            raise _Boom
+
+    assert _hp(db, pid) == 100
+    assert _item_qty(db, pid, bless) == 0
+    assert [r[1] for r in db.get_ranking()] == ["Hero"]
+
+
+def test_nested_transaction_rolls_back_only_the_inner_block(db):
+    pid = db.get_or_create_player("Hero")[0]
+    bless = db.get_item_id_by_name("神の加護")
+
+    with db.transaction():
+        db.update_player_status(pid, 80, 40, 10)
+        with pytest.raises(_Boom):
+            with db.transaction():
+                db.add_item(pid, bless)
+                db.update_player_status(pid, 1, 0, 999)
+                raise _Boom
+        # 内側を取り消した後も、外側のトランザクションは使い続けられる
+        with db.transaction():
+            db.add_item(pid, bless)
+
+    assert _hp(db, pid) == 80
+    assert _item_qty(db, pid, bless) == 1
+
+
+def test_error_in_outer_block_discards_committed_inner_savepoint(db):
+    pid = db.get_or_create_player("Hero")[0]
+
+    with pytest.raises(_Boom):
+        with db.transaction():
+            with db.transaction():
+                db.update_player_status(pid, 5, 0, 0)
+            raise _Boom
+
+    assert _hp(db, pid) == 100
+
+
+def test_rollback_reloads_leaderboard(db):
+    hero = db.get_or_create_player("Hero")[0]
+    cpu = db.get_or_create_player("CPU")[0]
+    assert db.leaderboard.rank_of(hero) == 1
+
+    with pytest.raises(_Boom):
+        with db.transaction():
+            db.register_pvp_result(None, cpu, 100)
+            assert db.leaderboard.top_k(1)[0][0] == cpu
+            raise _Boom
+
+    assert [r[2] for r in db.leaderboard.top_k(2)] == [0, 0]
+    assert db.leaderboard.top_k(2) == list(db.get_ranking())
+
+
+def test_transaction_commits_only_when_the_outermost_block_exits(tmp_path, open_sqlite):
+    path = tmp_path / "tx.sqlite3"
+    db = open_sqlite(path)
+    pid = db.get_or_create_player("Hero")[0]
+    other = sqlite3.connect(str(path))
+    try:
+        with db.transaction():
+            with db.transaction():
+                db.update_player_status(pid, 42, 0, 0)
+            # 内側を抜けてもまだ確定していない（別の接続からは見えない）
+            assert other.execute("SELECT hp FROM players WHERE player_id = ?", (pid,)).fetchone()[0] == 100
+        assert other.execute("SELECT hp FROM players WHERE player_id = ?", (pid,)).fetchone()[0] == 42
+    finally:
+        other.close()
+
+
+
+def test_sessions_on_one_thread_share_one_connection(tmp_path, open_sqlite):
+    db = open_sqlite(tmp_path / "sessions.sqlite3")
+    # プールの上限より多いセッションを1スレッドで開いても、コネクション待ちにならない
+    sessions = [open_sqlite(None, session_id=f"s{i}", pool=db.pool) for i in range(DB_POOL_MAX_SIZE + 2)]
+    for i, room in enumerate(sessions):
+        room.get_or_create_player(f"P{i}")
+    assert len({room.get_connection() for room in sessions}) == 1
+
+    # 別セッションの書き込みも、外側の transaction() と一緒に取り消される
+    with pytest.raises(_Boom):
+        with sessions[0].transaction():
+            sessions[0].get_or_create_player("Ghost0")
+            sessions[1].get_or_create_player("Ghost1")
+            raise _Boom
+    assert [r[1] for r in sessions[1].get_ranking()] == ["P1"]
+
+    # transaction() の途中では、別の DBManager から返却してもコネクションは手放さない
+    with sessions[0].transaction():
+        conn = sessions[0].get_connection()
+        sessions[1].release_connection()
+        assert sessions[1].get_connection() is conn
+
+
+# 最初の版（schema_version も session_id も無い）の players / player_items
+_V0_SCHEMA = """
+CREATE TABLE items (
+  item_id INTEGER PRIMARY KEY AUTOINCREMENT,
+  item_name TEXT NOT NULL,
+  rarity INTEGER DEFAULT 1,
+  effect_type TEXT DEFAULT NULL,
+  effect_value INTEGER DEFAULT NULL,
+  description TEXT DEFAULT NULL
+);
+CREATE TABLE players (
+  player_id INTEGER PRIMARY KEY AUTOINCREMENT,
+  player_name TEXT NOT NULL UNIQUE,
+  hp INTEGER DEFAULT 100,
+  mp INTEGER DEFAULT 50,
+  exp INTEGER DEFAULT 0,
+  agility INTEGER DEFAULT 10,
+  score INTEGER DEFAULT 0,
+  status_effect TEXT DEFAULT NULL,
+  status_turn INTEGER DEFAULT 0,
+  bounty INTEGER DEFAULT 0
+);
+CREATE TABLE player_items (
+  player_id INTEGER NOT NULL,
+  item_id INTEGER NOT NULL,
+  quantity INTEGER DEFAULT 1,
+  PRIMARY KEY (player_id, item_id),
+  FOREIGN KEY (player_id) REFERENCES players(player_id) ON DELETE CASCADE,
+  FOREIGN KEY (item_id) REFERENCES items(item_id) ON DELETE CASCADE
+);
+INSERT INTO items (item_name, rarity, effect_type, effect_value) VALUES ('古い剣', 1, 'pvp_atk', 5);
+INSERT INTO players (player_name, hp, exp, score) VALUES ('Hero', 70, 250, 30);
+INSERT INTO player_items (player_id, item_id, quantity) VALUES (1, 1, 2);
+"""
+
+
+@pytest.fixture
+def v0_path(tmp_path):
+    path = tmp_path / "v0.sqlite3"
+    conn = sqlite3.connect(str(path))
+    conn.executescript(_V0_SCHEMA)
+    conn.close()
+    return path
+
+
+def test_migrate_upgrades_v0_database_without_losing_rows(v0_path, open_sqlite):
+    db = open_sqlite(v0_path)
+    assert read_version(db) == LATEST_VERSION
+    # players を作り直しても、行も子テーブルの行（CASCADE で消えやすい）も残る
+    hero = db.get_or_create_player("Hero")
+    assert (hero[0], hero[2], hero[4]) == (1, 70, 250)
+    assert db.get_ranking() == [(1, "Hero", 30)]
+    assert _item_qty(db, 1, 1) == 2
+    # 初期マスタも入る
+    assert db.get_item_id_by_name("神の加護") is not None
+
+    # 名前の一意性はセッション内だけになる
+    room = open_sqlite(v0_path, session_id="room1", pool=db.pool)
+    assert room.get_or_create_player("Hero")[0] != 1
+
+
+def test_migrate_is_a_no_op_on_a_current_database(v0_path, open_sqlite):
+    db = open_sqlite(v0_path)
+    assert migrate(db) is False
+    versions = [r[0] for r in db.get_connection().execute("SELECT version FROM schema_version ORDER BY version")]
+    assert versions == list(range(1, LATEST_VERSION + 1))
+
+
+def test_failed_migration_leaves_the_database_untouched(v0_path, open_sqlite, monkeypatch):
+    def broken(db, cur):
+        raise _Boom
+
+    monkeypatch.setattr(migrations, "MIGRATIONS", migrations.MIGRATIONS + [(LATEST_VERSION + 1, "broken", broken)])
+    monkeypatch.setattr(migrations, "LATEST_VERSION", LATEST_VERSION + 1)
+    with pytest.raises(_Boom):
+        open_sqlite(v0_path)
+
+    # v1 / v2 も含めてすべて取り消され、元の v0 のまま
+    conn = sqlite3.connect(str(v0_path))
+    try:
+        tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        assert "schema_version" not in tables
+        columns = [r[1] for r in conn.execute("PRAGMA table_info(players)")]
+        assert "session_id" not in columns
+        assert conn.execute("SELECT player_name, hp FROM players").fetchall() == [("Hero", 70)]
+    finally:
+        conn.close()
+
+
+def test_reset_restores_the_clean_snapshot(tmp_path, open_sqlite, monkeypatch):
+    path = tmp_path / "snap.sqlite3"
+    db = open_sqlite(path)
+    db.reset_all_game_data()  # 1回目は DELETE で初期化し、スナップショットを作る
+    assert (tmp_path / "snap.sqlite3.clean").exists()
+
+    pid = db.get_or_create_player("Hero")[0]
+    db.add_item(pid, db.get_item_id_by_name("神の加護"))
+    db.log_pve(pid, "スライム", True)
+    # 2回目以降は DELETE を使わず、スナップショットの復元だけで初期化する
+    monkeypatch.setattr(db, "_delete_game_data", lambda: pytest.fail("スナップショットが使われなかった"))
+    db.reset_all_game_data()
+
+    assert db.get_ranking() == []
+    # AUTOINCREMENT も初期状態に戻る
+    assert db.get_or_create_player("Again")[0] == 1
+    assert db.get_item_id_by_name("神の加護") is not None
+    assert read_version(db) == LATEST_VERSION
+
+
+def test_area_damage_hits_every_listed_target(db):
+    hero, dead, hidden, other = (db.get_or_create_player(n)[0] for n in ("Hero", "Dead", "Hidden", "Other"))
+    db.update_player_status(dead, 0, 0, 0)
+    db.set_player_effect(hidden, "隠密", 2)
+
+    # 既定では生存していて隠密でない相手だけ
+    assert [h[0] for h in db.apply_area_damage(hero, 10)] == [other]
+    # target_ids を渡せば、選ばれた相手全員にそのまま当たる
+    hits = db.apply_area_damage(hero, 10, effect=("毒", 3), target_ids=[dead, hidden])
+    assert [(h[0], h[2]) for h in hits] == [(dead, 10), (hidden, 10)]
+    assert db.get_player_status_row(dead)[:2] == (-10, "毒")
+    assert _hp(db, other) == 90
+
+
+def test_full_reset_discards_every_session_journal(tmp_path, open_sqlite):
+    path = tmp_path / "journal.sqlite3"
+    db = open_sqlite(path)
+    room = open_sqlite(path, session_id="room1", pool=db.pool)
+    room.journal_player_status(room.get_or_create_player("Old")[0], 5, 0, 0)
+    # 別のプロセスが書き戻す前に落ちたセッションのジャーナル
+    crashed = tmp_path / "journal.sqlite3.room2.pve_journal"
+    crashed.write_text('[1, 5, 0, 0, null, 0]\n', encoding="utf-8")
+
+    db.reset_all_game_data()
+    assert not crashed.exists() and not (tmp_path / "journal.sqlite3.room1.pve_journal").exists()
+    assert room.journal.take_pending() == []
+
+    # 振り直された player_id 1 に、古いジャーナルの状態が書き戻されない
+    hero = db.get_or_create_player("Hero")[0]
+    assert hero == 1
+    open_sqlite(path, session_id="room2", pool=db.pool)
+    assert _hp(db, hero) == 100
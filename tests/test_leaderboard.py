@@ -0,0 +1,56 @@
+# tests/test_leaderboard.py
+"""Leaderboard の並び・dense rank が DB の ORDER BY / DENSE_RANK と一致すること。"""
+import random
+
+from leaderboard import Leaderboard
+
+
+def _expected(scores):
+    # get_ranking と同じ並び（score 降順、同点は player_id 昇順）と dense rank
+    rows = sorted(((pid, f"P{pid}", s) for pid, s in scores.items()), key=lambda r: (-r[2], r[0]))
+    distinct = sorted(set(scores.values()), reverse=True)
+    return rows, {pid: distinct.index(s) + 1 for pid, s in scores.items()}
+
+
+def test_random_updates_match_a_full_sort():
+    rng = random.Random(0)
+    board = Leaderboard()
+    scores = {}
+    for _ in range(2000):
+        pid = rng.randrange(1, 60)
+        if pid in scores and rng.random() < 0.7:
+            delta = rng.choice([0, 10, 30, -10])
+            board.add_score(pid, delta)
+            scores[pid] += delta
+        else:
+            score = rng.randrange(0, 5) * 10
+            board.set_score(pid, f"P{pid}", score)
+            scores[pid] = score
+
+        rows, ranks = _expected(scores)
+        k = rng.randrange(0, len(rows) + 2)
+        assert board.top_k(k) == rows[:k]
+        assert board.bottom_k(k) == (rows[-k:] if k else [])
+        assert board.rank_of(pid) == ranks[pid]
+
+    assert [board.rank_of(pid) for pid in sorted(scores)] == [ranks[pid] for pid in sorted(scores)]
+
+
+def test_ties_share_a_rank_and_reset_scores():
+    board = Leaderboard([(1, "A", 50), (2, "B", 50), (3, "C", 20), (4, "D", 0)])
+    assert [board.rank_of(pid) for pid in (1, 2, 3, 4)] == [1, 1, 2, 3]
+    assert board.rank_of(99) is None
+
+    board.reset_scores()
+    assert board.top_k(4) == [(1, "A", 0), (2, "B", 0), (3, "C", 0), (4, "D", 0)]
+    assert {board.rank_of(pid) for pid in (1, 2, 3, 4)} == {1}
+
+
+def test_matches_db_dense_ranking(db):
+    for name, point in [("A", 30), ("B", 10), ("C", 30), ("D", 0)]:
+        pid = db.get_or_create_player(name)[0]
+        db.register_pvp_result(None, pid, point)
+    board = db.leaderboard
+    dense = db.get_dense_ranking()
+    assert [r[:3] for r in dense] == board.top_k(len(board))
+    assert [r[3] for r in dense] == [board.rank_of(r[0]) for r in dense]
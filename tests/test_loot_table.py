@@ -0,0 +1,50 @@
+# tests/test_loot_table.py
+"""LootTable の alias 表が、重みどおりの確率で引けること。"""
+import random
+
+import pytest
+
+from loot_table import LootTable, rarity_weight
+
+
+def _probabilities(table):
+    # 列 i は 1/n の確率で選ばれ、その中で prob[i] なら自分、残りは alias[i]
+    n = len(table)
+    probs = {}
+    for i in range(n):
+        probs[table.entries[i]] = probs.get(table.entries[i], 0.0) + table._prob[i] / n
+        alias = table.entries[table._alias[i]]
+        probs[alias] = probs.get(alias, 0.0) + (1.0 - table._prob[i]) / n
+    return probs
+
+
+@pytest.mark.parametrize("weights", [[1], [1, 1, 1], [60, 25, 10, 4, 1], [0, 3, 0, 1], [0.5, 7, 2.5]])
+def test_alias_table_matches_weights(weights):
+    table = LootTable(list("abcde")[:len(weights)], weights)
+    probs = _probabilities(table)
+    total = sum(weights)
+    for entry, w in zip(table.entries, weights):
+        assert probs.get(entry, 0.0) == pytest.approx(w / total, abs=1e-12)
+
+
+def test_draws_follow_weights_and_seed():
+    table = LootTable(["common", "rare", "never"], [9, 1, 0])
+    drawn = table.draw_many(20000, random.Random(1))
+    assert "never" not in drawn
+    assert drawn.count("rare") / len(drawn) == pytest.approx(0.1, abs=0.01)
+    # 同じシードなら draw と draw_many は同じ列になる
+    rng = random.Random(1)
+    assert [table.draw(rng) for _ in range(100)] == drawn[:100]
+
+
+def test_from_items_and_invalid_weights():
+    items = [(1, "薬草", 1), (2, "剣", 3), (3, "王冠", 9)]
+    table = LootTable.from_items(items, [50, 30, 15])
+    assert [rarity_weight(r[2], [50, 30, 15]) for r in items] == [50, 15, 15]
+    # 範囲外のレア度（0以下や NULL）は元の else 分岐と同じく最後の重み
+    assert [rarity_weight(r, (60, 30, 9, 1)) for r in (1, 2, 3, 4, 5, 0, -1, None)] == [60, 30, 9, 1, 1, 1, 1, 1]
+    assert set(table.entries) == set(items)
+    assert LootTable.from_items([], [1]) is None
+    for entries, weights in [([], []), (["a"], [0]), (["a", "b"], [1, -1]), (["a"], [1, 2])]:
+        with pytest.raises(ValueError):
+            LootTable(entries, weights)
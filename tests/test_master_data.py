@@ -0,0 +1,108 @@
+# tests/test_master_data.py
+"""MasterData（items / skills / monsters のスナップショット）の読み込み回数・不変性・読み直し。"""
+import sqlite3
+
+import pytest
+
+from master_data import MasterData
+
+_WEIGHTS = (60, 25, 10, 4, 1)
+
+
+@pytest.fixture
+def load_calls(monkeypatch):
+    """MasterData.load が呼ばれた回数を数える。"""
+    calls = []
+    load = MasterData.load
+
+    def counting(cls, cur, **kwargs):
+        calls.append(cls)
+        return load(cur, **kwargs)
+
+    monkeypatch.setattr(MasterData, "load", classmethod(counting))
+    return calls
+
+
+def _add_item(db, name):
+    with db._cursor() as cur:
+        cur.execute(
+            db._ph("INSERT INTO items (item_name, rarity, effect_type, effect_value) VALUES (%s, %s, %s, %s)"),
+            (name, 2, "pvp_atk", 7),
+        )
+    db._commit()
+
+
+def test_master_data_is_read_once(tmp_path, open_sqlite, load_calls):
+    db = open_sqlite(tmp_path / "master.sqlite3")
+    pid = db.get_or_create_player("Hero")[0]
+    for _ in range(3):
+        assert db.get_item_id_by_name("神の加護") is not None
+        assert db.get_items_by_type("pvp_")
+        assert db.get_learnable_skills(pid)
+        db.log_pve(pid, "スライム", True)
+    assert db.get_loot_table("pvp_", _WEIGHTS) is db.get_loot_table("pvp_", list(_WEIGHTS))
+    assert len(load_calls) == 1
+
+
+def test_master_data_is_immutable(db):
+    master = db.master_data
+    assert isinstance(master.items, tuple) and all(isinstance(r, tuple) for r in master.items)
+    with pytest.raises(TypeError):
+        master._item_id_by_name["偽物"] = 1
+    # 呼び出し側がリストを書き換えても、キャッシュには影響しない
+    rows = db.get_items_by_type("pvp_")
+    rows.clear()
+    assert db.get_items_by_type("pvp_") == list(master.items_by_type("pvp_"))
+    assert master.items_by_type("pvp_") is master.items_by_type("pvp_")
+
+
+def test_invalidate_rebuilds_the_cache(tmp_path, open_sqlite, load_calls):
+    db = open_sqlite(tmp_path / "master.sqlite3")
+    table = db.get_loot_table("pvp_", _WEIGHTS)
+    _add_item(db, "試作の剣")
+    # 無効化するまでは古いスナップショットのまま
+    assert db.get_item_id_by_name("試作の剣") is None
+
+    db.invalidate_master_data()
+    assert db.get_item_id_by_name("試作の剣") is not None
+    assert "試作の剣" in [r[1] for r in db.get_items_by_type("pvp_")]
+    rebuilt = db.get_loot_table("pvp_", _WEIGHTS)
+    assert rebuilt is not table and len(rebuilt) == len(table) + 1
+    assert len(load_calls) == 2
+
+
+def test_reset_from_snapshot_rereads_master_data(tmp_path, open_sqlite):
+    db = open_sqlite(tmp_path / "master.sqlite3")
+    db.reset_all_game_data()  # スナップショットを作る
+    _add_item(db, "試作の剣")
+    db.invalidate_master_data()
+    assert db.get_item_id_by_name("試作の剣") is not None
+
+    # スナップショットの復元でマスタも巻き戻るので、キャッシュも読み直される
+    db.reset_all_game_data()
+    assert db.get_item_id_by_name("試作の剣") is None
+    assert "試作の剣" not in [r[1] for r in db.get_items_by_type("pvp_")]
+
+
+@pytest.mark.parametrize("ignore_case, expected", [(True, [1, 2, 3]), (False, [1, 3])])
+def test_items_by_type_matches_like(ignore_case, expected):
+    # LIKE 'pvp_%' と同じく '_' は任意の1文字。SQLite では ASCII の大文字小文字を区別しない
+    items = [(1, "剣", 1, "pvp_atk", 5, ""), (2, "盾", 2, "PVP_def", 5, ""), (3, "靴", 1, "pvpXspd", 5, ""),
+             (4, "薬", 1, "pve_heal", 20, ""), (5, "石", 1, None, None, "")]
+    master = MasterData(items, [], [], like_ignores_case=ignore_case)
+    assert [r[0] for r in master.items_by_type("pvp_")] == expected
+    assert not master.effect_type_matches(None, "")
+
+
+def test_items_by_type_matches_sqlite_like(db):
+    conn = sqlite3.connect(":memory:")
+    try:
+        conn.execute("CREATE TABLE items (item_id, item_name, rarity, effect_type)")
+        conn.executemany("INSERT INTO items VALUES (?, ?, ?, ?)", [r[:4] for r in db.master_data.items])
+        for prefix in ("pvp_", "pve_", "PVE_", "pvp_a", "", "x"):
+            expected = conn.execute(
+                "SELECT item_id, item_name, rarity FROM items WHERE effect_type LIKE ? ORDER BY item_id", (f"{prefix}%",)
+            ).fetchall()
+            assert db.get_items_by_type(prefix) == expected
+    finally:
+        conn.close()
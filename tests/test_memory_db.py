@@ -0,0 +1,107 @@
+# tests/test_memory_db.py
+"""MemoryDBManager.transaction() の undo log が、テーブルを丸ごとコピーして戻す実装と同じ結果になること。"""
+import copy
+import random
+from contextlib import contextmanager
+
+import pytest
+
+from memory_db import MemoryDBManager
+
+
+class _SnapshotDB(MemoryDBManager):
+    """比較用: トランザクションの開始時に全テーブルを deepcopy し、例外が出たらそれに戻す。"""
+
+    def __init__(self):
+        super().__init__()
+        self._snapshots = []  # _tx_stack は空のままなので _touch は何も記録しない
+
+    @contextmanager
+    def transaction(self):
+        self._snapshots.append(copy.deepcopy(self._tables()))
+        try:
+            yield self
+        except BaseException:
+            (self._players, self._player_id_by_name, self._player_items, self._player_skills,
+             self._pve_logs, self._pvp_battles, self._pvp_results, self._seq) = self._snapshots.pop()
+            self._leaderboard = None
+            raise
+        self._snapshots.pop()
+
+
+class _Boom(Exception):
+    pass
+
+
+def _write(db, rng):
+    # 書き込みメソッドを1つランダムに呼ぶ（存在しないプレイヤーID 99 も混ぜる）
+    pid = rng.choice([r[0] for r in db.get_ranking()] + [1, 99])
+    k = rng.randrange(17)
+    if k == 0:
+        db.get_or_create_player(f"P{rng.randrange(12)}")
+    elif k == 1:
+        db.update_player_status(pid, rng.randrange(100), rng.randrange(50), rng.randrange(500))
+    elif k == 2:
+        db.register_pvp_result(rng.choice([None, 1, 2]), pid, rng.randrange(50))
+    elif k == 3:
+        db.add_item(pid, rng.randrange(1, 5))
+    elif k == 4:
+        db.consume_item(pid, rng.randrange(1, 5))
+    elif k == 5:
+        try:
+            db.learn_skill(pid, rng.randrange(1, 4))
+        except ValueError:
+            pass
+    elif k == 6:
+        db.log_pve(pid, "スライム", rng.random() < 0.5)
+    elif k == 7:
+        db.create_pvp_battle(pid)
+    elif k == 8:
+        db.apply_area_damage(pid, rng.randrange(30), {}, ("毒", 3) if rng.random() < 0.5 else None)
+    elif k == 9:
+        db.full_recover_all_players(100)
+    elif k == 10 and rng.random() < 0.1:
+        db.reset_points()
+    elif k == 11 and rng.random() < 0.05:
+        db.reset_all_game_data()
+    elif k == 12:
+        db.update_players_battle_state([(rng.randrange(90), 3, None, 0, pid)])
+    elif k == 13:
+        db.settle_pvp_battle(1, {pid: 5}, {pid: 7})
+    elif k == 14:
+        db.damage_player_hp(pid, 3)
+    elif k == 15:
+        db.update_bounty(pid, rng.randrange(9))
+    elif k == 16:
+        db.set_player_effect(pid, "隠密", 2)
+
+
+def _play(db, seed):
+    rng = random.Random(seed)
+
+    def block(depth):
+        for _ in range(rng.randrange(6)):
+            if depth < 4 and rng.random() < 0.3:
+                try:
+                    with db.transaction():
+                        block(depth + 1)
+                        if rng.random() < 0.4:
+                            raise _Boom
+                except _Boom:
+                    pass
+            else:
+                _write(db, rng)
+
+    for _ in range(30):
+        block(0)
+    return (
+        db._players, db._player_id_by_name,
+        {k: v for k, v in db._player_items.items() if v}, {k: v for k, v in db._player_skills.items() if v},
+        db._pve_logs, db._pvp_battles, db._pvp_results, db._seq,
+        db.get_ranking(), db.leaderboard.top_k(100),
+    )
+
+
+@pytest.mark.parametrize("seed", range(100))
+def test_undo_log_matches_snapshot_rollback(seed):
+    assert _play(MemoryDBManager(), seed) == _play(_SnapshotDB(), seed)
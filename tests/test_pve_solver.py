@@ -0,0 +1,84 @@
+# tests/test_pve_solver.py
+"""PvESolver の勝率を、枝刈り無しの全探索と比べる。状態数の上限で打ち切った時の動きも確認する。"""
+from functools import lru_cache
+
+import pytest
+
+from pve_solver import BLESS_REGEN, POISON_DAMAGE, PvESolver, _SKIP_EFFECTS
+
+# (skill_id, 名前, MP, 威力, 説明, 全体) = get_player_skills() の行
+SKILLS = [
+    (1, "全力斬り", 5, 200, "", 0),
+    (2, "ヒール", 10, 0, "", 0),
+    (4, "ブリザード", 10, 100, "", 0),
+    (5, "ポイズン", 8, 50, "", 0),
+]
+
+
+def _brute_force(solver):
+    """_sure_win / _hopeless の枝刈りをせず、すべての行動と結果を展開した勝率。"""
+
+    @lru_cache(maxsize=None)
+    def value(hp, mp, m_hp, eff, eff_turn):
+        if solver.bless:
+            hp = min(solver.max_hp, hp + BLESS_REGEN)
+        best = 0.0
+        for _, cost, outcomes in solver._actions:
+            if mp < cost:
+                continue
+            v = 0.0
+            for p, dmg, gain, new_eff, new_turn in outcomes:
+                rest = m_hp - dmg
+                if rest <= 0:
+                    v += p
+                    continue
+                e, t = (new_eff, new_turn) if new_eff else (eff, eff_turn)
+                skip = e in _SKIP_EFFECTS
+                if e == "毒":
+                    rest -= POISON_DAMAGE
+                if t > 0:
+                    t -= 1
+                    if t == 0:
+                        e = None
+                if rest <= 0:
+                    v += p
+                    continue
+                next_hp = hp + gain - (0 if skip else solver.monster_attack)
+                if next_hp > 0:
+                    v += p * value(next_hp, mp - cost, rest, e, t)
+            best = max(best, v)
+        return best
+
+    return value
+
+
+@pytest.mark.parametrize("level, monster, bless", [
+    (1, ("スライム", 30, 10, 10, 10), False),
+    (2, ("ゴブリン", 50, 15, 50, 20), False),
+    (2, ("ゴブリン", 50, 15, 50, 20), True),
+    (3, ("ドラゴン", 150, 30, 100, 50), True),
+])
+def test_win_rate_matches_brute_force(level, monster, bless):
+    solver = PvESolver(level, SKILLS, monster, bless=bless)
+    brute = _brute_force(solver)
+    hp, mp = solver.max_hp, 50
+    for start_hp in (hp, hp // 2, 20):
+        for start_mp in (mp, 10, 0):
+            assert solver.win_rate(start_hp, start_mp, monster[1]) == pytest.approx(
+                brute(start_hp, start_mp, monster[1], None, 0), abs=1e-9)
+
+
+def test_state_limit_resumes_where_it_stopped():
+    monster = ("ドラゴン", 150, 30, 100, 50)
+    expected = PvESolver(3, SKILLS, monster).solve(130, 50, 150)
+
+    solver = PvESolver(3, SKILLS, monster)
+    results = []
+    for _ in range(1000):
+        results.append(solver.solve(130, 50, 150, max_states=50))
+        if results[-1] is not None:
+            break
+    assert results[0] is None
+    assert results[-1] == expected
+    # 打ち切られた後も、上限無しの呼び出しは普通に解ける
+    assert solver.solve(100, 20, 150) == PvESolver(3, SKILLS, monster).solve(100, 20, 150)
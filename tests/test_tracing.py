@@ -0,0 +1,26 @@
+# tests/test_tracing.py
+"""tracing.span_iter がループ全体を1つのスパンとして記録すること。"""
+import tracing
+
+
+def test_span_iter_records_the_loop_once_and_closes_on_break():
+    items = [1, 2, 3]
+    assert tracing.span_iter(items, "off") is items  # 記録していなければそのまま
+
+    tracer = tracing.start()
+    try:
+        seen = []
+        for x in tracing.span_iter(items, "Turn 1", args={"living": 3}):
+            with tracing.span("action"):
+                seen.append(x)
+            if x == 2:
+                break
+    finally:
+        tracing.stop()
+
+    assert seen == [1, 2]
+    (turn,) = [e for e in tracer.events if e["name"] == "Turn 1"]
+    actions = [e for e in tracer.events if e["name"] == "action"]
+    assert turn["args"] == {"living": 3} and len(actions) == 2
+    # 行動のスパンはターンのスパンの中に収まる
+    assert all(turn["ts"] <= a["ts"] and a["ts"] + a["dur"] <= turn["ts"] + turn["dur"] for a in actions)
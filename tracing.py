@@ -0,0 +1,144 @@
+# tracing.py
+"""
+処理時間の内訳を Chrome の trace-event 形式(JSON)で書き出すスパントレーサー。
+- with span("名前"): で囲んだ区間を1つのスパンとして記録する（入れ子にすると親子で表示される）
+- start() してから stop() するまでの1ゲーム分を、write() で chrome://tracing や Perfetto で開けるファイルにする
+- 無効の時の span() は何もしない共通のオブジェクトを返すだけ（呼び出し1回ぶんのコストしかかからない）
+"""
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+
+_active = None
+_game_numbers = itertools.count(1)
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("_tracer", "_name", "_cat", "_args", "_start")
+
+    def __init__(self, tracer, name, cat, args):
+        self._tracer = tracer
+        self._name = name
+        self._cat = cat
+        self._args = args
+        self._start = 0
+
+    def __enter__(self):
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        args = self._args
+        if exc_type is not None:
+            args = {**(args or {}), "error": exc_type.__name__}
+        self._tracer.add(self._name, self._cat, self._start, end, args)
+        return False
+
+
+class Tracer:
+    def __init__(self):
+        self.events = []
+        self._origin = time.perf_counter_ns()
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def span(self, name, cat="game", args=None):
+        return _Span(self, name, cat, args)
+
+    def add(self, name, cat, start_ns, end_ns, args=None):
+        # "X" = 開始時刻と長さを持つイベント（単位はマイクロ秒）
+        event = {
+            "name": name, "cat": cat, "ph": "X",
+            "ts": (start_ns - self._origin) / 1000, "dur": (end_ns - start_ns) / 1000,
+            "pid": self._pid, "tid": threading.get_ident(),
+        }
+        if args:
+            event["args"] = args
+        with self._lock:
+            self.events.append(event)
+
+    def write(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+        return path
+
+
+def start():
+    """記録を始め、記録先の Tracer を返す。"""
+    global _active
+    _active = Tracer()
+    return _active
+
+
+def stop():
+    """記録を止め、それまで記録していた Tracer を返す（記録していなければ None）。"""
+    global _active
+    tracer, _active = _active, None
+    return tracer
+
+
+def active():
+    return _active
+
+
+def span(name, cat="game", args=None):
+    """with span("PvP Turn 1"): の区間を記録する（記録していなければ何もしない）。"""
+    tracer = _active
+    if tracer is None:
+        return _NULL_SPAN
+    return tracer.span(name, cat, args)
+
+
+def span_iter(iterable, name, cat="game", args=None):
+    """
+    for x in span_iter(items, "PvP Turn 1"): のループ全体を1つのスパンとして記録する（ループ本体を with で字下げせずに済む）。
+    break で抜けた時も、その時点でスパンを閉じる。記録していなければ iterable をそのまま返す。
+    """
+    tracer = _active
+    if tracer is None:
+        return iterable
+    return _iter_in_span(tracer, iterable, name, cat, args)
+
+
+def _iter_in_span(tracer, iterable, name, cat, args):
+    start = time.perf_counter_ns()
+    try:
+        yield from iterable
+    finally:
+        tracer.add(name, cat, start, time.perf_counter_ns(), args)
+
+
+def caller_span(cat):
+    """呼び出したメソッド（contextmanager の内側なら、その利用元）の名前でスパンを作る。DBManager._cursor 用。"""
+    tracer = _active
+    if tracer is None:
+        return _NULL_SPAN
+    frame = sys._getframe(1)
+    while frame is not None and (frame.f_code.co_name in ("_cursor", "__enter__")
+                                 or frame.f_code.co_filename == __file__):
+        frame = frame.f_back
+    return tracer.span(frame.f_code.co_name if frame is not None else "?", cat)
+
+
+def trace_path(trace_dir, session_id=None):
+    """1ゲーム分のトレースを書き出すファイル名（プロセスやセッションが違っても重ならない）。"""
+    stamp = time.strftime("%Y%m%d_%H%M%S")
+    return os.path.join(trace_dir, f"trace_{session_id or 'default'}_{stamp}_{os.getpid()}_{next(_game_numbers)}.json")
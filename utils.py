@@ -1,5 +1,38 @@
 import sys
-from db_manager import DBManager
+from db_manager import get_shared_db
+
+_game_db = None  # 'exit' で初期化するDB（main が設定する。未設定なら共有DB）
+_input_provider = None  # prompt -> 入力文字列。None なら標準入力(input)
+
+def set_input_provider(provider):
+    """
+    入力の取り方を差し替える（None で標準入力に戻す）。
+    provider(prompt) は文字列を返す。EOFError を送出するとゲーム終了扱いになる。
+    """
+    global _input_provider
+    _input_provider = provider
+
+class ScriptedInput:
+    """
+    決めておいた入力を順に返す provider。
+    使い切ったら policy(prompt) の結果を返す（policy が無ければ EOFError = ゲーム終了）。
+    """
+    def __init__(self, answers=(), policy=None):
+        self._answers = iter(answers)
+        self._policy = policy
+
+    def __call__(self, prompt):
+        answer = next(self._answers, None)
+        if answer is not None:
+            return str(answer)
+        if self._policy is None:
+            raise EOFError
+        return str(self._policy(prompt))
+
+def bind_game_db(db):
+    """'exit' 入力時に初期化するDBManager（セッション）を設定する。"""
+    global _game_db
+    _game_db = db
 
 def safe_input(prompt):
     """
@@ -7,7 +40,7 @@ def safe_input(prompt):
     それ以外の場合は入力値を返す。
     """
     try:
-        val = input(prompt)
+        val = _input_provider(prompt) if _input_provider is not None else input(prompt)
     except EOFError:
         # Ctrl+D などの場合も終了扱いにする
         print("\nゲームを終了します。")
@@ -22,7 +55,8 @@ def _reset_and_exit():
     """データを初期化して終了する"""
     print("🔄 ゲームデータを初期化中...")
     try:
-        db = DBManager()
+        # 起動時に作ったDBManager（とプールのコネクション）を使い回す
+        db = _game_db if _game_db is not None else get_shared_db()
         db.reset_all_game_data()
         print("✅ 初期化完了")
     except Exception as e: